@@ -0,0 +1,120 @@
+﻿"""
+Write-behind node persistence for this app.
+
+cyberguard-platform/backend/write_behind.py is the same design for the
+CyberGuard backend. The two are kept as separate copies on purpose: each app
+is its own deployable with its own import root and Docker build context
+(this image copies only backend/, that one only cyberguard-platform/backend/),
+so neither can import the other's module. Fixes to the flush, coalescing or
+requeue logic belong in both files.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+
+class NodeWriteBehind:
+    """
+    Collects node documents from the event loop and upserts them from a worker
+    thread with one unordered bulk_write per flush. Repeated writes to the same
+    node id coalesce while they wait; a failed flush is retried with backoff.
+    """
+
+    def __init__(self, collection: Callable[[], Any], interval_sec: float = 1.0, max_batch: int = 1000):
+        self._collection = collection
+        self.interval_sec = interval_sec
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        # node id -> (latest document, time first queued)
+        self._pending: Dict[str, Tuple[dict, float]] = {}
+        self.counters = {"queued": 0, "coalesced": 0, "written": 0, "flushes": 0, "errors": 0}
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="mongo-write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def put(self, doc: dict):
+        now = time.monotonic()
+        with self._lock:
+            queued = self._pending.get(doc["id"])
+            self._pending[doc["id"]] = (doc, now if queued is None else queued[1])
+            self.counters["queued"] += 1
+            if queued is not None:
+                self.counters["coalesced"] += 1
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            self._wake.wait(self.interval_sec + backoff)
+            self._wake.clear()
+            stopping = self._stopping
+            backoff = 0.0 if self.flush() else min(30.0, max(self.interval_sec, backoff * 2))
+            if stopping:
+                return
+
+    def flush(self) -> bool:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return True
+        items = list(batch.items())
+        for start in range(0, len(items), self.max_batch):
+            chunk = items[start:start + self.max_batch]
+            try:
+                self._collection().bulk_write(
+                    [UpdateOne({"id": node_id}, {"$set": doc}, upsert=True) for node_id, (doc, _) in chunk],
+                    ordered=False,
+                )
+            except Exception:
+                self._requeue(items[start:])
+                with self._lock:
+                    self.counters["errors"] += 1
+                return False
+            lag = time.monotonic() - min(queued_at for _, (_, queued_at) in chunk)
+            with self._lock:
+                self.counters["flushes"] += 1
+                self.counters["written"] += len(chunk)
+                self.last_flush_size = len(chunk)
+                self.max_flush_size = max(self.max_flush_size, len(chunk))
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+        return True
+
+    def _requeue(self, items: Iterable[Tuple[str, Tuple[dict, float]]]):
+        with self._lock:
+            for node_id, (doc, queued_at) in items:
+                newer = self._pending.get(node_id)
+                self._pending[node_id] = (doc, queued_at) if newer is None else (newer[0], queued_at)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "pending": len(self._pending),
+                "last_flush_size": self.last_flush_size,
+                "max_flush_size": self.max_flush_size,
+                # oldest document of a flush, queued to written
+                "last_lag_sec": round(self.last_lag, 3),
+                "max_lag_sec": round(self.max_lag, 3),
+            }
\ No newline at end of file
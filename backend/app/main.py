@@ -6,7 +6,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from .utils.config import settings
 from .db.mongo import get_db
-from .utils.ws import WebSocketManager
+from .db.write_behind import NodeWriteBehind
+from .utils.ws import ENCODERS, WebSocketManager
 from .utils.audit import event_hash
 from .models.schemas import Node, SecurityEvent
 from .sim.simulator import NodeSimulator
@@ -24,7 +25,9 @@ app.add_middleware(
 )
 
 ws_manager = WebSocketManager()
-sim = NodeSimulator(["1", "2", "3", "4", "5"])
+sim = NodeSimulator(["1", "2", "3", "4", "5"], seed=settings.SIM_SEED)
+# Node status is upserted in bulk from a worker thread, off the event loop
+node_writer = NodeWriteBehind(lambda: get_db().nodes, interval_sec=settings.MONGO_FLUSH_INTERVAL_SEC)
 
 
 @app.on_event("startup")
@@ -41,12 +44,9 @@ async def startup():
     agent = build_graph()
 
     async def on_metrics(n: Node):
-        # Persist node status
-        try:
-            if getattr(app.state, 'db_ready', False):
-                db.nodes.update_one({"id": n.id}, {"$set": n.dict()}, upsert=True)
-        except Exception:
-            app.state.db_ready = False
+        # Persist node status (queued; the write-behind worker flushes it)
+        if getattr(app.state, 'db_ready', False):
+            node_writer.put(n.dict())
         await ws_manager.broadcast("node_update", n.dict())
         # Run agent pipeline (LangGraph)
         state: SecurityState = {"node": n}
@@ -100,9 +100,20 @@ async def startup():
             await ws_manager.broadcast("security_event", evt.dict())
 
     # kick off simulator
+    node_writer.start()
     asyncio.create_task(sim.run(on_metrics))
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await asyncio.to_thread(node_writer.stop)
+
+
+@app.get("/api/persistence/stats")
+def persistence_stats():
+    return node_writer.stats()
+
+
 @app.get("/api/nodes")
 def list_nodes():
     db = get_db()
@@ -158,7 +169,11 @@ def release(node_id: str):
 
 @app.websocket(settings.WS_PATH)
 async def ws_endpoint(ws: WebSocket):
-    await ws_manager.connect(ws)
+    encoding = ws.query_params.get("encoding", "json")
+    if encoding not in ENCODERS:
+        await ws.close(code=1008)
+        return
+    await ws_manager.connect(ws, encoding=encoding)
     try:
         while True:
             await ws.receive_text()  # ping-pong no-op
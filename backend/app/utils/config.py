@@ -11,5 +11,7 @@ class Settings:
     GEMINI_API_KEY: str | None = os.getenv("GEMINI_API_KEY")
     BACKEND_PORT: int = int(os.getenv("BACKEND_PORT", "8000"))
     WS_PATH: str = os.getenv("WS_PATH", "/ws")
+    MONGO_FLUSH_INTERVAL_SEC: float = float(os.getenv("MONGO_FLUSH_INTERVAL_SEC", "1.0"))
+    SIM_SEED: int | None = int(os.environ["SIM_SEED"]) if os.getenv("SIM_SEED") else None
 
 settings = Settings()
\ No newline at end of file
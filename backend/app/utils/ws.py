@@ -1,30 +1,61 @@
 ﻿import asyncio
 import json
-from typing import Set
+from typing import Any, Callable, Dict, Union
 from websockets.exceptions import ConnectionClosedOK
 from starlette.websockets import WebSocket
 
+try:
+    import msgpack  # type: ignore
+except ImportError:  # pragma: no cover
+    msgpack = None  # type: ignore
+
+
+def _encode_json(message: dict) -> str:
+    return json.dumps(message, default=str)
+
+
+def _encode_msgpack(message: dict) -> bytes:
+    return msgpack.packb(message, default=str)
+
+
+# Wire formats a client can ask for with ?encoding=...; str payloads go out as
+# text frames, bytes as binary frames
+ENCODERS: Dict[str, Callable[[dict], Union[str, bytes]]] = {"json": _encode_json}
+if msgpack is not None:
+    ENCODERS["msgpack"] = _encode_msgpack
+
+
 class WebSocketManager:
     def __init__(self):
-        self.active: Set[WebSocket] = set()
+        # socket -> its encoding
+        self.active: Dict[WebSocket, str] = {}
         self._lock = asyncio.Lock()
 
-    async def connect(self, ws: WebSocket):
+    async def connect(self, ws: WebSocket, encoding: str = "json"):
+        if encoding not in ENCODERS:
+            raise ValueError(f"encoding must be one of {', '.join(ENCODERS)}")
         await ws.accept()
         async with self._lock:
-            self.active.add(ws)
+            self.active[ws] = encoding
 
     async def disconnect(self, ws: WebSocket):
         async with self._lock:
-            if ws in self.active:
-                self.active.remove(ws)
+            self.active.pop(ws, None)
 
     async def broadcast(self, event: str, data: dict):
-        message = json.dumps({"event": event, "data": data}, default=str)
+        message = {"event": event, "data": data}
+        # Encode once per encoding in use, not once per client
+        payloads: Dict[str, Any] = {}
         to_remove = []
-        for ws in list(self.active):
+        for ws, encoding in list(self.active.items()):
+            payload = payloads.get(encoding)
+            if payload is None:
+                payload = payloads[encoding] = ENCODERS[encoding](message)
             try:
-                await ws.send_text(message)
+                if isinstance(payload, str):
+                    await ws.send_text(payload)
+                else:
+                    await ws.send_bytes(payload)
             except ConnectionClosedOK:
                 to_remove.append(ws)
             except Exception:
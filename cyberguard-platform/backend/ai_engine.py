@@ -1,20 +1,22 @@
 import os
 import time
-from collections import defaultdict, deque
-from typing import Deque, Dict, List, Optional, Tuple
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 
 import models
+from node_history import CPU, MEMORY, FleetHistory, HistoryWindow
+from reasoning import FakeReasoningModel, GeminiReasoningModel, ReasoningService
+from threat_index import ThreatPatternIndex
 
 try:
     import google.generativeai as genai  # type: ignore
 except Exception:  # pragma: no cover
     genai = None  # type: ignore
 
-# Optional sklearn IsolationForest
-try:
-    from sklearn.ensemble import IsolationForest  # type: ignore
-except Exception:  # pragma: no cover
-    IsolationForest = None  # type: ignore
+# Optional sklearn IsolationForest (trained in the background by ModelManager)
+from model_manager import IsolationForest, ModelManager
 
 # Import threat dataset loader
 try:
@@ -30,9 +32,11 @@ class AIEngine:
     """
 
     def __init__(self) -> None:
-        # History per node: deque of (ts, metrics)
-        self.history: Dict[str, Deque[Tuple[float, models.NodeMetrics]]] = defaultdict(lambda: deque(maxlen=360))
-        self.last_decision_at: Dict[str, float] = defaultdict(lambda: 0.0)
+        # Per-node metric ring buffers (struct-of-arrays, last 360 samples)
+        self.history = FleetHistory(capacity=int(os.getenv("AI_HISTORY_SAMPLES", "360")))
+        self.decided_at = np.zeros(0)
+        self._fleet_ids: Optional[List[str]] = None
+        self._fleet_rows = np.zeros(0, dtype=np.int64)
 
         # Thresholds and parameters
         self.cpu_spike_threshold = float(os.getenv("AI_CPU_SPIKE_THRESHOLD", "85"))
@@ -43,6 +47,13 @@ class AIEngine:
         self.net_spike_factor = float(os.getenv("AI_NET_SPIKE_FACTOR", "3.0"))
         self.monitor_interval_sec = float(os.getenv("AI_MONITOR_INTERVAL_SEC", "5"))
         self.decision_cooldown_sec = float(os.getenv("AI_DECISION_COOLDOWN_SEC", "30"))
+        self.behavior_window_sec = 30.0
+
+        # Running aggregates per detector window, maintained on record()
+        self._cpu_win = self.history.track(self.cpu_spike_duration, self.cpu_spike_threshold)
+        self._mem_win = self.history.track(self.mem_leak_window_sec)
+        self._net_win = self.history.track(self.net_baseline_window_sec)
+        self._behavior_win = self.history.track(self.behavior_window_sec)
 
         # Optional Gemini config
         self.gemini_model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
@@ -55,8 +66,38 @@ class AIEngine:
             except Exception:
                 self.gemini = None
 
-        # Optional Isolation Forest model per node (traffic feature only for demo)
-        self.iforest: Dict[str, object] = {}
+        # LLM reasoning runs after the fact, off the analysis path.
+        # AI_REASONING_MODEL=fake swaps in a local model for tests and offline demos.
+        reasoning_model: Optional[object] = None
+        reasoning_concurrency = int(os.getenv("AI_REASONING_CONCURRENCY", "2"))
+        reasoning_timeout = float(os.getenv("AI_REASONING_TIMEOUT_SEC", "10"))
+        if os.getenv("AI_REASONING_MODEL", "").lower() == "fake":
+            reasoning_model = FakeReasoningModel()
+        elif self.gemini is not None:
+            reasoning_model = GeminiReasoningModel(self.gemini, max_workers=reasoning_concurrency, timeout_sec=reasoning_timeout)
+        self.reasoner: Optional[ReasoningService] = None
+        if reasoning_model is not None:
+            self.reasoner = ReasoningService(
+                reasoning_model,
+                max_concurrency=reasoning_concurrency,
+                timeout_sec=reasoning_timeout,
+                ttl_sec=float(os.getenv("AI_REASONING_CACHE_TTL_SEC", "600")),
+                max_batch=int(os.getenv("AI_REASONING_BATCH_SIZE", "8")),
+                batch_window_sec=float(os.getenv("AI_REASONING_BATCH_WINDOW_MS", "50")) / 1000.0,
+            )
+
+        # Optional Isolation Forest models (traffic feature), trained off the event loop
+        self.models: Optional[ModelManager] = None
+        if IsolationForest is not None:
+            self.models = ModelManager(
+                self.history,
+                self._net_win,
+                refresh_sec=float(os.getenv("AI_MODEL_REFRESH_SEC", "300")),
+                min_retrain_sec=float(os.getenv("AI_MODEL_MIN_RETRAIN_SEC", "30")),
+                max_workers=int(os.getenv("AI_MODEL_WORKERS", "1")),
+            )
+        # Latest decision_function per history row (NaN until a model scored it)
+        self.model_scores = np.empty(0)
         # Very small RL Q-table for action selection
         self.q_table: Dict[Tuple[str, str], float] = defaultdict(float)  # (severity, feature) -> value
         
@@ -65,7 +106,10 @@ class AIEngine:
         self.threat_patterns: List[Dict] = []
         self.attack_signatures: Dict[str, List[Dict]] = {}
         self.anomaly_thresholds: Dict[str, Dict[str, float]] = {}
+        self.threat_index: Optional[ThreatPatternIndex] = None
         self._load_threat_database()
+        if self.threat_patterns:
+            self.threat_index = ThreatPatternIndex(self.threat_patterns, self.attack_signatures)
 
     # ------- threat database loading -------
     def _load_threat_database(self) -> None:
@@ -91,13 +135,21 @@ class AIEngine:
                     self.threat_patterns = json.load(f)
                 with open(signatures_file, 'r') as f:
                     self.attack_signatures = json.load(f)
+                self.anomaly_thresholds = self.threat_loader.load_thresholds(cache_dir)
                 print(f"✅ Loaded {len(self.threat_patterns)} threat patterns from cache")
             else:
-                # Download and process dataset
-                df = self.threat_loader.load_dataset()
-                self.threat_patterns = self.threat_loader.extract_threat_patterns(df)
-                self.attack_signatures = self.threat_loader.get_attack_signatures(df)
-                self.anomaly_thresholds = self.threat_loader.get_anomaly_thresholds(df)
+                # Download and process dataset (in bounded-size chunks unless disabled)
+                chunksize = int(os.getenv("CYBERGUARD_DATASET_CHUNK_ROWS", "250000"))
+                if chunksize > 0:
+                    self.threat_loader.process_in_chunks(chunksize=chunksize)
+                    self.threat_patterns = self.threat_loader.threat_patterns
+                    self.attack_signatures = self.threat_loader.attack_signatures
+                    self.anomaly_thresholds = self.threat_loader.anomaly_thresholds
+                else:
+                    df = self.threat_loader.load_dataset()
+                    self.threat_patterns = self.threat_loader.extract_threat_patterns(df)
+                    self.attack_signatures = self.threat_loader.get_attack_signatures(df)
+                    self.anomaly_thresholds = self.threat_loader.get_anomaly_thresholds(df)
                 self.threat_loader.save_processed_data()
                 print(f"✅ Loaded and processed {len(self.threat_patterns)} threat patterns")
                 
@@ -106,81 +158,112 @@ class AIEngine:
             print("    Falling back to built-in heuristics")
             self.threat_loader = None
 
-    def _match_threat_pattern(self, flags: List[str], metrics: models.NodeMetrics) -> Optional[str]:
+    def _match_threat_pattern(self, flags: List[str], metrics: Optional[models.NodeMetrics]) -> Optional[str]:
         """Match current behavior against known threat patterns from dataset"""
-        if not self.threat_patterns:
+        if self.threat_index is None:
             return None
-        
-        # Simple pattern matching based on detected flags
-        flag_keywords = {
-            'cpu_spike': ['ddos', 'dos', 'stress', 'overload'],
-            'memory_leak': ['memory', 'leak', 'exhaustion', 'buffer'],
-            'net_anomaly': ['ddos', 'exfiltration', 'scan', 'probe', 'flood'],
-            'behavioral_anomaly': ['malware', 'trojan', 'anomaly']
-        }
-        
-        matched_attacks = []
-        for flag in flags:
-            keywords = flag_keywords.get(flag, [])
-            for pattern in self.threat_patterns:
-                attack_type = pattern.get('attack_type', '').lower()
-                if any(kw in attack_type for kw in keywords):
-                    matched_attacks.append(attack_type)
-        
-        if matched_attacks:
-            # Return the most common match
-            return max(set(matched_attacks), key=matched_attacks.count)
-        
-        return None
+        return self.threat_index.match(flags)
 
     def record(self, node: models.NodeStatus) -> None:
-        self.history[node.id].append((time.time(), node.metrics))
+        self.history.record(node.id, node.metrics)
+
+    def record_fleet(self, node_ids: List[str], metrics: np.ndarray, ts: Optional[float] = None) -> None:
+        """Record one sample per node from a [len(METRIC_FIELDS), len(node_ids)] matrix."""
+        if self._fleet_ids is not node_ids:
+            # History rows are resolved once per node list, not on every tick
+            self._fleet_rows = np.array([self.history.slot(n) for n in node_ids], dtype=np.int64)
+            self._fleet_ids = node_ids
+        self.history.record_rows(self._fleet_rows, time.time() if ts is None else ts, metrics)
 
-    def _window(self, node_id: str, sec: float) -> List[Tuple[float, models.NodeMetrics]]:
-        cutoff = time.time() - sec
-        return [item for item in self.history.get(node_id, []) if item[0] >= cutoff]
+    def _window(self, node_id: str, sec: float) -> Optional[HistoryWindow]:
+        return self.history.window(node_id, sec)
 
     # ------- detectors -------
+    # Each detector works on an array of history rows: it evicts samples that
+    # aged out of its window, then reads the window's running counts and sums,
+    # so a check is O(1) per node and a whole fleet is a handful of array ops.
+    FLAG_NAMES = ("cpu_spike", "memory_leak", "net_anomaly", "behavioral_anomaly")
+
+    def _rows(self, node_id: str) -> Optional[np.ndarray]:
+        row = self.history.slots.get(node_id)
+        return None if row is None else np.array([row])
+
+    def _cpu_spike_rows(self, rows: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        w = self._cpu_win
+        w.evict(now, rows=rows)
+        n = w.count[rows]
+        enough = n >= max(2, int(self.cpu_spike_duration // 2))
+        return enough & (w.cpu_over[rows] >= np.maximum(2, (0.8 * n).astype(np.int64)))
+
+    def _memory_leak_rows(self, rows: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        w = self._mem_win
+        w.evict(now, rows=rows)
+        n = w.count[rows]
+        first = w.first(MEMORY, rows).astype(np.float64)
+        delta = self.history.latest_values(MEMORY, rows) - first
+        # percent relative to start
+        pct = (delta / np.maximum(1e-6, first)) * 100.0
+        rising = w.mem_increases[rows] >= (0.7 * (n - 1)).astype(np.int64)
+        return (n >= 5) & rising & (pct >= self.mem_leak_delta_pct)
+
+    def _net_anomaly_rows(self, rows: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        w = self._net_win
+        w.evict(now, rows=rows)
+        n = w.count[rows]
+        current = self.history.traffic(rows, self.history.written[rows] - 1)
+        baseline = (w.traffic_sum[rows] - current) / np.maximum(1, n - 1)
+        spike = current > np.maximum(1.0, baseline * self.net_spike_factor)
+        # IsolationForest fallback, scored for the whole fleet in refresh_models()
+        scores = self.model_scores
+        if scores.size:
+            scored = rows < scores.size
+            outlier = np.zeros(rows.size, dtype=bool)
+            outlier[scored] = scores[rows[scored]] < -0.1  # higher = normal; NaN compares False
+            spike |= outlier
+        return (n >= 5) & spike
+
+    def _cpu_surprise_rows(self, rows: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        """Basic LSTM-like: predict next cpu by EMA and flag if surprise is large"""
+        w = self._behavior_win
+        w.evict(now, rows=rows)
+        current = self.history.latest_values(CPU, rows)
+        return (w.count[rows] >= 5) & (np.abs(current - self.history.cpu_ema[rows]) > 25.0)
+
+    def _detect(self, rows: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        """Boolean [len(FLAG_NAMES), len(rows)] matrix of detector hits."""
+        return np.vstack([
+            self._cpu_spike_rows(rows, now),
+            self._memory_leak_rows(rows, now),
+            self._net_anomaly_rows(rows, now),
+            self._cpu_surprise_rows(rows, now),
+        ])
+
     def _cpu_spike(self, node_id: str) -> bool:
-        win = self._window(node_id, self.cpu_spike_duration)
-        if len(win) < max(2, int(self.cpu_spike_duration // 2)):
-            return False
-        over = [m.cpu for (_, m) in win if m.cpu >= self.cpu_spike_threshold]
-        return len(over) >= max(2, int(0.8 * len(win)))
+        rows = self._rows(node_id)
+        return rows is not None and bool(self._cpu_spike_rows(rows)[0])
 
     def _memory_leak(self, node_id: str) -> bool:
-        win = self._window(node_id, self.mem_leak_window_sec)
-        if len(win) < 5:
-            return False
-        mems = [m.memory for (_, m) in win]
-        increases = sum(1 for i in range(1, len(mems)) if mems[i] > mems[i - 1])
-        delta = (mems[-1] - mems[0])
-        # percent relative to start
-        pct = (delta / max(1e-6, mems[0])) * 100.0
-        return increases >= int(0.7 * (len(mems) - 1)) and pct >= self.mem_leak_delta_pct
+        rows = self._rows(node_id)
+        return rows is not None and bool(self._memory_leak_rows(rows)[0])
 
     def _net_anomaly(self, node_id: str) -> bool:
-        win = self._window(node_id, self.net_baseline_window_sec)
-        if len(win) < 5:
-            return False
-        traf = [m.network_in + m.network_out for (_, m) in win]
-        baseline = sum(traf[:-1]) / max(1, len(traf) - 1)
-        current = traf[-1]
-        spike = current > max(1.0, baseline * self.net_spike_factor)
-        # IsolationForest fallback on traffic sequence (if available)
-        if IsolationForest is not None and len(traf) >= 10:
-            try:
-                xs = [[x] for x in traf[-50:]]
-                model = self.iforest.get(node_id)
-                if model is None:
-                    model = IsolationForest(n_estimators=50, contamination=0.1, random_state=0)
-                    model.fit(xs)
-                    self.iforest[node_id] = model
-                score = model.decision_function([[current]])[0]  # higher = normal
-                spike = spike or (score < -0.1)
-            except Exception:
-                pass
-        return spike
+        rows = self._rows(node_id)
+        return rows is not None and bool(self._net_anomaly_rows(rows)[0])
+
+    def _cpu_surprise(self, node_id: str) -> bool:
+        rows = self._rows(node_id)
+        return rows is not None and bool(self._cpu_surprise_rows(rows)[0])
+
+    def refresh_models(self) -> None:
+        """Once per monitor tick: start due retraining and score every node in one batch."""
+        if self.models is None:
+            return
+        self._net_win.evict()
+        try:
+            self.models.maybe_refresh()
+            self.model_scores = self.models.score()
+        except Exception:
+            self.model_scores = np.empty(0)
 
     # ------- analysis and decisions -------
     def _classify(self, flags: List[str]) -> str:
@@ -214,29 +297,41 @@ class AIEngine:
         actions.sort(key=lambda a: -sum(self.q_table.get((severity, f), 0.0) for f in flags))
         return actions
 
-    def _gemini_reason(self, node_id: str, flags: List[str], severity: str) -> Optional[str]:
-        if not self.gemini:
-            # Use threat pattern matching as fallback
-            matched_threat = self._match_threat_pattern(flags, self.history[node_id][-1][1] if self.history[node_id] else None)
-            if matched_threat:
-                return f"Detected pattern matching '{matched_threat}' attack. Flags: {', '.join(flags)}. Severity: {severity.upper()}."
+    def _prompt(self, flags: List[str], severity: str, matched_threat: Optional[str]) -> str:
+        # Enhanced prompt with threat database context. The node id is left out
+        # so one answer can be cached for every node with the same findings.
+        threat_context = ""
+        if self.threat_patterns:
+            threat_context = f" Known threat patterns in database: {len(self.threat_patterns)} types."
+        if matched_threat:
+            threat_context += f" Closest known pattern: '{matched_threat}'."
+        return (
+            "You are a SOC assistant. Given detected anomalies "
+            f"{flags} on a node with severity {severity}.{threat_context} "
+            "Explain briefly (one sentence) the most likely cause and next step."
+        )
+
+    def _heuristic_reason(self, flags: List[str], severity: str, matched_threat: Optional[str]) -> str:
+        if matched_threat:
+            return f"Detected pattern matching '{matched_threat}' attack. Flags: {', '.join(flags)}. Severity: {severity.upper()}."
+        return f"Detected {', '.join(flags)}; classified as {severity.upper()}"
+
+    async def enrich(self, result: models.AIAnalysisResult) -> Optional[models.AIAnalysisResult]:
+        """
+        Ask the reasoning model about a decision that was already published with
+        heuristic reasoning. Returns an updated copy, or None when there is no
+        model, the text was already cached into the decision, or the call failed.
+        """
+        if self.reasoner is None or not result.anomalies:
             return None
-        try:
-            # Enhanced prompt with threat database context
-            threat_context = ""
-            if self.threat_patterns:
-                threat_context = f" Known threat patterns in database: {len(self.threat_patterns)} types."
-            
-            prompt = (
-                "You are a SOC assistant. Given detected anomalies "
-                f"{flags} on node {node_id} with severity {severity}.{threat_context} "
-                "Explain briefly (one sentence) the most likely cause and next step."
-            )
-            res = self.gemini.generate_content(prompt)  # type: ignore[attr-defined]
-            text = getattr(res, "text", None) or (getattr(res, "candidates", [None])[0].content.parts[0].text if getattr(res, "candidates", None) else None)  # type: ignore[index]
-            return text.strip() if isinstance(text, str) else None
-        except Exception:
+        matched_threat = self._match_threat_pattern(result.anomalies, None)
+        key = self.reasoner.key(result.anomalies, result.severity, matched_threat)
+        if self.reasoner.cached(key) == result.reasoning:
             return None
+        text = await self.reasoner.reason(key, self._prompt(result.anomalies, result.severity, matched_threat))
+        if not text or text == result.reasoning:
+            return None
+        return result.model_copy(update={"reasoning": text})
 
     def analyze_node(self, node: models.NodeStatus) -> Optional[models.AIAnalysisResult]:
         flags: List[str] = []
@@ -246,43 +341,81 @@ class AIEngine:
             flags.append("memory_leak")
         if self._net_anomaly(node.id):
             flags.append("net_anomaly")
-        # Basic LSTM-like: predict next cpu by EMA and flag if surprise is large
-        win = self._window(node.id, 30)
-        if len(win) >= 5:
-            alpha = 0.5
-            pred = win[0][1].cpu
-            for (_, m) in win[1:]:
-                pred = alpha * m.cpu + (1 - alpha) * pred
-            if abs(win[-1][1].cpu - pred) > 25.0:
-                flags.append("behavioral_anomaly")
+        if self._cpu_surprise(node.id):
+            flags.append("behavioral_anomaly")
+        return self._result(node.id, flags, node.metrics)
+
+    def _result(
+        self,
+        node_id: str,
+        flags: List[str],
+        metrics: Optional[models.NodeMetrics],
+        now: Optional[float] = None,
+    ) -> Optional[models.AIAnalysisResult]:
         severity = self._classify(flags)
         if severity == "low" and not flags:
             return None
         
         # Match against known threat patterns
-        matched_threat = self._match_threat_pattern(flags, node.metrics)
+        matched_threat = self._match_threat_pattern(flags, metrics)
         
-        reasoning = self._gemini_reason(node.id, flags, severity) or (
-            f"Detected {', '.join(flags)}; classified as {severity.upper()}" +
-            (f"; matches '{matched_threat}' pattern" if matched_threat else "")
-        )
+        # Never wait on the LLM here: use a cached answer if there is one and
+        # leave the rest to enrich()
+        reasoning = None
+        if self.reasoner is not None:
+            reasoning = self.reasoner.cached(self.reasoner.key(flags, severity, matched_threat))
+        if reasoning is None:
+            reasoning = self._heuristic_reason(flags, severity, matched_threat)
         # Confidence heuristic
         confidence = min(0.99, 0.6 + 0.1 * len(flags))
         return models.AIAnalysisResult(
-            node_id=node.id,
+            node_id=node_id,
             severity=severity,  # type: ignore[arg-type]
             anomalies=flags,
             actions=self._recommend(severity, flags),
             reasoning=reasoning,
-            timestamp=time.time(),
+            timestamp=time.time() if now is None else now,
             confidence=confidence,
         )
 
+    def _decided_at_rows(self) -> np.ndarray:
+        """Time of the last decision per history row (grown along with the history)."""
+        rows = self.history.ts.shape[0]
+        if self.decided_at.size < rows:
+            self.decided_at = np.concatenate([self.decided_at, np.zeros(rows - self.decided_at.size)])
+        return self.decided_at
+
     def maybe_analyze(self, node: models.NodeStatus) -> Optional[models.AIAnalysisResult]:
         now = time.time()
-        if now - self.last_decision_at[node.id] < self.decision_cooldown_sec:
+        row = self.history.slots.get(node.id)
+        decided_at = self._decided_at_rows()
+        if row is not None and now - decided_at[row] < self.decision_cooldown_sec:
             return None
         res = self.analyze_node(node)
-        if res is not None:
-            self.last_decision_at[node.id] = now
+        if res is not None and row is not None:
+            decided_at[row] = now
         return res
+
+    def analyze_fleet(self, now: Optional[float] = None) -> List[models.AIAnalysisResult]:
+        """
+        Run every detector for every recorded node at once and return results
+        only for nodes with findings that are out of their decision cooldown.
+        Python-level work is proportional to the number of findings.
+        """
+        now = time.time() if now is None else now
+        decided_at = self._decided_at_rows()
+        rows = np.arange(len(self.history))
+        rows = rows[now - decided_at[rows] >= self.decision_cooldown_sec]
+        if rows.size == 0:
+            return []
+        hits = self._detect(rows, now)
+        found = np.flatnonzero(hits.any(axis=0))
+        results: List[models.AIAnalysisResult] = []
+        for i in found:
+            node_id = self.history.ids[rows[i]]
+            flags = [name for name, hit in zip(self.FLAG_NAMES, hits[:, i]) if hit]
+            res = self._result(node_id, flags, self.history.latest(node_id), now)
+            if res is not None:
+                decided_at[rows[i]] = now
+                results.append(res)
+        return results
@@ -5,7 +5,8 @@ Downloads and processes the Kaggle dataset for threat pattern analysis
 import os
 import json
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Any
 import pandas as pd
 
 try:
@@ -13,6 +14,205 @@ try:
 except ImportError:
     kagglehub = None  # type: ignore
 
+try:
+    from dataset_store import DatasetStore  # type: ignore
+except ImportError:  # pragma: no cover
+    DatasetStore = None  # type: ignore
+
+from sketches import QuantileSketch, RunningMoments
+
+
+def _attack_column(columns: List[str]) -> Optional[str]:
+    for name in ('threat_label', 'attack_type', 'Attack Type'):
+        if name in columns:
+            return name
+    return None
+
+
+class AnomalyThresholdSketch:
+    """
+    Per-column moments and KLL quantile sketches behind the anomaly thresholds.
+    
+    Mergeable across chunks and processes and small enough to persist with the
+    processed data, so thresholds load instantly and can be updated as new
+    logs arrive instead of re-sorting every column.
+    """
+
+    def __init__(self, sketch_k: int = 200):
+        self.sketch_k = sketch_k
+        self.columns: List[str] = []
+        self.moments: Dict[str, RunningMoments] = {}
+        self.sketches: Dict[str, QuantileSketch] = {}
+
+    def update(self, df: pd.DataFrame) -> None:
+        for col in df.select_dtypes(include=['number']).columns:
+            if col not in self.columns:
+                self.columns.append(col)
+            values = df[col].to_numpy(dtype='float64', na_value=float('nan'))
+            self.moments.setdefault(col, RunningMoments()).update(values)
+            self.sketches.setdefault(col, QuantileSketch(k=self.sketch_k)).update(values)
+
+    def merge(self, other: "AnomalyThresholdSketch") -> "AnomalyThresholdSketch":
+        for col in other.columns:
+            if col not in self.columns:
+                self.columns.append(col)
+            self.moments.setdefault(col, RunningMoments()).merge(other.moments[col])
+            self.sketches.setdefault(col, QuantileSketch(k=self.sketch_k)).merge(other.sketches[col])
+        return self
+
+    def thresholds(self) -> Dict[str, Dict[str, float]]:
+        thresholds = {}
+        for col in self.columns:
+            m = self.moments[col]
+            if m.count == 0:
+                continue
+            sketch = self.sketches[col]
+            std = m.std()
+            thresholds[col] = {
+                'mean': float(m.mean),
+                'std': float(std),
+                'p95': float(sketch.quantile(0.95)),
+                'p99': float(sketch.quantile(0.99)),
+                'upper_bound': float(m.mean + 3 * std),
+                'lower_bound': float(m.mean - 3 * std)
+            }
+        return thresholds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'sketch_k': self.sketch_k,
+            'columns': {
+                col: {'moments': self.moments[col].to_dict(), 'sketch': self.sketches[col].to_dict()}
+                for col in self.columns
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnomalyThresholdSketch":
+        sk = cls(sketch_k=int(data.get('sketch_k', 200)))
+        for col, state in data.get('columns', {}).items():
+            sk.columns.append(col)
+            sk.moments[col] = RunningMoments.from_dict(state['moments'])
+            sk.sketches[col] = QuantileSketch.from_dict(state['sketch'])
+        return sk
+
+
+class ThreatProfileAccumulator:
+    """
+    Chunk-by-chunk equivalent of the in-memory pattern, signature, threshold
+    and summary extraction. Per-group moments are merged exactly; medians and
+    percentiles come from KLL sketches, so memory stays bounded by the number
+    of attack types and numeric columns rather than by the number of rows.
+    """
+
+    def __init__(self, signature_samples: int = 10, sketch_k: int = 200):
+        self.signature_samples = signature_samples
+        self.sketch_k = sketch_k
+        self.rows = 0
+        self.columns: List[str] = []
+        self.dtypes: Dict[str, str] = {}
+        self.numeric_cols: List[str] = []
+        self.missing: Counter = Counter()
+        self.attack_col: Optional[str] = None
+        self.attack_counts: Counter = Counter()
+        self.group_moments: Dict[str, Dict[str, RunningMoments]] = {}
+        self.group_sketches: Dict[str, Dict[str, QuantileSketch]] = {}
+        self.column_stats = AnomalyThresholdSketch(sketch_k=sketch_k)
+        self.signatures: Dict[str, List[Dict[str, Any]]] = {}
+
+    def _sketch(self) -> QuantileSketch:
+        return QuantileSketch(k=self.sketch_k)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        if not self.columns:
+            self.columns = chunk.columns.tolist()
+            self.dtypes = {col: str(dtype) for col, dtype in chunk.dtypes.items()}
+            self.attack_col = _attack_column(self.columns)
+        self.rows += len(chunk)
+        self.missing.update({k: int(v) for k, v in chunk.isnull().sum().items()})
+
+        numeric_cols = chunk.select_dtypes(include=['number']).columns.tolist()
+        for col in numeric_cols:
+            if col not in self.numeric_cols:
+                self.numeric_cols.append(col)
+        self.column_stats.update(chunk)
+
+        if self.attack_col is None:
+            return
+        for attack_type, group in chunk.groupby(self.attack_col, observed=True, sort=False):
+            key = str(attack_type)
+            self.attack_counts[key] += len(group)
+            moments = self.group_moments.setdefault(key, {})
+            sketches = self.group_sketches.setdefault(key, {})
+            for col in numeric_cols:
+                values = group[col].to_numpy(dtype='float64', na_value=float('nan'))
+                moments.setdefault(col, RunningMoments()).update(values)
+                sketches.setdefault(col, self._sketch()).update(values)
+            sigs = self.signatures.setdefault(key, [])
+            if len(sigs) < self.signature_samples:
+                for sample in group.head(self.signature_samples - len(sigs)).to_dict('records'):
+                    sigs.append({
+                        'type': key,
+                        'features': {k: v for k, v in sample.items() if pd.notna(v)}
+                    })
+
+    def merge(self, other: "ThreatProfileAccumulator") -> "ThreatProfileAccumulator":
+        if not self.columns:
+            self.columns, self.dtypes, self.attack_col = other.columns, other.dtypes, other.attack_col
+        self.rows += other.rows
+        self.missing.update(other.missing)
+        self.attack_counts.update(other.attack_counts)
+        for col in other.numeric_cols:
+            if col not in self.numeric_cols:
+                self.numeric_cols.append(col)
+        self.column_stats.merge(other.column_stats)
+        for key, cols in other.group_moments.items():
+            for col, m in cols.items():
+                self.group_moments.setdefault(key, {}).setdefault(col, RunningMoments()).merge(m)
+        for key, cols in other.group_sketches.items():
+            for col, sk in cols.items():
+                self.group_sketches.setdefault(key, {}).setdefault(col, self._sketch()).merge(sk)
+        for key, sigs in other.signatures.items():
+            mine = self.signatures.setdefault(key, [])
+            mine.extend(sigs[: max(0, self.signature_samples - len(mine))])
+        return self
+
+    def threat_patterns(self) -> List[Dict[str, Any]]:
+        patterns = []
+        for key in sorted(self.attack_counts):
+            characteristics = {}
+            for col in self.numeric_cols:
+                m = self.group_moments.get(key, {}).get(col)
+                if m is None or m.count == 0:
+                    continue
+                characteristics[col] = {
+                    'mean': float(m.mean),
+                    'std': float(m.std()),
+                    'min': float(m.min),
+                    'max': float(m.max),
+                    'median': float(self.group_sketches[key][col].median()),
+                }
+            patterns.append({'attack_type': key, 'count': self.attack_counts[key], 'characteristics': characteristics})
+        return patterns
+
+    def attack_signatures(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {key: self.signatures.get(key, []) for key in sorted(self.attack_counts)}
+
+    def anomaly_thresholds(self) -> Dict[str, Dict[str, float]]:
+        return self.column_stats.thresholds()
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            'total_records': self.rows,
+            'columns': self.columns,
+            'dtypes': self.dtypes,
+            'missing_values': {col: int(self.missing.get(col, 0)) for col in self.columns},
+            'shape': (self.rows, len(self.columns))
+        }
+        if self.attack_col is not None:
+            summary['attack_distribution'] = dict(self.attack_counts.most_common())
+        return summary
+
 
 class ThreatDatasetLoader:
     """
@@ -25,6 +225,8 @@ class ThreatDatasetLoader:
         self.dataset_path: Optional[str] = None
         self.threat_patterns: List[Dict[str, Any]] = []
         self.attack_signatures: Dict[str, List[Dict[str, Any]]] = {}
+        self.anomaly_thresholds: Dict[str, Dict[str, float]] = {}
+        self.threshold_sketch: Optional[AnomalyThresholdSketch] = None
         
     def download_dataset(self) -> str:
         """
@@ -47,12 +249,13 @@ class ThreatDatasetLoader:
             print("   Visit: https://www.kaggle.com/docs/api")
             raise
     
-    def load_dataset(self, force_download: bool = False) -> pd.DataFrame:
+    def load_dataset(self, force_download: bool = False, use_cache: bool = True) -> pd.DataFrame:
         """
         Load the threat detection dataset. Downloads if not already cached.
         
         Args:
             force_download: Force re-download even if cached
+            use_cache: Read through the columnar cache instead of parsing the CSV
             
         Returns:
             DataFrame containing threat detection logs
@@ -68,13 +271,68 @@ class ThreatDatasetLoader:
         
         # Load the first CSV file (or combine multiple if needed)
         print(f"📊 Loading dataset from: {dataset_files[0]}")
-        df = pd.read_csv(dataset_files[0])
+        df = None
+        if use_cache and DatasetStore is not None:
+            try:
+                store = DatasetStore(str(dataset_files[0]), cache_dir=os.path.join(self.cache_dir, "columnar"))
+                df = store.to_pandas()
+            except ImportError:
+                print("💡 pyarrow not installed, parsing the CSV directly")
+        if df is None:
+            df = pd.read_csv(dataset_files[0])
         
         print(f"✅ Loaded {len(df)} threat records")
         print(f"📋 Columns: {', '.join(df.columns.tolist())}")
         
         return df
     
+    def iter_chunks(self, chunksize: int = 250_000, force_download: bool = False, use_cache: bool = True) -> Iterator[pd.DataFrame]:
+        """
+        Stream the dataset as DataFrames of at most `chunksize` rows.
+        
+        Reads record batches from the columnar cache when available, otherwise
+        parses the CSV incrementally.
+        """
+        if force_download or self.dataset_path is None:
+            self.download_dataset()
+        
+        dataset_files = list(Path(self.dataset_path).glob("*.csv"))
+        if not dataset_files:
+            raise FileNotFoundError(f"No CSV files found in {self.dataset_path}")
+        
+        if use_cache and DatasetStore is not None:
+            try:
+                store = DatasetStore(str(dataset_files[0]), cache_dir=os.path.join(self.cache_dir, "columnar"))
+                for batch in store.iter_batches(max_rows=chunksize):
+                    yield batch.to_pandas()
+                return
+            except ImportError:
+                print("💡 pyarrow not installed, parsing the CSV directly")
+        yield from pd.read_csv(dataset_files[0], chunksize=chunksize)
+    
+    def process_in_chunks(self, chunksize: int = 250_000, force_download: bool = False) -> Dict[str, Any]:
+        """
+        Out-of-core equivalent of extract_threat_patterns, get_attack_signatures,
+        get_anomaly_thresholds and get_summary in a single pass.
+        
+        Args:
+            chunksize: Maximum rows held in memory at once
+            force_download: Force re-download even if cached
+            
+        Returns:
+            Summary dictionary (patterns, signatures and thresholds are stored on the loader)
+        """
+        acc = ThreatProfileAccumulator()
+        for chunk in self.iter_chunks(chunksize=chunksize, force_download=force_download):
+            acc.update(chunk)
+        
+        self.threat_patterns = acc.threat_patterns()
+        self.attack_signatures = acc.attack_signatures()
+        self.threshold_sketch = acc.column_stats
+        self.anomaly_thresholds = acc.anomaly_thresholds()
+        print(f"🔍 Extracted {len(self.threat_patterns)} unique threat patterns from {acc.rows} records")
+        return acc.summary()
+    
     def extract_threat_patterns(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
         """
         Extract threat patterns from the dataset for AI analysis.
@@ -169,25 +427,12 @@ class ThreatDatasetLoader:
         Returns:
             Dictionary of feature thresholds
         """
-        thresholds = {}
-        
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        
-        for col in numeric_cols:
-            # Calculate percentiles for threshold detection
-            q95 = df[col].quantile(0.95)
-            q99 = df[col].quantile(0.99)
-            mean = df[col].mean()
-            std = df[col].std()
-            
-            thresholds[col] = {
-                'mean': float(mean),
-                'std': float(std),
-                'p95': float(q95),
-                'p99': float(q99),
-                'upper_bound': float(mean + 3 * std),
-                'lower_bound': float(mean - 3 * std)
-            }
+        # Percentiles come from a mergeable sketch instead of sorting each column;
+        # the sketch is kept so save_processed_data can persist it
+        self.threshold_sketch = AnomalyThresholdSketch()
+        self.threshold_sketch.update(df)
+        thresholds = self.threshold_sketch.thresholds()
+        self.anomaly_thresholds = thresholds
         
         print(f"📏 Calculated thresholds for {len(thresholds)} features")
         return thresholds
@@ -210,16 +455,71 @@ class ThreatDatasetLoader:
         # Save threat patterns
         patterns_file = os.path.join(output_dir, "threat_patterns.json")
         with open(patterns_file, 'w') as f:
-            json.dump(self.threat_patterns, f, indent=2)
+            json.dump(self.threat_patterns, f, indent=2, default=str)
         
         # Save attack signatures
         signatures_file = os.path.join(output_dir, "attack_signatures.json")
         with open(signatures_file, 'w') as f:
-            json.dump(self.attack_signatures, f, indent=2)
+            json.dump(self.attack_signatures, f, indent=2, default=str)
+        
+        # Save threshold sketches and the thresholds derived from them
+        if self.threshold_sketch is not None:
+            self._save_thresholds(output_dir)
         
         print(f"💾 Saved processed data to: {output_dir}")
         return output_dir
     
+    def _save_thresholds(self, output_dir: str) -> None:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "threshold_sketches.json"), 'w') as f:
+            json.dump(self.threshold_sketch.to_dict(), f)
+        with open(os.path.join(output_dir, "anomaly_thresholds.json"), 'w') as f:
+            json.dump(self.anomaly_thresholds, f, indent=2)
+    
+    def load_thresholds(self, output_dir: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Load persisted threshold sketches (if any) and the thresholds derived from them.
+        
+        Args:
+            output_dir: Directory holding the processed data
+            
+        Returns:
+            Dictionary of feature thresholds (empty if none were saved)
+        """
+        if output_dir is None:
+            output_dir = os.path.join(self.cache_dir, "processed")
+        
+        sketches_file = os.path.join(output_dir, "threshold_sketches.json")
+        if not os.path.exists(sketches_file):
+            return {}
+        with open(sketches_file, 'r') as f:
+            self.threshold_sketch = AnomalyThresholdSketch.from_dict(json.load(f))
+        self.anomaly_thresholds = self.threshold_sketch.thresholds()
+        return self.anomaly_thresholds
+    
+    def update_thresholds(self, df: pd.DataFrame, output_dir: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Fold newly arrived logs into the persisted threshold sketches.
+        
+        Args:
+            df: DataFrame containing only the new threat logs
+            output_dir: Directory holding the processed data
+            
+        Returns:
+            Updated dictionary of feature thresholds
+        """
+        if output_dir is None:
+            output_dir = os.path.join(self.cache_dir, "processed")
+        
+        if self.threshold_sketch is None:
+            self.load_thresholds(output_dir)
+        if self.threshold_sketch is None:
+            self.threshold_sketch = AnomalyThresholdSketch()
+        self.threshold_sketch.update(df)
+        self.anomaly_thresholds = self.threshold_sketch.thresholds()
+        self._save_thresholds(output_dir)
+        return self.anomaly_thresholds
+    
     def get_summary(self, df: pd.DataFrame) -> Dict[str, Any]:
         """
         Get a summary of the dataset.
@@ -250,29 +550,38 @@ class ThreatDatasetLoader:
         return summary
 
 
-def initialize_threat_database():
+def initialize_threat_database(chunksize: Optional[int] = None):
     """
     Initialize and load the threat detection dataset.
     Returns the loader instance with loaded data.
+    
+    Processes the dataset in chunks of `chunksize` rows (default from
+    CYBERGUARD_DATASET_CHUNK_ROWS); pass 0 to load it into memory at once.
     """
     print("🚀 Initializing Threat Detection Database...")
     
     loader = ThreatDatasetLoader()
+    if chunksize is None:
+        chunksize = int(os.getenv("CYBERGUARD_DATASET_CHUNK_ROWS", "250000"))
     
     try:
-        # Load the dataset
-        df = loader.load_dataset()
-        
-        # Extract patterns and signatures
-        loader.extract_threat_patterns(df)
-        loader.get_attack_signatures(df)
-        thresholds = loader.get_anomaly_thresholds(df)
+        if chunksize > 0:
+            # Stream the dataset with a fixed memory ceiling
+            summary = loader.process_in_chunks(chunksize=chunksize)
+        else:
+            # Load the dataset
+            df = loader.load_dataset()
+            
+            # Extract patterns and signatures
+            loader.extract_threat_patterns(df)
+            loader.get_attack_signatures(df)
+            loader.anomaly_thresholds = loader.get_anomaly_thresholds(df)
+            summary = loader.get_summary(df)
         
         # Save processed data
         loader.save_processed_data()
         
         # Print summary
-        summary = loader.get_summary(df)
         print(f"\n📊 Dataset Summary:")
         print(f"   Total Records: {summary['total_records']}")
         print(f"   Columns: {len(summary['columns'])}")
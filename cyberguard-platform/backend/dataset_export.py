@@ -0,0 +1,100 @@
+"""
+Streaming export of filtered dataset slices.
+
+Rows are pulled from a query bitmap a batch at a time, taken from the file
+batches of the columnar store that hold them (each decoded once, one at a
+time) and serialized straight into the response, so memory stays constant
+however many rows are exported.
+"""
+import io
+from typing import Iterator, List, Optional
+
+import numpy as np
+import orjson
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.csv as pacsv  # type: ignore
+    import pyarrow.ipc as ipc  # type: ignore
+except ImportError:  # pragma: no cover
+    pa = None  # type: ignore
+
+from dataset_index import QueryResult, bitmap_rows
+
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def _plain(table: "pa.Table") -> "pa.Table":
+    """Decode dictionary columns (CSV writers and most notebooks want plain strings)."""
+    fields = [pa.field(f.name, f.type.value_type) if pa.types.is_dictionary(f.type) else f for f in table.schema]
+    return table.cast(pa.schema(fields))
+
+
+def iter_row_batches(result: QueryResult, batch_rows: int = 8192, max_rows: Optional[int] = None) -> Iterator["pa.Table"]:
+    """Matching rows as small tables, in row order."""
+    store = result.index.store
+    starts = store.batch_starts()
+    # Rows come in ascending order, so each file batch is decoded once
+    current = -1
+    batch = None
+    next_row = 0
+    sent = 0
+    while max_rows is None or sent < max_rows:
+        want = batch_rows if max_rows is None else min(batch_rows, max_rows - sent)
+        rows = bitmap_rows(result.bitmap, next_row, want).astype(np.int64)
+        if len(rows) == 0:
+            return
+        which = np.searchsorted(starts, rows, side="right") - 1
+        bounds = np.flatnonzero(np.diff(which)) + 1
+        parts: List["pa.RecordBatch"] = []
+        for group in np.split(np.arange(len(rows)), bounds):
+            b = int(which[group[0]])
+            if b != current:
+                current, batch = b, store.read_batch(b)
+            parts.append(batch.take(pa.array(rows[group] - starts[b])))
+        yield pa.Table.from_batches(parts)
+        sent += len(rows)
+        next_row = int(rows[-1]) + 1
+
+
+def iter_export(result: QueryResult, fmt: str, batch_rows: int = 8192, max_rows: Optional[int] = None) -> Iterator[bytes]:
+    """Serialize the matching rows as `fmt` chunks (one chunk per batch)."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'")
+    batches = iter_row_batches(result, batch_rows=batch_rows, max_rows=max_rows)
+
+    if fmt == "ndjson":
+        for batch in batches:
+            yield b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in batch.to_pylist())
+        return
+
+    if fmt == "csv":
+        header = True
+        for batch in batches:
+            sink = io.BytesIO()
+            pacsv.write_csv(_plain(batch), sink, write_options=pacsv.WriteOptions(include_header=header))
+            header = False
+            yield sink.getvalue()
+        return
+
+    # Arrow IPC stream: schema first, then one record batch per chunk
+    sink = io.BytesIO()
+    writer = None
+    for batch in batches:
+        batch = _plain(batch)
+        if writer is None:
+            writer = ipc.new_stream(sink, batch.schema)
+        writer.write_table(batch)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer is None:
+        schema = _plain(result.index.store.schema.empty_table()).schema
+        writer = ipc.new_stream(sink, schema)
+    writer.close()
+    yield sink.getvalue()
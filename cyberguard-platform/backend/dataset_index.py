@@ -0,0 +1,419 @@
+"""
+Precomputed row-id and bitmap indexes over the dataset columns.
+
+For every indexed column the row ids are grouped by value in CSR layout
+(`row_ids[offsets[i]:offsets[i + 1]]` are the rows holding `values[i]`, with
+`values` sorted), so a value's count is one subtraction and a page of its rows
+is one slice. Low-cardinality columns also get one packed bitmap per value
+(8 rows per byte) and the timestamp column a sorted permutation, so
+conjunctive filters become bitwise ANDs and popcounts instead of row scans.
+The arrays are persisted as .npy files next to the columnar cache and opened
+with a memory map.
+"""
+import base64
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+except ImportError:  # pragma: no cover
+    pa = None  # type: ignore
+
+from dataset_store import DatasetStore
+
+
+INDEXED_COLUMNS = ("threat_label", "action", "log_type", "protocol", "source_ip", "dest_ip")
+TIMESTAMP_COLUMN = "timestamp"
+
+# Columns with at most this many distinct values get one bitmap per value.
+BITMAP_MAX_VALUES = 64
+
+# Bump when the on-disk layout changes so old indexes are rebuilt.
+INDEX_FORMAT_VERSION = 2
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(bitmap: np.ndarray) -> int:
+    return int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+
+def rows_to_bitmap(rows: np.ndarray, num_rows: int) -> np.ndarray:
+    mask = np.zeros(num_rows, dtype=bool)
+    mask[rows] = True
+    return np.packbits(mask, bitorder="little")
+
+
+def range_to_bitmap(lo: int, hi: int, num_rows: int) -> np.ndarray:
+    """Bitmap with rows [lo, hi) set."""
+    bitmap = np.zeros((num_rows + 7) // 8, dtype=np.uint8)
+    if lo >= hi:
+        return bitmap
+    first, last = lo >> 3, (hi - 1) >> 3
+    head = (0xFF << (lo & 7)) & 0xFF
+    tail = 0xFF >> (7 - ((hi - 1) & 7))
+    if first == last:
+        bitmap[first] = head & tail
+    else:
+        bitmap[first] = head
+        bitmap[first + 1:last] = 0xFF
+        bitmap[last] = tail
+    return bitmap
+
+
+def bitmap_rows(bitmap: np.ndarray, start_row: int, limit: int, block: int = 1 << 16) -> np.ndarray:
+    """Up to `limit` set row ids at or after `start_row`, scanning only as far as needed."""
+    found: List[np.ndarray] = []
+    need = limit
+    byte = start_row >> 3
+    while byte < len(bitmap) and need > 0:
+        chunk = np.asarray(bitmap[byte:byte + block])
+        nz = np.flatnonzero(chunk)
+        if nz.size:
+            bits = np.unpackbits(chunk[nz][:, None], axis=1, bitorder="little").astype(bool)
+            rows = ((byte + nz)[:, None] * 8 + np.arange(8))[bits]
+            rows = rows[rows >= start_row][:need]
+            found.append(rows)
+            need -= len(rows)
+        byte += block
+    return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+class ColumnIndex:
+    """Row ids of one column grouped by value, plus per-value bitmaps when small."""
+
+    def __init__(
+        self,
+        name: str,
+        values: np.ndarray,
+        offsets: np.ndarray,
+        row_ids: np.ndarray,
+        bitmaps: Optional[np.ndarray] = None,
+    ) -> None:
+        self.name = name
+        self.values = values
+        self.offsets = offsets
+        self.row_ids = row_ids
+        self.bitmaps = bitmaps
+
+    def code(self, value: str) -> Optional[int]:
+        i = int(np.searchsorted(self.values, value))
+        if i < len(self.values) and self.values[i] == value:
+            return i
+        return None
+
+    def count(self, value: str) -> int:
+        code = self.code(value)
+        if code is None:
+            return 0
+        return int(self.offsets[code + 1] - self.offsets[code])
+
+    def counts(self) -> Dict[str, int]:
+        sizes = np.diff(self.offsets)
+        return {str(v): int(sizes[i]) for i, v in enumerate(self.values)}
+
+    def rows(self, value: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Ascending row ids holding `value`, sliced to [start, stop)."""
+        code = self.code(value)
+        if code is None:
+            return self.row_ids[:0]
+        lo, hi = int(self.offsets[code]), int(self.offsets[code + 1])
+        end = hi if stop is None else min(hi, lo + stop)
+        return self.row_ids[min(max(lo, lo + start), hi):max(lo, end)]
+
+    def bitmap(self, values: List[str], num_rows: int) -> np.ndarray:
+        """OR of the rows holding any of `values`, as a packed bitmap."""
+        codes = [c for c in (self.code(v) for v in values) if c is not None]
+        if self.bitmaps is not None:
+            if not codes:
+                return np.zeros(self.bitmaps.shape[1], dtype=np.uint8)
+            return np.bitwise_or.reduce(self.bitmaps[codes], axis=0)
+        rows = [self.row_ids[int(self.offsets[c]):int(self.offsets[c + 1])] for c in codes]
+        return rows_to_bitmap(np.concatenate(rows) if rows else np.empty(0, dtype=np.int64), num_rows)
+
+
+class TimestampIndex:
+    """Row ids ordered by time; a range lookup is two binary searches."""
+
+    def __init__(self, sorted_values: np.ndarray, sorted_rows: Optional[np.ndarray], unit: str) -> None:
+        self.sorted_values = sorted_values
+        # None when the dataset is already in time order (identity permutation)
+        self.sorted_rows = sorted_rows
+        self.unit = unit
+
+    def to_ticks(self, value: Any) -> int:
+        return int(np.datetime64(value, self.unit).astype(np.int64))
+
+    def bitmap(self, start: Optional[Any], end: Optional[Any], num_rows: int) -> np.ndarray:
+        """Rows with start <= timestamp < end."""
+        lo = 0 if start is None else int(np.searchsorted(self.sorted_values, self.to_ticks(start), side="left"))
+        hi = len(self.sorted_values) if end is None else int(np.searchsorted(self.sorted_values, self.to_ticks(end), side="left"))
+        if self.sorted_rows is None:
+            return range_to_bitmap(lo, hi, num_rows)
+        return rows_to_bitmap(self.sorted_rows[lo:hi], num_rows)
+
+
+class QueryResult:
+    """Rows matching a conjunctive filter, held as a bitmap."""
+
+    def __init__(self, index: "DatasetIndex", bitmap: np.ndarray, key: str) -> None:
+        self.index = index
+        self.bitmap = bitmap
+        self.key = key
+        self._count: Optional[int] = None
+
+    def count(self) -> int:
+        if self._count is None:
+            self._count = popcount(self.bitmap)
+        return self._count
+
+    def page(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[np.ndarray, Optional[str]]:
+        start = 0
+        if cursor:
+            state = decode_cursor(cursor, self.index.store.fingerprint)
+            if state.get("q") != self.key:
+                raise ValueError("Cursor does not belong to this query")
+            start = cursor_position(state, "r")
+        rows = bitmap_rows(self.bitmap, start, limit + 1)
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor({"q": self.key, "r": int(rows[limit])}, self.index.store.fingerprint)
+            rows = rows[:limit]
+        return rows, next_cursor
+
+
+def _row_id_dtype(rows: int) -> Any:
+    return np.uint32 if rows < 2 ** 32 else np.int64
+
+
+def _global_codes(column: "pa.Array", lookup: Dict[str, int], values: List[str]) -> np.ndarray:
+    """Map one batch column onto stable codes shared across batches (-1 for nulls)."""
+    if not pa.types.is_dictionary(column.type):
+        column = pc.dictionary_encode(column)
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    table = np.empty(len(column.dictionary), dtype=np.int32)
+    for i, v in enumerate(column.dictionary.to_pylist()):
+        key = str(v)
+        code = lookup.get(key)
+        if code is None:
+            code = lookup[key] = len(values)
+            values.append(key)
+        table[i] = code
+    indices = column.indices.to_numpy(zero_copy_only=False)
+    codes = np.full(len(column), -1, dtype=np.int32)
+    valid = column.indices.is_valid().to_numpy(zero_copy_only=False)
+    codes[valid] = table[indices[valid].astype(np.int64)]
+    return codes
+
+
+class DatasetIndex:
+    """Value -> row-id indexes for a DatasetStore, keyed by its source fingerprint."""
+
+    def __init__(self, store: DatasetStore, columns: Tuple[str, ...] = INDEXED_COLUMNS) -> None:
+        self.store = store
+        self.requested_columns = columns
+        stem = os.path.splitext(os.path.basename(store.cache_path))[0]
+        self.index_dir = os.path.join(store.cache_dir, f"{stem}.index")
+        self.columns: Dict[str, ColumnIndex] = {}
+        self.timestamp: Optional[TimestampIndex] = None
+        self.num_rows = 0
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.index_dir, "meta.json")
+
+    def build(self) -> None:
+        fingerprint = self.store.fingerprint
+        names = [c for c in self.requested_columns if c in self.store.columns]
+        schema = self.store.schema
+        has_ts = TIMESTAMP_COLUMN in schema.names and pa.types.is_timestamp(schema.field(TIMESTAMP_COLUMN).type)
+        n = self.store.num_rows
+        codes = {c: np.empty(n, dtype=np.int32) for c in names}
+        values: Dict[str, List[str]] = {c: [] for c in names}
+        lookups: Dict[str, Dict[str, int]] = {c: {} for c in names}
+        ticks = np.empty(n, dtype=np.int64) if has_ts else None
+        pos = 0
+        for batch in self.store.iter_batches(columns=names + ([TIMESTAMP_COLUMN] if has_ts else [])):
+            for c in names:
+                codes[c][pos:pos + batch.num_rows] = _global_codes(batch.column(c), lookups[c], values[c])
+            if ticks is not None:
+                ts = batch.column(TIMESTAMP_COLUMN).cast(pa.int64())
+                ticks[pos:pos + batch.num_rows] = ts.fill_null(np.iinfo(np.int64).max).to_numpy()
+            pos += batch.num_rows
+
+        tmp_dir = self.index_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        dtype = _row_id_dtype(n)
+        meta_columns: Dict[str, Dict[str, Any]] = {}
+        for c in names:
+            col_codes = codes.pop(c)
+            # Renumber codes so values are sorted and lookups can binary-search
+            col_values = np.array(values[c], dtype=str)
+            by_value = np.argsort(col_values, kind="stable")
+            remap = np.empty(len(col_values) + 1, dtype=np.int32)
+            remap[by_value] = np.arange(len(col_values), dtype=np.int32)
+            remap[-1] = -1
+            col_codes = remap[col_codes]
+            order = np.argsort(col_codes, kind="stable")
+            # Nulls (-1) sort first; drop them from the index
+            nulls = int(np.count_nonzero(col_codes == -1))
+            sizes = np.bincount(col_codes[col_codes >= 0], minlength=len(col_values))
+            offsets = np.zeros(len(col_values) + 1, dtype=np.int64)
+            np.cumsum(sizes, out=offsets[1:])
+            np.save(os.path.join(tmp_dir, f"{c}.values.npy"), col_values[by_value])
+            np.save(os.path.join(tmp_dir, f"{c}.rows.npy"), order[nulls:].astype(dtype))
+            np.save(os.path.join(tmp_dir, f"{c}.offsets.npy"), offsets)
+            has_bitmaps = len(col_values) <= BITMAP_MAX_VALUES
+            if has_bitmaps:
+                bitmaps = np.stack([np.packbits(col_codes == i, bitorder="little") for i in range(len(col_values))]) \
+                    if len(col_values) else np.zeros((0, (n + 7) // 8), dtype=np.uint8)
+                np.save(os.path.join(tmp_dir, f"{c}.bitmaps.npy"), bitmaps)
+            meta_columns[c] = {"bitmaps": has_bitmaps}
+
+        timestamp_meta = None
+        if ticks is not None:
+            unit = schema.field(TIMESTAMP_COLUMN).type.unit
+            in_order = bool(np.all(ticks[1:] >= ticks[:-1]))
+            if in_order:
+                np.save(os.path.join(tmp_dir, f"{TIMESTAMP_COLUMN}.sorted.npy"), ticks)
+            else:
+                order = np.argsort(ticks, kind="stable")
+                np.save(os.path.join(tmp_dir, f"{TIMESTAMP_COLUMN}.sorted.npy"), ticks[order])
+                np.save(os.path.join(tmp_dir, f"{TIMESTAMP_COLUMN}.rows.npy"), order.astype(dtype))
+            timestamp_meta = {"unit": unit, "in_order": in_order}
+
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({
+                "version": INDEX_FORMAT_VERSION,
+                "fingerprint": fingerprint,
+                "rows": n,
+                "columns": meta_columns,
+                "timestamp": timestamp_meta,
+            }, f)
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+        os.replace(tmp_dir, self.index_dir)
+
+    def load(self) -> bool:
+        """Open a persisted index; False if it is missing or stale."""
+        try:
+            with open(self._meta_path(), "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get("version") != INDEX_FORMAT_VERSION or meta.get("fingerprint") != self.store.fingerprint:
+            return False
+
+        def _load(name: str) -> np.ndarray:
+            return np.load(os.path.join(self.index_dir, name), mmap_mode="r")
+
+        columns: Dict[str, ColumnIndex] = {}
+        for c, info in meta["columns"].items():
+            columns[c] = ColumnIndex(
+                c,
+                np.load(os.path.join(self.index_dir, f"{c}.values.npy")),
+                np.load(os.path.join(self.index_dir, f"{c}.offsets.npy")),
+                _load(f"{c}.rows.npy"),
+                _load(f"{c}.bitmaps.npy") if info.get("bitmaps") else None,
+            )
+        ts_meta = meta.get("timestamp")
+        if ts_meta:
+            self.timestamp = TimestampIndex(
+                _load(f"{TIMESTAMP_COLUMN}.sorted.npy"),
+                None if ts_meta["in_order"] else _load(f"{TIMESTAMP_COLUMN}.rows.npy"),
+                ts_meta["unit"],
+            )
+        self.columns = columns
+        self.num_rows = int(meta["rows"])
+        return True
+
+    @classmethod
+    def load_or_build(cls, store: DatasetStore, columns: Tuple[str, ...] = INDEXED_COLUMNS) -> "DatasetIndex":
+        index = cls(store, columns)
+        if not index.load():
+            index.build()
+            index.load()
+        return index
+
+    def column(self, name: str) -> ColumnIndex:
+        if name not in self.columns:
+            raise KeyError(f"Column '{name}' is not indexed")
+        return self.columns[name]
+
+    def page(self, column: str, value: str, cursor: Optional[str] = None, limit: int = 20) -> Tuple[np.ndarray, Optional[str]]:
+        """Rows for one value starting at `cursor`; returns (row_ids, next_cursor)."""
+        start = 0
+        if cursor:
+            state = decode_cursor(cursor, self.store.fingerprint)
+            if state.get("c") != column or state.get("v") != value:
+                raise ValueError("Cursor does not belong to this query")
+            start = cursor_position(state, "p")
+        rows = self.column(column).rows(value, start, start + limit)
+        end = start + len(rows)
+        next_cursor = None
+        if end < self.column(column).count(value):
+            next_cursor = encode_cursor({"c": column, "v": value, "p": end}, self.store.fingerprint)
+        return rows, next_cursor
+
+    def query(
+        self,
+        filters: Dict[str, List[str]],
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> QueryResult:
+        """
+        Rows matching every filter: values within one column are OR-ed, columns
+        are AND-ed, and `start`/`end` bound the timestamp (end exclusive).
+        """
+        filters = {c: sorted(set(v)) for c, v in filters.items() if v}
+        for c in filters:
+            self.column(c)
+        if (start is not None or end is not None) and self.timestamp is None:
+            raise KeyError(f"Column '{TIMESTAMP_COLUMN}' is not indexed")
+        key = hashlib.sha1(
+            json.dumps([sorted(filters.items()), str(start), str(end)], separators=(",", ":")).encode()
+        ).hexdigest()[:16]
+
+        parts: List[np.ndarray] = []
+        # Cheapest first: precomputed bitmaps, then postings, then the time range
+        for c in sorted(filters, key=lambda c: (self.columns[c].bitmaps is None, sum(self.columns[c].count(v) for v in filters[c]))):
+            parts.append(self.columns[c].bitmap(filters[c], self.num_rows))
+        if self.timestamp is not None and (start is not None or end is not None):
+            parts.append(self.timestamp.bitmap(start, end, self.num_rows))
+        if not parts:
+            return QueryResult(self, range_to_bitmap(0, self.num_rows, self.num_rows), key)
+        bitmap = np.array(parts[0], copy=True)
+        for part in parts[1:]:
+            np.bitwise_and(bitmap, part, out=bitmap)
+        return QueryResult(self, bitmap, key)
+
+
+def encode_cursor(state: Dict[str, Any], fingerprint: str) -> str:
+    payload = json.dumps({**state, "f": fingerprint[:16]}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def cursor_position(state: Dict[str, Any], field: str) -> int:
+    """A decoded cursor's offset field; raises ValueError unless it is an int >= 0."""
+    value = state.get(field, 0)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError("Malformed cursor")
+    return value
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Dict[str, Any]:
+    """Decode an opaque cursor; raises ValueError if malformed or from another dataset build."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Malformed cursor")
+    if not isinstance(state, dict) or state.get("f") != fingerprint[:16]:
+        raise ValueError("Cursor is stale; restart pagination")
+    return state
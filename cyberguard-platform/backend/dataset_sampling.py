@@ -0,0 +1,89 @@
+"""
+O(k) random sampling over the indexed threat dataset.
+
+Unseeded requests read the next k ids from a precomputed shuffled pool and
+advance a cursor (the pool is reshuffled when it wraps), so repeated polling
+walks the dataset without repeats. Seeded requests use Floyd-style selection
+from a fresh generator and are reproducible. Both can be stratified by any
+indexed column, drawing the same number of rows from every value.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from dataset_index import BITMAP_MAX_VALUES, DatasetIndex
+
+
+class _ShuffledPool:
+    """A shuffled permutation of `size` positions consumed k at a time."""
+
+    def __init__(self, size: int, rng: np.random.Generator) -> None:
+        self.size = size
+        self._rng = rng
+        self._perm = rng.permutation(size).astype(np.uint32 if size < 2 ** 32 else np.int64)
+        self._pos = 0
+
+    def take(self, k: int) -> np.ndarray:
+        k = min(k, self.size)
+        if self._pos + k > self.size:
+            self._rng.shuffle(self._perm)
+            self._pos = 0
+        out = self._perm[self._pos:self._pos + k]
+        self._pos += k
+        return out
+
+
+class DatasetSampler:
+    def __init__(self, index: DatasetIndex, seed: Optional[int] = None) -> None:
+        self.index = index
+        self._rng = np.random.default_rng(seed)
+        # Pools are built lazily: key None is the whole dataset, otherwise (column, value)
+        self._pools: Dict[object, _ShuffledPool] = {}
+
+    def _pool(self, key: object, size: int) -> _ShuffledPool:
+        pool = self._pools.get(key)
+        if pool is None or pool.size != size:
+            pool = self._pools[key] = _ShuffledPool(size, self._rng)
+        return pool
+
+    def _positions(self, key: object, size: int, k: int, rng: Optional[np.random.Generator]) -> np.ndarray:
+        k = min(k, size)
+        if rng is not None:
+            return rng.choice(size, size=k, replace=False)
+        return self._pool(key, size).take(k)
+
+    def sample(self, k: int, seed: Optional[int] = None, stratify: Optional[str] = None) -> np.ndarray:
+        """Row ids of a uniform sample of (up to) k rows.
+
+        Raises KeyError for an unindexed `stratify` column and ValueError for
+        one with more than BITMAP_MAX_VALUES distinct values.
+        """
+        rng = np.random.default_rng(seed) if seed is not None else None
+        if stratify is None:
+            return self._positions(None, self.index.num_rows, k, rng)
+
+        column = self.index.column(stratify)
+        if len(column.values) > BITMAP_MAX_VALUES:
+            raise ValueError(
+                f"Cannot stratify by {stratify}: {len(column.values)} distinct values (at most {BITMAP_MAX_VALUES})"
+            )
+        counts = column.counts()
+        strata = [v for v in column.values if counts[v] > 0]
+        if not strata:
+            return np.empty(0, dtype=np.int64)
+        # Equal share per value, capped by what the value holds; leftovers go round-robin
+        quota = {v: 0 for v in strata}
+        remaining = k
+        while remaining > 0:
+            open_strata = [v for v in strata if quota[v] < counts[v]]
+            if not open_strata:
+                break
+            for v in open_strata[:remaining]:
+                quota[v] += 1
+                remaining -= 1
+        parts = []
+        for v in strata:
+            if quota[v]:
+                pos = self._positions((stratify, v), counts[v], quota[v], rng)
+                parts.append(column.rows(v)[pos])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
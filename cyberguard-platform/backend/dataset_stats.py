@@ -0,0 +1,232 @@
+"""
+Single-pass statistics for the threat dataset.
+
+`StatsAccumulator` folds record batches into mergeable partial aggregates
+(value counts, numeric moments, quantile sketches), so the whole
+`/api/dataset/stats` payload comes out of one sweep over the columnar cache. The result is persisted next
+to the cache and keyed by the source fingerprint.
+"""
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+except ImportError:  # pragma: no cover
+    pa = None  # type: ignore
+
+from dataset_store import DatasetStore
+from sketches import CountMinSketch, HeavyHitters, HyperLogLog, QuantileSketch
+
+
+# Low-cardinality columns are counted exactly
+COUNT_COLUMNS = ("threat_label", "protocol", "action", "log_type")
+# High-cardinality columns only get bounded-memory sketches
+SKETCH_COLUMNS = ("request_path", "source_ip", "dest_ip", "user_agent")
+BYTES_COLUMN = "bytes_transferred"
+
+# Bump when the payload shape changes so persisted stats are recomputed.
+STATS_FORMAT_VERSION = 3
+
+
+class NumericSummary:
+    """Count/sum/min/max plus a KLL sketch for the median and tail percentiles."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.sketch = QuantileSketch()
+
+    def update(self, column: "pa.Array") -> None:
+        column = column.drop_null()
+        if len(column) == 0:
+            return
+        self.count += len(column)
+        self.total += float(pc.sum(column).as_py())
+        mm = pc.min_max(column).as_py()
+        self.min = mm["min"] if self.min is None else min(self.min, mm["min"])
+        self.max = mm["max"] if self.max is None else max(self.max, mm["max"])
+        self.sketch.update(column.to_numpy(zero_copy_only=False))
+
+    def merge(self, other: "NumericSummary") -> None:
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def median(self) -> Optional[float]:
+        return self.sketch.median()
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+class FrequencyProfile:
+    """Top-k, per-value frequency and distinct-count sketches for one column."""
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.top = HeavyHitters(capacity)
+        self.frequency = CountMinSketch()
+        self.distinct = HyperLogLog()
+
+    def update(self, column: "pa.Array") -> None:
+        # Sketches are fed the chunk's value counts, so strings are hashed once per
+        # distinct value rather than once per row
+        vc = pc.value_counts(column.drop_null())
+        if len(vc) == 0:
+            return
+        values = vc.field("values")
+        if pa.types.is_dictionary(values.type):
+            values = values.dictionary_decode()
+        values = values.to_pylist()
+        counts = vc.field("counts").to_numpy()
+        self.top.update(values, counts)
+        self.frequency.update(values, counts)
+        self.distinct.update(values)
+
+    def merge(self, other: "FrequencyProfile") -> "FrequencyProfile":
+        self.top.merge(other.top)
+        self.frequency.merge(other.frequency)
+        self.distinct.merge(other.distinct)
+        return self
+
+    def summary(self, k: int = 10) -> Dict[str, Any]:
+        return {
+            "total": self.top.total,
+            "distinct": self.distinct.cardinality(),
+            "top": self.top.top(k),
+        }
+
+    def estimate(self, value: Any) -> int:
+        return self.frequency.estimate(value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "top": self.top.to_dict(),
+            "frequency": self.frequency.to_dict(),
+            "distinct": self.distinct.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FrequencyProfile":
+        profile = cls()
+        profile.top = HeavyHitters.from_dict(data["top"])
+        profile.frequency = CountMinSketch.from_dict(data["frequency"])
+        profile.distinct = HyperLogLog.from_dict(data["distinct"])
+        return profile
+
+
+class StatsAccumulator:
+    """Mergeable partial aggregates for one or more chunks of the dataset."""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.columns: List[str] = []
+        self.counts: Dict[str, Counter] = {c: Counter() for c in COUNT_COLUMNS}
+        self.bytes = NumericSummary()
+        self.profiles: Dict[str, FrequencyProfile] = {c: FrequencyProfile() for c in SKETCH_COLUMNS}
+
+    def update(self, batch: "pa.RecordBatch") -> None:
+        if not self.columns:
+            self.columns = list(batch.schema.names)
+        self.rows += batch.num_rows
+        for name in COUNT_COLUMNS:
+            if name not in batch.schema.names:
+                continue
+            vc = pc.value_counts(batch.column(name))
+            self.counts[name].update(
+                {k: v for k, v in zip(vc.field("values").to_pylist(), vc.field("counts").to_pylist()) if k is not None}
+            )
+        for name in SKETCH_COLUMNS:
+            if name in batch.schema.names:
+                self.profiles[name].update(batch.column(name))
+        if BYTES_COLUMN in batch.schema.names:
+            self.bytes.update(batch.column(BYTES_COLUMN))
+
+    def merge(self, other: "StatsAccumulator") -> "StatsAccumulator":
+        self.rows += other.rows
+        self.columns = self.columns or other.columns
+        for name, counter in other.counts.items():
+            self.counts.setdefault(name, Counter()).update(counter)
+        self.bytes.merge(other.bytes)
+        for name, profile in other.profiles.items():
+            self.profiles.setdefault(name, FrequencyProfile()).merge(profile)
+        return self
+
+    def to_payload(self) -> Dict[str, Any]:
+        return {
+            "loaded": True,
+            "total_records": self.rows,
+            "columns": self.columns,
+            "threat_distribution": dict(self.counts["threat_label"].most_common()),
+            "protocol_distribution": dict(self.counts["protocol"].most_common(10)),
+            "top_paths": {item["value"]: item["count"] for item in self.profiles["request_path"].top.top(10)},
+            "action_distribution": dict(self.counts["action"].most_common()),
+            "log_type_distribution": dict(self.counts["log_type"].most_common()),
+            "bytes_stats": {
+                "mean": self.bytes.mean(),
+                "median": self.bytes.median(),
+                "p95": self.bytes.sketch.quantile(0.95),
+                "p99": self.bytes.sketch.quantile(0.99),
+                "min": int(self.bytes.min) if self.bytes.min is not None else None,
+                "max": int(self.bytes.max) if self.bytes.max is not None else None,
+            },
+        }
+
+
+def compute_stats(store: DatasetStore, max_rows: int = 262_144) -> StatsAccumulator:
+    acc = StatsAccumulator()
+    for batch in store.iter_batches(max_rows=max_rows):
+        acc.update(batch)
+    return acc
+
+
+def stats_path(store: DatasetStore) -> str:
+    stem = os.path.splitext(os.path.basename(store.cache_path))[0]
+    return os.path.join(store.cache_dir, f"{stem}.stats.json")
+
+
+def _load_or_compute(store: DatasetStore) -> Dict[str, Any]:
+    fingerprint = store.fingerprint
+    path = stats_path(store)
+    try:
+        with open(path, "r") as f:
+            saved = json.load(f)
+        if saved.get("version") == STATS_FORMAT_VERSION and saved.get("fingerprint") == fingerprint:
+            return saved
+    except (OSError, ValueError, KeyError):
+        pass
+    acc = compute_stats(store)
+    saved = {
+        "version": STATS_FORMAT_VERSION,
+        "fingerprint": fingerprint,
+        "stats": acc.to_payload(),
+        # Sketch state lets other processes merge in new data without a rescan
+        "sketches": {
+            BYTES_COLUMN: acc.bytes.sketch.to_dict(),
+            "profiles": {name: p.to_dict() for name, p in acc.profiles.items()},
+        },
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(saved, f)
+    os.replace(tmp, path)
+    return saved
+
+
+def load_or_compute_stats(store: DatasetStore) -> Dict[str, Any]:
+    """Return persisted stats for the current source, computing them once if needed."""
+    return _load_or_compute(store)["stats"]
+
+
+def load_or_compute_profiles(store: DatasetStore) -> Dict[str, FrequencyProfile]:
+    """Frequency profiles for SKETCH_COLUMNS, from the same persisted pass as the stats."""
+    saved = _load_or_compute(store)
+    return {name: FrequencyProfile.from_dict(data) for name, data in saved["sketches"]["profiles"].items()}
@@ -0,0 +1,349 @@
+"""
+Columnar on-disk cache for the threat detection dataset.
+
+The Kaggle CSV is converted once into an Arrow IPC file (typed columns,
+dictionary-encoded strings, compressed buffers) that is opened through a
+memory map on every later start. A manifest next to the cache records the
+source file's size, mtime and content hash; any change rebuilds the cache.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.compute as pc  # type: ignore
+    import pyarrow.csv as pacsv  # type: ignore
+    import pyarrow.ipc as ipc  # type: ignore
+except ImportError:  # pragma: no cover
+    pa = None  # type: ignore
+
+
+logger = logging.getLogger("cyberguard")
+
+DEFAULT_DATASET_PATH = os.getenv(
+    "CYBERGUARD_DATASET_PATH",
+    "/root/.cache/kagglehub/datasets/aryan208/cybersecurity-threat-detection-logs/versions/1/cybersecurity_threat_detection_logs.csv",
+)
+DEFAULT_CACHE_DIR = os.getenv(
+    "CYBERGUARD_DATASET_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cyberguard", "datasets", "columnar"),
+)
+
+# Bump when the on-disk layout changes so old caches are rebuilt.
+CACHE_FORMAT_VERSION = 1
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _DictionaryEncoder:
+    """Grows one dictionary across batches so the IPC file only carries deltas."""
+
+    def __init__(self) -> None:
+        self.dictionary = pa.array([], type=pa.string())
+
+    def encode(self, column: "pa.Array") -> "pa.DictionaryArray":
+        if pa.types.is_dictionary(column.type):
+            column = column.dictionary_decode()
+        uniques = pc.unique(column).drop_null()
+        new_values = uniques.filter(pc.invert(pc.is_in(uniques, value_set=self.dictionary)))
+        if len(new_values):
+            self.dictionary = pa.concat_arrays([self.dictionary, new_values.cast(pa.string())])
+        indices = pc.index_in(column, value_set=self.dictionary).cast(pa.int32())
+        return pa.DictionaryArray.from_arrays(indices, self.dictionary)
+
+
+class DatasetStore:
+    """
+    Memory-mapped columnar view of the threat dataset CSV.
+
+    `ensure()` converts the CSV on first use (or when it changed), `take()`
+    and `take_table()` read individual rows by decoding only the file batches
+    that hold them, `table` returns the whole Arrow table and `to_pandas()`
+    gives the legacy DataFrame with categorical string columns.
+    """
+
+    def __init__(
+        self,
+        source_path: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        compression: Optional[str] = os.getenv("CYBERGUARD_DATASET_COMPRESSION", "zstd"),
+        block_size: int = 16 << 20,
+        dictionary_max_ratio: float = 0.5,
+    ) -> None:
+        if pa is None:
+            raise ImportError("pyarrow is not installed. Install with: pip install pyarrow")
+        self.source_path = source_path or DEFAULT_DATASET_PATH
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.compression = compression or None
+        self.block_size = block_size
+        # String columns whose first block has fewer distinct values than this
+        # share of rows are dictionary-encoded; near-unique columns stay plain.
+        self.dictionary_max_ratio = dictionary_max_ratio
+        stem = os.path.splitext(os.path.basename(self.source_path))[0]
+        self.cache_path = os.path.join(self.cache_dir, f"{stem}.arrow")
+        self.manifest_path = os.path.join(self.cache_dir, f"{stem}.manifest.json")
+        self._table: Optional["pa.Table"] = None
+        self._manifest: Optional[Dict[str, Any]] = None
+        # First row id of every file batch, plus the total row count
+        self._batch_starts: Optional[np.ndarray] = None
+
+    # ------- fingerprinting -------
+    def _stat(self) -> Dict[str, int]:
+        st = os.stat(self.source_path)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def is_fresh(self, verify_hash: bool = False) -> bool:
+        """
+        True when the cache matches the source CSV.
+
+        Size and mtime are compared first; if either moved, the content hash
+        decides (a touched but identical file keeps its cache). `verify_hash`
+        forces the hash comparison even when size and mtime agree.
+        """
+        manifest = self._read_manifest()
+        if not manifest or manifest.get("version") != CACHE_FORMAT_VERSION:
+            return False
+        if not os.path.exists(self.cache_path) or not os.path.exists(self.source_path):
+            return False
+        stat = self._stat()
+        source = manifest.get("source", {})
+        same_stat = source.get("size") == stat["size"] and source.get("mtime_ns") == stat["mtime_ns"]
+        if same_stat and not verify_hash:
+            self._manifest = manifest
+            return True
+        if source.get("size") != stat["size"]:
+            return False
+        if file_sha256(self.source_path) != source.get("sha256"):
+            return False
+        # Content unchanged: refresh the recorded mtime so the fast path hits next time
+        source.update(stat)
+        self._write_manifest(manifest)
+        self._manifest = manifest
+        return True
+
+    # ------- conversion -------
+    def _convert_batches(self) -> Iterator["pa.RecordBatch"]:
+        reader = pacsv.open_csv(
+            self.source_path,
+            read_options=pacsv.ReadOptions(block_size=self.block_size),
+        )
+        encoders: Dict[str, _DictionaryEncoder] = {}
+        decided = False
+        for batch in reader:
+            if not decided:
+                for name, column in zip(batch.schema.names, batch.columns):
+                    if not pa.types.is_string(column.type) or len(column) == 0:
+                        continue
+                    distinct = len(pc.unique(column))
+                    if distinct <= self.dictionary_max_ratio * len(column):
+                        encoders[name] = _DictionaryEncoder()
+                decided = True
+            arrays: List["pa.Array"] = []
+            for name, column in zip(batch.schema.names, batch.columns):
+                enc = encoders.get(name)
+                arrays.append(enc.encode(column) if enc is not None else column)
+            yield pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+    def build(self) -> None:
+        """Convert the source CSV into the columnar cache (atomic replace)."""
+        if not os.path.exists(self.source_path):
+            raise FileNotFoundError(f"Dataset file not found: {self.source_path}")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        started = time.time()
+        stat = self._stat()
+        sha256 = file_sha256(self.source_path)
+        tmp = self.cache_path + ".tmp"
+        options = ipc.IpcWriteOptions(compression=self.compression, emit_dictionary_deltas=True)
+        rows = 0
+        batch_rows: List[int] = []
+        writer = None
+        try:
+            for batch in self._convert_batches():
+                if writer is None:
+                    writer = ipc.new_file(tmp, batch.schema, options=options)
+                writer.write_batch(batch)
+                rows += batch.num_rows
+                batch_rows.append(batch.num_rows)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise ValueError(f"Dataset file is empty: {self.source_path}")
+        self._table = None
+        self._batch_starts = None
+        os.replace(tmp, self.cache_path)
+        self._manifest = {
+            "version": CACHE_FORMAT_VERSION,
+            "source": {"path": self.source_path, "sha256": sha256, **stat},
+            "rows": rows,
+            "batch_rows": batch_rows,
+            "compression": self.compression,
+            "built_at": time.time(),
+        }
+        self._write_manifest(self._manifest)
+        logger.info(f"✅ Columnar dataset cache built: {rows:,} rows in {time.time() - started:.1f}s -> {self.cache_path}")
+
+    def ensure(self) -> str:
+        """Return the cache path, (re)building it if the source changed."""
+        if self._manifest is not None and os.path.exists(self.cache_path):
+            return self.cache_path
+        if not self.is_fresh():
+            logger.info("🔄 Converting dataset CSV to columnar cache (one-time operation)...")
+            self.build()
+        return self.cache_path
+
+    # ------- access -------
+    @property
+    def fingerprint(self) -> str:
+        """Content hash of the source CSV the cache was built from."""
+        self.ensure()
+        return str((self._manifest or {}).get("source", {}).get("sha256", ""))
+
+    def _open_reader(self) -> "ipc.RecordBatchFileReader":
+        self.ensure()
+        return ipc.open_file(pa.memory_map(self.cache_path, "r"))
+
+    @property
+    def table(self) -> "pa.Table":
+        """
+        Whole dataset as one table. Zero-copy for an uncompressed cache; a
+        compressed one is decompressed onto the heap in full, so row access
+        goes through `take_table` instead.
+        """
+        if self._table is None:
+            self._table = self._open_reader().read_all()
+        return self._table
+
+    @property
+    def schema(self) -> "pa.Schema":
+        return self._open_reader().schema
+
+    @property
+    def num_rows(self) -> int:
+        self.ensure()
+        return int((self._manifest or {}).get("rows", 0))
+
+    @property
+    def columns(self) -> List[str]:
+        return self.schema.names
+
+    def iter_batches(self, columns: Optional[List[str]] = None, max_rows: int = 262_144) -> Iterator["pa.RecordBatch"]:
+        """
+        Yield record batches of at most `max_rows` rows.
+
+        Batches are read (and decompressed) one at a time from the memory map,
+        so a full sweep never holds more than one file batch in memory.
+        """
+        if self._table is not None:
+            table = self._table.select(columns) if columns else self._table
+            yield from table.to_batches(max_chunksize=max_rows)
+            return
+        reader = self._open_reader()
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns:
+                batch = batch.select(columns)
+            for offset in range(0, batch.num_rows, max_rows):
+                yield batch.slice(offset, max_rows)
+
+    def batch_starts(self) -> np.ndarray:
+        """First row id of every file batch, followed by the row count."""
+        if self._batch_starts is None:
+            self.ensure()
+            rows = (self._manifest or {}).get("batch_rows")
+            if rows is None:
+                # Cache built before batch sizes were recorded: one sweep, a batch at a time
+                reader = self._open_reader()
+                rows = [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+            self._batch_starts = np.concatenate([[0], np.cumsum(rows, dtype=np.int64)]).astype(np.int64)
+        return self._batch_starts
+
+    def read_batch(self, i: int, columns: Optional[List[str]] = None) -> "pa.RecordBatch":
+        """File batch `i` (rows batch_starts()[i] to batch_starts()[i + 1]), decoded on its own."""
+        batch = self._open_reader().get_batch(i)
+        return batch.select(columns) if columns else batch
+
+    def take_table(self, row_ids: Any, columns: Optional[List[str]] = None) -> "pa.Table":
+        """
+        The given rows, in the given order. Only the file batches holding them
+        are read, one at a time, so memory is proportional to len(row_ids)
+        plus one decoded batch.
+        """
+        ids = np.asarray(row_ids, dtype=np.int64)
+        if self._table is not None:
+            table = self._table.select(columns) if columns else self._table
+            return table.take(pa.array(ids))
+        starts = self.batch_starts()
+        if ids.size and (ids.min() < 0 or ids.max() >= starts[-1]):
+            raise IndexError("row id out of range")
+        which = np.searchsorted(starts, ids, side="right") - 1
+        order = np.argsort(which, kind="stable")
+        bounds = np.flatnonzero(np.diff(which[order])) + 1
+        reader = self._open_reader()
+        parts: List["pa.RecordBatch"] = []
+        for group in np.split(order, bounds) if ids.size else []:
+            b = int(which[group[0]])
+            batch = reader.get_batch(b)
+            if columns:
+                batch = batch.select(columns)
+            parts.append(batch.take(pa.array(ids[group] - starts[b])))
+        if not parts:
+            schema = reader.schema
+            if columns:
+                schema = pa.schema([schema.field(name) for name in columns])
+            return schema.empty_table()
+        table = pa.Table.from_batches(parts)
+        # Back from batch order to the requested order
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(order.size)
+        return table.take(pa.array(inverse))
+
+    def take(self, row_ids: Any) -> List[Dict[str, Any]]:
+        """Materialize the given rows as plain dicts (cost proportional to len(row_ids))."""
+        if len(row_ids) == 0:
+            return []
+        return self.take_table(row_ids).to_pylist()
+
+    def to_pandas(self) -> Any:
+        return self.table.to_pandas()
+
+
+_default_store: Optional[DatasetStore] = None
+
+
+def get_default_store() -> Optional[DatasetStore]:
+    """Process-wide store for the default dataset path (None if missing)."""
+    global _default_store
+    if pa is None or not os.path.exists(DEFAULT_DATASET_PATH):
+        return None
+    if _default_store is None:
+        _default_store = DatasetStore(DEFAULT_DATASET_PATH)
+    return _default_store
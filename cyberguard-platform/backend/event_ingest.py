@@ -0,0 +1,261 @@
+"""
+Batched, backpressured ingestion of security events into MongoDB.
+
+Request handlers and loops call `submit` (a deque append under a lock) and
+return at once. A worker thread drains the queue in batches: inserts go out
+as one unordered `insert_many`, followed by the batch's updates (reasoning
+added to an event later) as one unordered `bulk_write`. Updates always
+refer to events submitted before them, so they never overtake their insert.
+
+Failed writes are retried with exponential backoff and full jitter. The
+driver assigns `_id`s before the first attempt, so a retry of a partly
+written batch only re-inserts what is missing. On a first attempt a
+duplicate-key error means the event was already stored and is counted in
+`duplicates`; on a retry it means an earlier attempt wrote the document
+before failing, so it is counted as `inserted`. A batch still failing
+after `max_retries` is dropped and counted.
+
+The queue is bounded; when it is full the overflow policy applies:
+
+- "drop_oldest": evict the oldest queued event (the default: during an
+  attack storm recent events matter most).
+- "drop_newest": discard the incoming event.
+- "reject": discard it, and `accepting` turns False so API handlers can
+  answer 503 before doing any work.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from sketches import QuantileSketch
+
+try:
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+except ImportError:  # pragma: no cover
+    UpdateOne = None  # type: ignore
+
+    class BulkWriteError(Exception):  # type: ignore[no-redef]
+        details: Dict[str, Any] = {}
+
+
+logger = logging.getLogger("cyberguard")
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "reject")
+
+DUPLICATE_KEY = 11000
+
+
+class _Item:
+    __slots__ = ("doc", "update", "submitted_at")
+
+    def __init__(self, doc: Optional[Dict[str, Any]], update: Optional[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        self.doc = doc
+        self.update = update
+        self.submitted_at = time.monotonic()
+
+
+class EventIngest:
+    def __init__(
+        self,
+        collection: Callable[[], Optional[Any]],
+        max_queue: int = 10000,
+        max_batch: int = 500,
+        interval_sec: float = 0.25,
+        policy: str = "drop_oldest",
+        max_retries: int = 5,
+        backoff_sec: float = 0.2,
+        max_backoff_sec: float = 10.0,
+    ) -> None:
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(OVERFLOW_POLICIES)}")
+        # Called per batch: the database may come and go
+        self._collection = collection
+        self.max_queue = max(1, max_queue)
+        self.max_batch = max(1, max_batch)
+        self.interval_sec = interval_sec
+        self.policy = policy
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self._queue: Deque[_Item] = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._rng = random.Random()
+        self.submitted = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.updated = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.unavailable = 0
+        self.last_batch_size = 0
+        self.max_batch_seen = 0
+        self.lag = QuantileSketch()
+
+    @property
+    def accepting(self) -> bool:
+        """False while the queue is full under the "reject" policy."""
+        return self.policy != "reject" or len(self._queue) < self.max_queue
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="event-ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Write what is queued (one pass, no retries) and stop the worker (blocking)."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def submit(self, doc: Dict[str, Any]) -> bool:
+        """Queue an event for insertion; False if the overflow policy discarded it."""
+        return self._put(_Item(doc, None))
+
+    def submit_update(self, filter: Dict[str, Any], update: Dict[str, Any]) -> bool:
+        """Queue an update of an already submitted event, applied after its insert."""
+        return self._put(_Item(None, (filter, update)))
+
+    def _put(self, item: _Item) -> bool:
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                if self.policy == "drop_oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                else:
+                    self.rejected += 1
+                    return False
+            self._queue.append(item)
+            self.submitted += 1
+            full = len(self._queue) >= self.max_batch
+        if full:
+            self._wake.set()
+        return True
+
+    def _take(self) -> List[_Item]:
+        with self._lock:
+            n = min(self.max_batch, len(self._queue))
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval_sec)
+            self._wake.clear()
+            stopping = self._stopping
+            while True:
+                batch = self._take()
+                if not batch:
+                    break
+                self._write(batch, retries=0 if stopping else self.max_retries)
+            if stopping:
+                return
+
+    def _write(self, batch: List[_Item], retries: int) -> None:
+        docs = [item.doc for item in batch if item.doc is not None]
+        updates = [item.update for item in batch if item.update is not None]
+        attempt = 0
+        while True:
+            collection = self._collection()
+            if collection is None or UpdateOne is None:
+                with self._lock:
+                    self.unavailable += len(batch)
+                return
+            try:
+                docs = self._insert(collection, docs, retry=attempt > 0)
+                if docs:
+                    raise RuntimeError(f"{len(docs)} event inserts failed")
+                if updates:
+                    collection.bulk_write([UpdateOne(f, u) for f, u in updates], ordered=False)
+                    with self._lock:
+                        self.updated += len(updates)
+                    updates = []
+                break
+            except Exception as e:
+                if attempt >= retries:
+                    logger.debug(f"Dropping {len(docs) + len(updates)} security event writes after {attempt + 1} attempts: {e}")
+                    with self._lock:
+                        self.failed += len(docs) + len(updates)
+                    return
+                # full jitter: uniform in [0, capped exponential]
+                delay = self._rng.uniform(0.0, min(self.max_backoff_sec, self.backoff_sec * (2 ** attempt)))
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+        done = time.monotonic()
+        with self._lock:
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.lag.update([done - item.submitted_at for item in batch])
+
+    def _insert(self, collection: Any, docs: List[Dict[str, Any]], retry: bool = False) -> List[Dict[str, Any]]:
+        """
+        Insert docs and return the ones that still need a retry (errors other
+        than partial failures raise). Duplicate keys on a retry are documents
+        an earlier attempt wrote, so they count as inserted.
+        """
+        if not docs:
+            return docs
+        remaining: List[Dict[str, Any]] = []
+        try:
+            collection.insert_many(docs, ordered=False)
+            written = len(docs)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            duplicates = sum(1 for err in errors if err.get("code") == DUPLICATE_KEY)
+            failed = {err["index"] for err in errors if err.get("code") != DUPLICATE_KEY}
+            remaining = [doc for i, doc in enumerate(docs) if i in failed]
+            written = len(docs) - len(failed)
+            if not retry:
+                written -= duplicates
+                with self._lock:
+                    self.duplicates += duplicates
+        with self._lock:
+            self.inserted += written
+        return remaining
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest = self._queue[0].submitted_at if self._queue else None
+            return {
+                "policy": self.policy,
+                "running": self._thread is not None,
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "accepting": self.accepting,
+                "oldest_queued_sec": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                "submitted": self.submitted,
+                "inserted": self.inserted,
+                "updated": self.updated,
+                "duplicates": self.duplicates,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "unavailable": self.unavailable,
+                "batches": self.batches,
+                "retries": self.retries,
+                "batch_size": {"last": self.last_batch_size, "max": self.max_batch_seen},
+                "lag_sec": {
+                    "p50": self.lag.quantile(0.5),
+                    "p95": self.lag.quantile(0.95),
+                    "max": self.lag.quantile(1.0),
+                },
+            }
@@ -1,14 +1,15 @@
 import asyncio
+import json
 import logging
 import os
 import time
-from typing import Any, Dict, List, Set
+from typing import AbstractSet, Any, Dict, List, Optional, Set
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
+from fastapi import Depends, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request
 from starlette.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 import models  # type: ignore
 from database import db_state
@@ -16,6 +17,17 @@ from node_simulator import NodeSimulator
 from ai_engine import AIEngine
 from langgraph_workflows import run_workflow
 from metrics import metrics
+from dataset_store import DEFAULT_DATASET_PATH, get_default_store
+from dataset_stats import SKETCH_COLUMNS, load_or_compute_profiles, load_or_compute_stats
+from dataset_index import DatasetIndex
+from dataset_sampling import DatasetSampler
+from dataset_export import EXPORT_FORMATS, iter_export
+from replay import DatasetReplay, ReplayFrame
+from ws_encoding import ENCODERS
+from ws_fanout import FanoutHub, Subscription
+from write_behind import WriteBehind
+from event_ingest import EventIngest
+from node_stream import NodeStream, narrow as narrow_stream
 import io
 import csv
 from pydantic import BaseModel, Field
@@ -29,6 +41,10 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 _dataset_df = None
 _dataset_cache = None
 _dataset_loaded = False
+_dataset_index = None
+_dataset_index_lock = asyncio.Lock()
+_dataset_sampler = None
+_dataset_profiles = None
 
 def load_dataset():
     """Load dataset once and cache it"""
@@ -38,17 +54,20 @@ def load_dataset():
         return _dataset_df
     
     try:
-        import pandas as pd
-        import os
-        
-        dataset_path = "/root/.cache/kagglehub/datasets/aryan208/cybersecurity-threat-detection-logs/versions/1/cybersecurity_threat_detection_logs.csv"
-        
-        if not os.path.exists(dataset_path):
-            logger.error("Dataset file not found!")
+        if not os.path.exists(DEFAULT_DATASET_PATH):
+            logger.error(f"Dataset file not found: {DEFAULT_DATASET_PATH}")
             return None
         
-        logger.info("🔄 Loading 6M dataset into memory (one-time operation)...")
-        _dataset_df = pd.read_csv(dataset_path)
+        store = get_default_store()
+        if store is None:
+            # Without pyarrow there is no columnar cache: parse the CSV directly
+            import pandas as pd
+            
+            logger.warning("pyarrow is not installed; loading the dataset CSV with pandas (no columnar cache)")
+            _dataset_df = pd.read_csv(DEFAULT_DATASET_PATH)
+        else:
+            logger.info("🔄 Opening columnar dataset cache...")
+            _dataset_df = store.to_pandas()
         _dataset_loaded = True
         logger.info(f"✅ Dataset loaded! {len(_dataset_df):,} records cached in memory")
         
@@ -58,17 +77,26 @@ def load_dataset():
         return None
 
 
-class ConnectionManager:
-    def __init__(self) -> None:
-        self.active: List[WebSocket] = []
+async def get_dataset_index() -> Optional[DatasetIndex]:
+    """Open (or build once, off the event loop) the row-id index over the dataset"""
+    global _dataset_index
+    
+    if _dataset_index is not None:
+        return _dataset_index
+    
+    store = get_default_store()
+    if store is None:
+        return None
+    
+    async with _dataset_index_lock:
+        if _dataset_index is None:
+            _dataset_index = await asyncio.to_thread(DatasetIndex.load_or_build, store)
+            logger.info(f"✅ Dataset index ready for {_dataset_index.num_rows:,} rows")
+    return _dataset_index
 
-    async def connect(self, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self.active.append(websocket)
 
-    def disconnect(self, websocket: WebSocket) -> None:
-        if websocket in self.active:
-            self.active.remove(websocket)
+class ConnectionManager(FanoutHub):
+    """Fan-out hub plus the message shapes the UI expects."""
 
     async def broadcast(self, message: Dict[str, Any]) -> None:
         # Add 'event' alias for clients expecting it
@@ -88,18 +116,75 @@ class ConnectionManager:
                     msg["data"] = d
         except Exception:
             pass
-        stale: List[WebSocket] = []
-        for ws in list(self.active):
-            try:
-                await ws.send_json(msg)
-            except Exception:
-                stale.append(ws)
-        for ws in stale:
-            self.disconnect(ws)
-
-
-manager = ConnectionManager()
-simulator = NodeSimulator(node_count=5)
+        data = msg.get("data")
+        node_id = severity = None
+        if isinstance(data, dict):
+            node_id = data.get("node_id", data.get("id") if msg.get("type") == "node_update" else None)
+            severity = data.get("severity")
+        self.publish(
+            msg,
+            key=coalesce_key(msg),
+            topic=message_topic(msg),
+            # fleet-wide events ("all") reach every node filter
+            node_id=None if node_id in (None, "all") else str(node_id),
+            severity=severity,
+            narrow=narrow_to_nodes,
+        )
+
+
+# Topics a client can subscribe to; a message's topic is its type except
+# where noted in TOPIC_OF
+TOPICS = ("nodes", "node_update", "metrics_update", "security_event", "ai_decision", "load_redistributed")
+TOPIC_OF = {"snapshot": "nodes", "delta": "nodes", "ai_decision_update": "ai_decision"}
+
+
+def message_topic(msg: Dict[str, Any]) -> Optional[str]:
+    kind = msg.get("type")
+    return TOPIC_OF.get(kind, kind) if kind is not None else None
+
+
+def narrow_to_nodes(msg: Dict[str, Any], nodes: AbstractSet[str]) -> Dict[str, Any]:
+    """A fleet-wide message cut down to a subscriber's nodes."""
+    if "rows" in msg:
+        return narrow_stream(msg, nodes)
+    if isinstance(msg.get("data"), list):
+        return {**msg, "data": [item for item in msg["data"] if item.get("id") in nodes]}
+    return msg
+
+
+def coalesce_key(msg: Dict[str, Any]) -> Optional[str]:
+    """State messages a newer one can replace in a slow client's queue; events are never coalesced."""
+    kind = msg.get("type")
+    if kind == "node_update" and isinstance(msg.get("data"), dict):
+        return f"node_update:{msg['data'].get('id')}"
+    return None
+
+
+simulator = NodeSimulator(
+    node_count=int(os.getenv("SIM_NODE_COUNT", "5")),
+    seed=int(os.environ["SIM_SEED"]) if os.getenv("SIM_SEED") else None,
+)
+manager = ConnectionManager(
+    max_queue=int(os.getenv("WS_MAX_QUEUE", "256")),
+    policy=os.getenv("WS_SLOW_CLIENT_POLICY", "coalesce"),
+)
+# Fleet state goes out as one sequenced delta per tick (snapshots on connect / resync)
+node_stream = NodeStream(simulator, rel_tolerance=float(os.getenv("WS_DELTA_TOLERANCE", "0.01")))
+# Node state reaches Mongo through a write-behind worker thread
+node_writer = WriteBehind(
+    lambda: db_state.db["nodes"] if db_state.mongo_ok and db_state.db is not None else None,
+    interval_sec=float(os.getenv("MONGO_FLUSH_INTERVAL_SEC", "1.0")),
+    max_batch=int(os.getenv("MONGO_BULK_WRITE_SIZE", "1000")),
+)
+# Security events are queued and inserted in batches by a worker thread
+event_ingest = EventIngest(
+    lambda: db_state.db["events"] if db_state.mongo_ok and db_state.db is not None else None,
+    max_queue=int(os.getenv("EVENT_QUEUE_MAX", "10000")),
+    max_batch=int(os.getenv("EVENT_BATCH_SIZE", "500")),
+    interval_sec=float(os.getenv("EVENT_FLUSH_INTERVAL_SEC", "0.25")),
+    policy=os.getenv("EVENT_OVERFLOW_POLICY", "drop_oldest"),
+    max_retries=int(os.getenv("EVENT_MAX_RETRIES", "5")),
+)
 server_started = time.time()
 engine = AIEngine()
 
@@ -120,6 +205,7 @@ async def http_exc_handler(_: Request, exc: HTTPException) -> JSONResponse:
     return JSONResponse(
         status_code=exc.status_code,
         content={"error": {"message": exc.detail, "code": exc.status_code}},
+        headers=exc.headers,
     )
 
 
@@ -164,6 +250,16 @@ def rate_limit_or_429(request: Request) -> None:
         raise HTTPException(status_code=429, detail="Rate limit exceeded. Please retry later.")
 
 
+def event_backpressure_or_503() -> None:
+    """Refuse new events up front while the ingest queue is full under the "reject" policy."""
+    if not event_ingest.accepting:
+        raise HTTPException(
+            status_code=503,
+            detail="Security event ingestion is saturated. Please retry later.",
+            headers={"Retry-After": "1"},
+        )
+
+
 # ------- UX: runtime settings (for config UI) -------
 class AppSettings(BaseModel):
     refresh_rate_sec: float = Field(default=3.0, ge=1.0, le=60.0)
@@ -225,51 +321,63 @@ def event_to_frontend(e: models.SecurityEvent) -> Dict[str, Any]:
 async def metrics_loop() -> None:
     while True:
         await asyncio.sleep(2.0)
-        simulator.tick()
-        # Record metrics for AI baselines
-        for node in simulator.nodes.values():
-            engine.record(node)
+        # A running dataset replay writes the metrics (and records them) itself
+        if _replay is None or not _replay.running:
+            simulator.tick()
+            # Record metrics for AI baselines (one vectorized write for the fleet)
+            engine.record_fleet(simulator.ids, simulator.metrics)
+        # Per-node dicts are built only when a store will take them (at 100k
+        # nodes they cost more than the rest of the tick), and at most once
+        snapshot: Optional[List[Dict[str, Any]]] = None
         # Cache snapshot in Redis if available
         try:
             if db_state.redis_ok and db_state.redis_client is not None:
-                payload = {n.id: n.model_dump() for n in simulator.nodes.values()}
+                snapshot = simulator.node_dicts()
+                payload = {n["id"]: n for n in snapshot}
                 db_state.redis_client.setex(
                     "realtime:nodes", 5, __import__("json").dumps(payload)
                 )
         except Exception:
             pass
-        # persist nodes if DB available (best-effort)
+        # persist nodes if DB available (best-effort, bulk upserts off the event loop)
         if db_state.mongo_ok and db_state.db is not None:
-            try:
-                payload = [n.model_dump() for n in simulator.nodes.values()]
-                # upsert per id
-                for doc in payload:
-                    db_state.db["nodes"].update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
-            except Exception as e:
-                logger.debug(f"Mongo persist nodes failed: {e}")
-
-        # Broadcast a batch update for native clients
-        await manager.broadcast({
-            "type": "metrics_update",
-            "data": [n.model_dump() for n in simulator.nodes.values()],
-        })
-        # And per-node updates for the UI that expects 'node_update'
-        for n in simulator.nodes.values():
-            await manager.broadcast({
-                "type": "node_update",
-                "data": node_to_frontend(n),
-            })
+            node_writer.put_many(snapshot if snapshot is not None else simulator.node_dicts())
+
+        # One frame per tick with only the nodes that changed; clients that
+        # are behind get a fresh snapshot in its place
+        manager.publish(
+            node_stream.delta(time.time()),
+            key="nodes",
+            resync=node_stream.snapshot,
+            topic="nodes",
+            narrow=narrow_stream,
+        )
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
     await db_state.init()
     simulator.init_nodes()
+    node_writer.start()
+    event_ingest.start()
     asyncio.create_task(metrics_loop())
     asyncio.create_task(ai_monitor_loop())
     logger.info("CyberGuard backend started")
 
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    if _replay is not None:
+        _replay.stop()
+    if engine.models is not None:
+        engine.models.shutdown()
+    if engine.reasoner is not None:
+        engine.reasoner.shutdown()
+    # last flush of node state and queued events
+    await asyncio.to_thread(node_writer.stop)
+    await asyncio.to_thread(event_ingest.stop)
+
+
 @app.get("/")
 async def root() -> Dict[str, str]:
     return {"status": "ok", "service": "cyberguard-backend"}
@@ -419,6 +527,8 @@ async def api_attack(node_id: str, kind: str, request: Request) -> Dict[str, Any
             },
         })
         return {"status": "started", "node_id": node_id}
+    # Only this path queues a security event, so only it waits on ingestion
+    event_backpressure_or_503()
     # Map to simulate_threat for other kinds
     severity = {
         "exfiltration": "high",
@@ -428,10 +538,7 @@ async def api_attack(node_id: str, kind: str, request: Request) -> Dict[str, Any
     body = models.SimulateThreatBody(node_id=node_id, type=kind, severity=severity)  # type: ignore[arg-type]
     evt = simulator.simulate_threat(node_id=node_id, body=body)
     if db_state.mongo_ok and db_state.db is not None:
-        try:
-            db_state.db["events"].insert_one(evt.model_dump())
-        except Exception as e:
-            logger.debug(f"Mongo insert event failed: {e}")
+        event_ingest.submit(evt.model_dump())
     await manager.broadcast({"type": "security_event", "data": evt.model_dump()})
     return {"status": "ok", "event": event_to_frontend(evt)}
 
@@ -439,13 +546,11 @@ async def api_attack(node_id: str, kind: str, request: Request) -> Dict[str, Any
 @app.post("/simulate-threat/{node_id}", response_model=models.SecurityEvent)
 async def simulate_threat(node_id: str, request: Request, body: models.SimulateThreatBody | None = None) -> models.SecurityEvent:
     rate_limit_or_429(request)
+    event_backpressure_or_503()
     evt = simulator.simulate_threat(node_id=node_id, body=body)
-    # persist event if possible
+    # persist event if possible (queued; written in batches off the request path)
     if db_state.mongo_ok and db_state.db is not None:
-        try:
-            db_state.db["events"].insert_one(evt.model_dump())
-        except Exception as e:
-            logger.debug(f"Mongo insert event failed: {e}")
+        event_ingest.submit(evt.model_dump())
     await manager.broadcast({"type": "security_event", "data": evt.model_dump()})
     return evt
 
@@ -507,34 +612,66 @@ async def api_metrics_csv() -> Response:
     return await claim_metrics_csv()
 
 
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def enrich_and_broadcast(analysis: models.AIAnalysisResult) -> None:
+    """Replace a published decision's heuristic reasoning with the LLM answer."""
+    try:
+        enriched = await engine.enrich(analysis)
+    except Exception as e:
+        logger.debug(f"AI reasoning enrichment failed: {e}")
+        return
+    if enriched is None:
+        return
+    # Same node_id and timestamp as the original, so clients update it in place
+    await manager.broadcast({"type": "ai_decision_update", "data": enriched.model_dump()})
+    if db_state.mongo_ok and db_state.db is not None:
+        # Through the ingest queue so it cannot overtake the event's insert
+        event_ingest.submit_update(
+            {"node_id": enriched.node_id, "type": "ai_detection", "timestamp": enriched.timestamp},
+            {"$set": {"reasoning": enriched.reasoning}},
+        )
+
+
+def ai_event_doc(analysis: models.AIAnalysisResult) -> Dict[str, Any]:
+    return {
+        "id": f"ai-{int(time.time()*1000)}",
+        "node_id": analysis.node_id,
+        "type": "ai_detection",
+        "severity": analysis.severity,
+        "message": f"AI: {', '.join(analysis.anomalies)} -> {analysis.actions}",
+        "timestamp": analysis.timestamp,
+        "reasoning": analysis.reasoning,
+    }
+
+
+def schedule_enrichment(analysis: models.AIAnalysisResult) -> None:
+    if engine.reasoner is None:
+        return
+    task = asyncio.create_task(enrich_and_broadcast(analysis))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
 async def ai_monitor_loop() -> None:
     """Background loop for continuous AI monitoring."""
     interval = max(2.0, engine.monitor_interval_sec)
     while True:
         await asyncio.sleep(interval)
-        for node in list(simulator.nodes.values()):
-            analysis = engine.maybe_analyze(node)
-            if analysis is None:
-                continue
+        engine.refresh_models()
+        # One vectorized pass over the whole fleet; only findings come back
+        analyses = engine.analyze_fleet()
+        if _replay is not None and _replay.running:
+            _replay.observe(analyses)
+        for analysis in analyses:
             # Persist as an event for visibility
-            try:
-                if db_state.mongo_ok and db_state.db is not None:
-                    db_state.db["events"].insert_one(
-                        {
-                            "id": f"ai-{int(time.time()*1000)}",
-                            "node_id": analysis.node_id,
-                            "type": "ai_detection",
-                            "severity": analysis.severity,
-                            "message": f"AI: {', '.join(analysis.anomalies)} -> {analysis.actions}",
-                            "timestamp": analysis.timestamp,
-                            "reasoning": analysis.reasoning,
-                        }
-                    )
-            except Exception as e:
-                logger.debug(f"Mongo insert AI event failed: {e}")
+            if db_state.mongo_ok and db_state.db is not None:
+                event_ingest.submit(ai_event_doc(analysis))
 
             # Broadcast both a decision and a security_event for UI compatibility
             await manager.broadcast({"type": "ai_decision", "data": analysis.model_dump()})
+            schedule_enrichment(analysis)
             await manager.broadcast(
                 {
                     "type": "security_event",
@@ -559,6 +696,76 @@ async def ai_monitor_loop() -> None:
                 await manager.broadcast({"type": "load_redistributed", "data": {"node_id": analysis.node_id}})
 
 
+_replay: Optional[DatasetReplay] = None
+_replay_task: Optional[asyncio.Task] = None
+
+
+async def on_replay_frame(frame: ReplayFrame, events: List[models.SecurityEvent]) -> None:
+    """Show replayed traffic as the fleet's live metrics and publish its threat events."""
+    simulator.metrics = frame.metrics
+    simulator.last_update[:] = time.time()
+    for evt in events:
+        simulator.record_event(evt)
+        await manager.broadcast({"type": "security_event", "data": evt.model_dump()})
+
+
+@app.post("/api/replay/start")
+async def start_replay(
+    request: Request,
+    rate: float = 100.0,
+    tick_sec: float = 2.0,
+    start: str | None = None,
+    end: str | None = None,
+) -> Dict[str, Any]:
+    """Stream the dataset through the live pipeline at `rate` dataset seconds per second (1-1000)"""
+    global _replay, _replay_task
+    rate_limit_or_429(request)
+    if _replay is not None and _replay.running:
+        raise HTTPException(status_code=409, detail="A replay is already running")
+    index = await get_dataset_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    try:
+        replay = DatasetReplay(index.store, index, simulator.ids, rate=rate, tick_sec=tick_sec, start=start, end=end, engine=engine)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _replay = replay
+    # Set before the task first runs so the metrics loop stops ticking right away
+    replay.running = True
+    _replay_task = asyncio.create_task(replay.run(on_replay_frame))
+    return {"status": "started", **replay.status()}
+
+
+@app.post("/api/replay/stop")
+async def stop_replay(request: Request) -> Dict[str, Any]:
+    rate_limit_or_429(request)
+    if _replay is None:
+        raise HTTPException(status_code=404, detail="No replay has been started")
+    _replay.stop()
+    if _replay_task is not None:
+        await _replay_task
+    return {"status": "stopped", **_replay.status()}
+
+
+@app.get("/api/persistence/stats")
+async def persistence_stats() -> Dict[str, Any]:
+    """Node write-behind (pending writes, flush sizes, lag) and security event ingestion (queue, batches, drops, retries, lag)"""
+    return {"nodes": node_writer.stats(), "events": event_ingest.stats()}
+
+
+@app.get("/api/ws/stats")
+async def ws_stats() -> Dict[str, Any]:
+    """Per-client queue depth, drops and send lag of the WebSocket fan-out"""
+    return manager.stats()
+
+
+@app.get("/api/replay/status")
+async def replay_status() -> Dict[str, Any]:
+    if _replay is None:
+        return {"running": False}
+    return _replay.status()
+
+
 @app.post("/demo/ddos/{node_id}")
 async def demo_ddos(node_id: str, request: Request) -> Dict[str, object]:
     rate_limit_or_429(request)
@@ -620,6 +827,7 @@ async def ai_analyze(node_id: str) -> models.AIAnalysisResult:
     node = simulator.nodes.get(node_id)
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
+    event_backpressure_or_503()
     # Run both rule engine and workflow quickly; prefer engine result with workflow as corroboration
     res = engine.analyze_node(node)
     if res is None:
@@ -627,21 +835,9 @@ async def ai_analyze(node_id: str) -> models.AIAnalysisResult:
         res = run_workflow(node)
     # Broadcast and persist similar to the monitor
     await manager.broadcast({"type": "ai_decision", "data": res.model_dump()})
+    schedule_enrichment(res)
     if db_state.mongo_ok and db_state.db is not None:
-        try:
-            db_state.db["events"].insert_one(
-                {
-                    "id": f"ai-{int(time.time()*1000)}",
-                    "node_id": res.node_id,
-                    "type": "ai_detection",
-                    "severity": res.severity,
-                    "message": f"AI: {', '.join(res.anomalies)} -> {res.actions}",
-                    "timestamp": res.timestamp,
-                    "reasoning": res.reasoning,
-                }
-            )
-        except Exception as e:
-            logger.debug(f"Mongo insert AI event failed: {e}")
+        event_ingest.submit(ai_event_doc(res))
     return res
 
 
@@ -667,51 +863,160 @@ async def update_config(body: UpdateAppSettings) -> Dict[str, object]:
 
 
 @app.get("/api/dataset/sample")
-async def get_dataset_sample(limit: int = 5):
-    """Get a sample of the real threat dataset - uses cached data"""
+async def get_dataset_sample(limit: int = 5, seed: int | None = None, stratify: str | None = None):
+    """Get a random sample of the real threat dataset - O(limit) via the sampler"""
+    global _dataset_sampler
     try:
-        df = load_dataset()
+        index = await get_dataset_index()
         
-        if df is None:
+        if index is None:
             return {"error": "Dataset not found", "loaded": False}
         
-        # Get random samples for variety
-        sample = df.sample(n=min(limit, len(df)))
+        if _dataset_sampler is None or _dataset_sampler.index is not index:
+            _dataset_sampler = DatasetSampler(index)
+        limit = max(1, min(limit, 1000))
+        try:
+            row_ids = _dataset_sampler.sample(limit, seed=seed, stratify=stratify)
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e.args[0]))
+        records = index.store.take(row_ids)
         
         return {
             "loaded": True,
-            "total_records": len(df),
-            "sample_size": len(sample),
-            "records": sample.to_dict('records')
+            "total_records": index.num_rows,
+            "sample_size": len(records),
+            "seed": seed,
+            "stratify": stratify,
+            "records": records
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting dataset sample: {e}")
         return {"error": str(e), "loaded": False}
 
 
 @app.get("/api/dataset/malicious")
-async def get_malicious_attacks(limit: int = 20):
-    """Get real malicious attacks from the dataset - uses cached data"""
+async def get_malicious_attacks(limit: int = 20, cursor: str | None = None):
+    """Get real malicious attacks from the dataset - paged through the label index"""
     try:
-        df = load_dataset()
+        index = await get_dataset_index()
         
-        if df is None:
+        if index is None:
             return {"error": "Dataset not found"}
         
-        malicious = df[df['threat_label'] == 'malicious'].head(limit)
+        limit = max(1, min(limit, 1000))
+        try:
+            row_ids, next_cursor = index.page("threat_label", "malicious", cursor=cursor, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         return {
-            "total_malicious": len(df[df['threat_label'] == 'malicious']),
-            "records": malicious.to_dict('records')
+            "total_malicious": index.column("threat_label").count("malicious"),
+            "records": index.store.take(row_ids),
+            "next_cursor": next_cursor,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting malicious attacks: {e}")
         return {"error": str(e)}
 
 
+def dataset_filters(
+    protocol: List[str] | None = Query(None),
+    action: List[str] | None = Query(None),
+    log_type: List[str] | None = Query(None),
+    threat_label: List[str] | None = Query(None),
+    source_ip: List[str] | None = Query(None),
+    dest_ip: List[str] | None = Query(None),
+) -> Dict[str, List[str]]:
+    return {
+        "protocol": protocol or [],
+        "action": action or [],
+        "log_type": log_type or [],
+        "threat_label": threat_label or [],
+        "source_ip": source_ip or [],
+        "dest_ip": dest_ip or [],
+    }
+
+
+@app.get("/api/dataset/query")
+async def query_dataset(
+    filters: Dict[str, List[str]] = Depends(dataset_filters),
+    start: str | None = None,
+    end: str | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+    count_only: bool = False,
+):
+    """Filter the dataset through its bitmap indexes (values OR-ed per column, columns AND-ed)"""
+    try:
+        index = await get_dataset_index()
+        
+        if index is None:
+            return {"error": "Dataset not found"}
+        
+        try:
+            result = index.query(filters, start=start, end=end)
+            if count_only:
+                return {"total_matches": result.count()}
+            row_ids, next_cursor = result.page(cursor=cursor, limit=max(1, min(limit, 1000)))
+        except KeyError as e:
+            raise HTTPException(status_code=400, detail=str(e.args[0]))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        return {
+            "total_matches": result.count(),
+            "records": index.store.take(row_ids),
+            "next_cursor": next_cursor,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error querying dataset: {e}")
+        return {"error": str(e)}
+
+
+@app.get("/api/dataset/export")
+async def export_dataset(
+    filters: Dict[str, List[str]] = Depends(dataset_filters),
+    start: str | None = None,
+    end: str | None = None,
+    format: str = "ndjson",
+    max_rows: int | None = None,
+    batch_rows: int = 8192,
+) -> StreamingResponse:
+    """Stream a filtered slice of the dataset as NDJSON, CSV or an Arrow IPC stream"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    index = await get_dataset_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    try:
+        result = index.query(filters, start=start, end=end)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # A sync generator is iterated in the threadpool; each chunk is produced only
+    # after the previous one was sent, so slow readers throttle the export
+    chunks = iter_export(result, format, batch_rows=max(1, min(batch_rows, 65536)), max_rows=max_rows)
+    extension = {"ndjson": "ndjson", "csv": "csv", "arrow": "arrows"}[format]
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="threat_logs.{extension}"',
+            "X-Total-Matches": str(result.count() if max_rows is None else min(result.count(), max_rows)),
+        },
+    )
+
+
 @app.get("/api/dataset/stats")
 async def get_dataset_stats():
-    """Get dataset statistics - cached for performance"""
+    """Get dataset statistics - single pass over the columnar cache, persisted on disk"""
     global _dataset_cache
     
     try:
@@ -719,28 +1024,13 @@ async def get_dataset_stats():
         if _dataset_cache:
             return _dataset_cache
         
-        df = load_dataset()
+        store = get_default_store()
         
-        if df is None:
+        if store is None:
             return {"error": "Dataset not found", "loaded": False}
         
-        # Cache the statistics
-        _dataset_cache = {
-            "loaded": True,
-            "total_records": len(df),
-            "columns": df.columns.tolist(),
-            "threat_distribution": df['threat_label'].value_counts().to_dict(),
-            "protocol_distribution": df['protocol'].value_counts().head(10).to_dict(),
-            "top_paths": df['request_path'].value_counts().head(10).to_dict(),
-            "action_distribution": df['action'].value_counts().to_dict(),
-            "log_type_distribution": df['log_type'].value_counts().to_dict(),
-            "bytes_stats": {
-                "mean": float(df['bytes_transferred'].mean()),
-                "median": float(df['bytes_transferred'].median()),
-                "min": int(df['bytes_transferred'].min()),
-                "max": int(df['bytes_transferred'].max())
-            }
-        }
+        # Persisted stats load instantly; a cold computation runs off the event loop
+        _dataset_cache = await asyncio.to_thread(load_or_compute_stats, store)
         
         return _dataset_cache
     except Exception as e:
@@ -748,24 +1038,100 @@ async def get_dataset_stats():
         return {"error": str(e), "loaded": False}
 
 
+@app.get("/api/dataset/stats/top")
+async def get_dataset_top(column: str | None = None, k: int = 10, value: List[str] | None = Query(None)):
+    """Top talkers and distinct counts for paths, IPs and user agents (streaming sketches)"""
+    global _dataset_profiles
+    
+    if column is not None and column not in SKETCH_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"column must be one of {', '.join(SKETCH_COLUMNS)}")
+    if value and column is None:
+        raise HTTPException(status_code=400, detail="value lookups need a column")
+    try:
+        if _dataset_profiles is None:
+            store = get_default_store()
+            if store is None:
+                return {"error": "Dataset not found", "loaded": False}
+            _dataset_profiles = await asyncio.to_thread(load_or_compute_profiles, store)
+        
+        k = max(1, min(k, 100))
+        columns = [column] if column is not None else list(SKETCH_COLUMNS)
+        payload: Dict[str, Any] = {"loaded": True, "columns": {}}
+        for name in columns:
+            profile = _dataset_profiles.get(name)
+            if profile is None:
+                continue
+            entry = profile.summary(k)
+            if value:
+                # Count-Min upper bounds for arbitrary values, not just the top k
+                entry["estimates"] = {v: profile.estimate(v) for v in value}
+            payload["columns"][name] = entry
+        return payload
+    except Exception as e:
+        logger.error(f"Error getting dataset top values: {e}")
+        return {"error": str(e), "loaded": False}
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket) -> None:
-    await manager.connect(ws)
+    """
+    Clients get everything until they send a subscription, e.g.
+    {"op": "subscribe", "topics": ["nodes", "security_event"], "nodes": ["node-3"], "min_severity": "high"}
+    (omitted fields mean everything; {"op": "unsubscribe"} goes back to all).
+    `?encoding=json|msgpack|packed` picks the wire format (see ws_encoding).
+    """
+    encoding = ws.query_params.get("encoding", "json")
+    if encoding not in ENCODERS:
+        # 1008: policy violation (refused before the handshake completes)
+        await ws.close(code=1008)
+        return
+    await manager.connect(ws, encoding=encoding)
     try:
-        await ws.send_json({"type": "init", "data": [n.model_dump() for n in simulator.nodes.values()], "event": "init"})
-        # Bootstrap UI clients with initial per-node updates
-        for n in simulator.nodes.values():
-            await ws.send_json({"type": "node_update", "event": "node_update", "data": node_to_frontend(n)})
+        # One snapshot frame, queued like broadcasts so the deltas that follow stay in order
+        manager.send(ws, node_stream.snapshot(), key="nodes")
         while True:
-            _ = await ws.receive_text()  # simple keep-alive compat
-            await ws.send_text("pong")
+            text = await ws.receive_text()
+            if text == "resync":
+                # The client saw a gap in sequence numbers
+                manager.send(ws, node_stream.snapshot(), key="nodes", narrow=narrow_stream)
+            elif text.startswith("{"):
+                handle_ws_command(ws, text)
+            else:
+                manager.send(ws, "pong")  # simple keep-alive compat
     except WebSocketDisconnect:
         manager.disconnect(ws)
     except Exception:
         manager.disconnect(ws)
 
 
+def handle_ws_command(ws: WebSocket, text: str) -> None:
+    try:
+        command = json.loads(text)
+        op = command.get("op") if isinstance(command, dict) else None
+        if op == "subscribe":
+            subscription = Subscription.from_dict(command, known_topics=TOPICS)
+        elif op == "unsubscribe":
+            subscription = Subscription()
+        else:
+            raise ValueError(f"unknown op: {op!r}")
+    except (TypeError, ValueError) as e:
+        manager.send(ws, {"type": "error", "event": "error", "message": str(e)})
+        return
+    manager.subscribe(ws, subscription)
+    manager.send(ws, {"type": "subscribed", "event": "subscribed", "subscription": subscription.to_dict()})
+    if subscription.wants("nodes"):
+        # The node set may have grown: start the new view from a snapshot
+        manager.send(ws, node_stream.snapshot(), key="nodes", narrow=narrow_stream)
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=True,
+        # Compression per connection, negotiated with clients that offer it
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "1") != "0",
+    )
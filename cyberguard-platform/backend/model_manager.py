@@ -0,0 +1,210 @@
+"""
+Background-trained IsolationForest models for the traffic detector.
+
+Nodes are grouped into clusters (the whole fleet by default) and one model
+is trained per cluster on the recent history of all its nodes. The feature
+(`relative_traffic`) is how far a sample sits from its own node's baseline,
+log1p(traffic) - log1p(mean traffic of the node's other samples in the
+window), so nodes with different traffic volumes can share a model. Training
+and scoring compute it the same way, over the training depth and the
+baseline window respectively.
+
+Training runs in a process pool. A model is refreshed when it is older than
+`refresh_sec`, or when the cluster's live features drift away from the live
+features seen when it was trained, but never sooner than `min_retrain_sec`
+after the last one, so a sustained attack cannot retrain it every tick. A
+failed fit is retried after an exponential backoff. Finished models replace
+the old version in one reference assignment, so scoring never sees a
+half-updated state. Scoring builds the
+feature column for every node and makes one `decision_function` call per
+cluster per tick.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from node_history import NETWORK_IN, NETWORK_OUT, FleetHistory, RollingWindow
+
+try:
+    from sklearn.ensemble import IsolationForest  # type: ignore
+except Exception:  # pragma: no cover
+    IsolationForest = None  # type: ignore
+
+
+logger = logging.getLogger("cyberguard")
+
+
+class ModelVersion(NamedTuple):
+    model: object
+    version: int
+    trained_at: float
+    samples: int
+    # Drift reference: mean of the cluster's live features when training
+    # started, and the spread of the training set as the unit of drift
+    mean: float
+    std: float
+
+
+def relative_traffic(current: np.ndarray, total: np.ndarray, count: np.ndarray) -> np.ndarray:
+    """log1p(current) - log1p(mean of the other count - 1 samples summing to total - current)."""
+    baseline = (total - current) / np.maximum(1, count - 1)
+    return np.log1p(current) - np.log1p(np.maximum(0.0, baseline))
+
+
+def _fit_forest(xs: np.ndarray, n_estimators: int, contamination: float, seed: int) -> object:
+    """Runs in a worker process."""
+    model = IsolationForest(n_estimators=n_estimators, contamination=contamination, random_state=seed)
+    model.fit(xs)
+    return model
+
+
+class ModelManager:
+    def __init__(
+        self,
+        history: FleetHistory,
+        baseline: RollingWindow,
+        refresh_sec: float = 300.0,
+        min_retrain_sec: float = 30.0,
+        drift_sigma: float = 1.0,
+        train_samples: int = 50,
+        min_samples: int = 10,
+        n_estimators: int = 50,
+        contamination: float = 0.1,
+        max_workers: int = 1,
+        retry_sec: float = 10.0,
+        max_retry_sec: float = 600.0,
+        cluster_of: Optional[Callable[[str], str]] = None,
+    ) -> None:
+        self.history = history
+        self.baseline = baseline
+        self.refresh_sec = refresh_sec
+        self.min_retrain_sec = min_retrain_sec
+        self.drift_sigma = drift_sigma
+        self.train_samples = train_samples
+        self.min_samples = min_samples
+        self.n_estimators = n_estimators
+        self.contamination = contamination
+        self.max_workers = max_workers
+        self.retry_sec = retry_sec
+        self.max_retry_sec = max_retry_sec
+        self.cluster_of = cluster_of or (lambda node_id: "fleet")
+        # Replaced wholesale on every swap; readers take one reference per tick
+        self.models: Dict[str, ModelVersion] = {}
+        self._training: Dict[str, "asyncio.Task[None]"] = {}
+        # cluster -> (consecutive failed fits, time before which none is retried)
+        self._failures: Dict[str, Tuple[int, float]] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._clusters: Dict[str, np.ndarray] = {}
+        self._clustered = 0
+
+    # ------- features -------
+    def _cluster_rows(self) -> Dict[str, np.ndarray]:
+        if self._clustered != len(self.history.slots):
+            groups: Dict[str, list] = {}
+            for node_id, row in self.history.slots.items():
+                groups.setdefault(self.cluster_of(node_id), []).append(row)
+            self._clusters = {c: np.array(rows, dtype=np.int64) for c, rows in groups.items()}
+            self._clustered = len(self.history.slots)
+        return self._clusters
+
+    def current_features(self, rows: np.ndarray) -> np.ndarray:
+        """Feature of each row's newest sample against the rest of its baseline window."""
+        h = self.history
+        current = h.traffic(rows, h.written[rows] - 1)
+        return relative_traffic(current, self.baseline.traffic_sum[rows], self.baseline.count[rows])
+
+    def training_set(self, rows: np.ndarray) -> np.ndarray:
+        """Features of the last `train_samples` samples of each row, each against the row's others."""
+        h = self.history
+        rows = rows[h.written[rows] >= self.min_samples]
+        if rows.size == 0:
+            return np.empty((0, 1))
+        depth = int(min(self.train_samples, h.written[rows].min(), h.capacity))
+        # Absolute sample indices [written - depth, written) for every row at once
+        j = h.written[rows][:, None] - depth + np.arange(depth)[None, :]
+        traffic = h.values[NETWORK_IN, rows[:, None], j % h.capacity].astype(np.float64)
+        traffic += h.values[NETWORK_OUT, rows[:, None], j % h.capacity]
+        total = traffic.sum(axis=1, keepdims=True)
+        return relative_traffic(traffic, total, np.full_like(total, depth)).reshape(-1, 1)
+
+    # ------- training -------
+    def _needs_refresh(self, cluster: str, rows: np.ndarray, now: float) -> bool:
+        current = self.models.get(cluster)
+        if current is None:
+            return True
+        age = now - current.trained_at
+        if age >= self.refresh_sec:
+            return True
+        if age < self.min_retrain_sec:
+            return False
+        ready = rows[self.baseline.count[rows] >= self.min_samples]
+        if ready.size == 0:
+            return False
+        mean = float(self.current_features(ready).mean())
+        return abs(mean - current.mean) > self.drift_sigma * max(current.std, 1e-6)
+
+    def _reference(self, rows: np.ndarray, xs: np.ndarray) -> float:
+        """Mean live feature of the cluster, what later drift checks compare against."""
+        ready = rows[self.baseline.count[rows] >= self.min_samples]
+        return float(self.current_features(ready).mean()) if ready.size else float(xs.mean())
+
+    async def _train(self, cluster: str, xs: np.ndarray, reference: float) -> None:
+        loop = asyncio.get_running_loop()
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        previous = self.models.get(cluster)
+        version = (previous.version + 1) if previous else 1
+        try:
+            model = await loop.run_in_executor(self._pool, _fit_forest, xs, self.n_estimators, self.contamination, version)
+        except Exception as e:
+            failures = self._failures.get(cluster, (0, 0.0))[0] + 1
+            delay = min(self.max_retry_sec, self.retry_sec * 2 ** (failures - 1))
+            self._failures[cluster] = (failures, time.time() + delay)
+            logger.warning(f"IsolationForest training for '{cluster}' failed ({failures} in a row, retrying in {delay:.0f}s): {e}")
+            return
+        finally:
+            self._training.pop(cluster, None)
+        self._failures.pop(cluster, None)
+        # Atomic swap: build the new mapping, then publish it with one assignment
+        models = dict(self.models)
+        models[cluster] = ModelVersion(model, version, time.time(), len(xs), reference, float(xs.std()))
+        self.models = models
+        logger.info(f"IsolationForest '{cluster}' v{version} trained on {len(xs)} samples")
+
+    def maybe_refresh(self, now: Optional[float] = None) -> None:
+        """Start training for clusters whose model is missing, stale or drifted (and not backing off)."""
+        if IsolationForest is None:
+            return
+        now = time.time() if now is None else now
+        for cluster, rows in self._cluster_rows().items():
+            if cluster in self._training or now < self._failures.get(cluster, (0, 0.0))[1]:
+                continue
+            if not self._needs_refresh(cluster, rows, now):
+                continue
+            xs = self.training_set(rows)
+            if len(xs) < self.min_samples:
+                continue
+            reference = self._reference(rows, xs)
+            self._training[cluster] = asyncio.get_running_loop().create_task(self._train(cluster, xs, reference))
+
+    # ------- scoring -------
+    def score(self) -> np.ndarray:
+        """decision_function of every node's newest sample, by history row (NaN where unscored)."""
+        models = self.models
+        scores = np.full(len(self.history.slots), np.nan)
+        for cluster, rows in self._cluster_rows().items():
+            current = models.get(cluster)
+            rows = rows[self.baseline.count[rows] >= self.min_samples]
+            if current is None or rows.size == 0:
+                continue
+            scores[rows] = current.model.decision_function(self.current_features(rows).reshape(-1, 1))  # type: ignore[attr-defined]
+        return scores
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,254 @@
+"""
+Fixed-size metric history for every node in the fleet.
+
+Samples are kept struct-of-arrays: one float64 timestamp array and one
+float32 array per metric, with a row per node. Each row is a ring buffer
+written twice (at `i` and `i + capacity`), so the newest `capacity` samples
+are always one contiguous slice. Time windows are found by binary search
+over that slice and returned as views, without copying or building objects.
+
+Detectors that only need counts and sums over a trailing time window use
+`RollingWindow` instead: its aggregates are updated as samples are recorded
+and evicted as they age out, so reading them is O(1) per node and every
+update works on arrays of rows at once.
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import models
+
+
+METRIC_FIELDS = ("cpu", "memory", "network_in", "network_out", "latency_ms")
+CPU, MEMORY, NETWORK_IN, NETWORK_OUT, LATENCY = range(len(METRIC_FIELDS))
+
+
+class HistoryWindow(NamedTuple):
+    """Samples of one node in time order; every field is a read-only view."""
+
+    ts: np.ndarray
+    cpu: np.ndarray
+    memory: np.ndarray
+    network_in: np.ndarray
+    network_out: np.ndarray
+    latency_ms: np.ndarray
+
+    def __len__(self) -> int:  # type: ignore[override]
+        return int(self.ts.size)
+
+
+class RollingWindow:
+    """
+    Running aggregates over the samples of the last `sec` seconds, per row.
+
+    Samples are identified by their absolute index in the row (the n-th sample
+    ever recorded), so the oldest sample in the window is `tail` and the
+    newest is `written - 1`. `cpu_over` is only kept for a window tracked
+    with a `cpu_threshold`; otherwise it stays zero.
+    """
+
+    def __init__(self, history: "FleetHistory", sec: float, cpu_threshold: Optional[float] = None) -> None:
+        self.history = history
+        self.sec = sec
+        self.cpu_threshold = cpu_threshold
+        rows = history.ts.shape[0]
+        self.tail = np.zeros(rows, dtype=np.int64)
+        self.count = np.zeros(rows, dtype=np.int64)
+        # Samples with cpu >= cpu_threshold
+        self.cpu_over = np.zeros(rows, dtype=np.int64)
+        # Consecutive pairs inside the window where memory went up
+        self.mem_increases = np.zeros(rows, dtype=np.int64)
+        # Sum of network_in + network_out
+        self.traffic_sum = np.zeros(rows, dtype=np.float64)
+
+    def _grow(self, rows: int) -> None:
+        for name in ("tail", "count", "cpu_over", "mem_increases", "traffic_sum"):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate([arr, np.zeros(rows - arr.size, dtype=arr.dtype)]))
+
+    def push(self, rows: np.ndarray) -> None:
+        """Add the newest sample of each of `rows` (unique row indices)."""
+        h = self.history
+        j = h.written[rows] - 1
+        was = self.count[rows]
+        self.tail[rows] = np.where(was == 0, j, self.tail[rows])
+        if self.cpu_threshold is not None:
+            self.cpu_over[rows] += h.at(CPU, rows, j) >= self.cpu_threshold
+        self.mem_increases[rows] += (was > 0) & (h.at(MEMORY, rows, j) > h.at(MEMORY, rows, j - 1))
+        self.traffic_sum[rows] += h.traffic(rows, j)
+        self.count[rows] = was + 1
+
+    def make_room(self, rows: np.ndarray) -> None:
+        """Drop the oldest sample of rows whose window spans the whole ring buffer,
+        before the next write overwrites it."""
+        full = rows[self.count[rows] >= self.history.capacity]
+        if full.size:
+            self._pop(full)
+
+    def _pop(self, rows: np.ndarray) -> None:
+        """Drop the oldest sample of each of `rows`."""
+        h = self.history
+        j = self.tail[rows]
+        if self.cpu_threshold is not None:
+            self.cpu_over[rows] -= h.at(CPU, rows, j) >= self.cpu_threshold
+        self.mem_increases[rows] -= (self.count[rows] > 1) & (h.at(MEMORY, rows, j + 1) > h.at(MEMORY, rows, j))
+        self.traffic_sum[rows] -= h.traffic(rows, j)
+        self.count[rows] -= 1
+        self.tail[rows] = j + 1
+        # Reset the float sum whenever a window empties so rounding cannot drift
+        empty = rows[self.count[rows] == 0]
+        self.traffic_sum[empty] = 0.0
+
+    def evict(self, now: Optional[float] = None, rows: Optional[np.ndarray] = None) -> None:
+        """Drop samples older than `now - sec` (amortized O(1) per recorded sample)."""
+        h = self.history
+        cutoff = (time.time() if now is None else now) - self.sec
+        rows = np.arange(len(h.slots)) if rows is None else np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        while rows.size:
+            live = rows[self.count[rows] > 0]
+            rows = live[h.ts[live, self.tail[live] % h.capacity] < cutoff]
+            if rows.size:
+                self._pop(rows)
+
+    def first(self, field: int, rows: np.ndarray) -> np.ndarray:
+        return self.history.at(field, rows, self.tail[rows])
+
+
+class FleetHistory:
+    def __init__(self, capacity: int = 360, initial_nodes: int = 16, ema_alpha: float = 0.5) -> None:
+        self.capacity = capacity
+        self.slots: Dict[str, int] = {}
+        self.ids: List[str] = []
+        rows = max(1, initial_nodes)
+        self.ts = np.zeros((rows, 2 * capacity), dtype=np.float64)
+        self.values = np.zeros((len(METRIC_FIELDS), rows, 2 * capacity), dtype=np.float32)
+        # Samples ever recorded per row; the next write goes to written % capacity
+        self.written = np.zeros(rows, dtype=np.int64)
+        # Exponential moving average of cpu, carried across samples
+        self.ema_alpha = ema_alpha
+        self.cpu_ema = np.zeros(rows, dtype=np.float64)
+        self.windows: List[RollingWindow] = []
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self.slots
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _grow(self, rows: int) -> None:
+        old = self.ts.shape[0]
+        self.ts = np.concatenate([self.ts, np.zeros((rows - old, self.ts.shape[1]), dtype=self.ts.dtype)])
+        pad = np.zeros((len(METRIC_FIELDS), rows - old, self.values.shape[2]), dtype=self.values.dtype)
+        self.values = np.concatenate([self.values, pad], axis=1)
+        self.written = np.concatenate([self.written, np.zeros(rows - old, dtype=np.int64)])
+        self.cpu_ema = np.concatenate([self.cpu_ema, np.zeros(rows - old, dtype=np.float64)])
+        for window in self.windows:
+            window._grow(rows)
+
+    def slot(self, node_id: str) -> int:
+        """Row of `node_id`, allocating one (and doubling the arrays) on first sight."""
+        row = self.slots.get(node_id)
+        if row is None:
+            row = len(self.slots)
+            if row >= self.ts.shape[0]:
+                self._grow(2 * self.ts.shape[0])
+            self.slots[node_id] = row
+            self.ids.append(node_id)
+        return row
+
+    def track(self, sec: float, cpu_threshold: Optional[float] = None) -> RollingWindow:
+        """Register (or reuse) rolling aggregates over the last `sec` seconds
+        (counting cpu >= `cpu_threshold` only when one is given). A window that
+        counts cpu also serves requests for the same `sec` without a threshold."""
+        for window in self.windows:
+            if window.sec == sec and cpu_threshold in (None, window.cpu_threshold):
+                return window
+        window = RollingWindow(self, sec, cpu_threshold)
+        self.windows.append(window)
+        # Fold in what is already buffered, oldest first
+        for age in range(self.capacity - 1, -1, -1):
+            rows = np.flatnonzero(self.written[:len(self.slots)] > age)
+            if rows.size:
+                self._replay(window, rows, age)
+        return window
+
+    def _replay(self, window: RollingWindow, rows: np.ndarray, age: int) -> None:
+        written = self.written[rows].copy()
+        self.written[rows] = written - age
+        window.push(rows)
+        self.written[rows] = written
+
+    def at(self, field: int, rows: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """Metric `field` of the samples with absolute indices `j` in `rows`."""
+        return self.values[field, rows, j % self.capacity]
+
+    def traffic(self, rows: np.ndarray, j: np.ndarray) -> np.ndarray:
+        return self.at(NETWORK_IN, rows, j).astype(np.float64) + self.at(NETWORK_OUT, rows, j)
+
+    def latest_values(self, field: int, rows: np.ndarray) -> np.ndarray:
+        return self.at(field, rows, self.written[rows] - 1)
+
+    def record_rows(self, rows: np.ndarray, ts: float, values: np.ndarray) -> None:
+        """Append one sample to each of `rows` (unique); `values` is [len(METRIC_FIELDS), len(rows)]."""
+        for window in self.windows:
+            window.make_room(rows)
+        pos = self.written[rows] % self.capacity
+        self.ts[rows, pos] = self.ts[rows, pos + self.capacity] = ts
+        self.values[:, rows, pos] = self.values[:, rows, pos + self.capacity] = values
+        first = self.written[rows] == 0
+        cpu = np.asarray(values[CPU], dtype=np.float64)
+        self.cpu_ema[rows] = np.where(first, cpu, self.ema_alpha * cpu + (1 - self.ema_alpha) * self.cpu_ema[rows])
+        self.written[rows] += 1
+        for window in self.windows:
+            window.push(rows)
+
+    def record_values(self, node_id: str, ts: float, values: Sequence[float]) -> None:
+        row = np.array([self.slot(node_id)])
+        self.record_rows(row, ts, np.asarray(values, dtype=np.float32).reshape(-1, 1))
+
+    def record(self, node_id: str, metrics: models.NodeMetrics, ts: Optional[float] = None) -> None:
+        self.record_values(
+            node_id,
+            time.time() if ts is None else ts,
+            [getattr(metrics, f) for f in METRIC_FIELDS],
+        )
+
+    def _bounds(self, row: int) -> Tuple[int, int]:
+        written = int(self.written[row])
+        end = written % self.capacity + self.capacity
+        return end - min(written, self.capacity), end
+
+    def _view(self, row: int, lo: int, hi: int) -> HistoryWindow:
+        cols = [self.values[i, row, lo:hi] for i in range(len(METRIC_FIELDS))]
+        win = HistoryWindow(self.ts[row, lo:hi], *cols)
+        for arr in win:
+            arr.flags.writeable = False
+        return win
+
+    def series(self, node_id: str) -> Optional[HistoryWindow]:
+        """Every retained sample of `node_id`, oldest first."""
+        row = self.slots.get(node_id)
+        if row is None:
+            return None
+        return self._view(row, *self._bounds(row))
+
+    def window(self, node_id: str, sec: float, now: Optional[float] = None) -> Optional[HistoryWindow]:
+        """Samples of `node_id` newer than `now - sec` (timestamps within a row are ascending)."""
+        row = self.slots.get(node_id)
+        if row is None:
+            return None
+        lo, hi = self._bounds(row)
+        cutoff = (time.time() if now is None else now) - sec
+        start = lo + int(np.searchsorted(self.ts[row, lo:hi], cutoff, side="left"))
+        return self._view(row, start, hi)
+
+    def latest(self, node_id: str) -> Optional[models.NodeMetrics]:
+        row = self.slots.get(node_id)
+        if row is None or self.written[row] == 0:
+            return None
+        pos = int(self.written[row] - 1) % self.capacity
+        return models.NodeMetrics(**{f: float(self.values[i, row, pos]) for i, f in enumerate(METRIC_FIELDS)})
+
+    def nbytes(self) -> int:
+        return int(self.ts.nbytes + self.values.nbytes + self.written.nbytes + self.cpu_ema.nbytes)
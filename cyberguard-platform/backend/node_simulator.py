@@ -1,150 +1,283 @@
-import random
 import time
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional
+
+import numpy as np
 
 import models
+from node_history import CPU, LATENCY, MEMORY, METRIC_FIELDS, NETWORK_IN, NETWORK_OUT
+
+
+STATUS_NAMES = ("healthy", "warning", "critical", "offline")
+HEALTHY, WARNING, CRITICAL, OFFLINE = range(len(STATUS_NAMES))
+
+ATTACK_NAMES = ("none", "ddos", "exfiltration", "degradation")
+NO_ATTACK, DDOS, EXFILTRATION, DEGRADATION = range(len(ATTACK_NAMES))
+
+# (low, high, decimals) of the uniform draw for each metric, in METRIC_FIELDS order
+_METRIC_RANGES = {
+    "cpu": (5.0, 95.0, 2),
+    "memory": (10.0, 90.0, 2),
+    "network_in": (0.1, 20.0, 2),
+    "network_out": (0.1, 20.0, 2),
+    "latency_ms": (5.0, 200.0, 1),
+}
+
+
+class NodeView(Mapping[str, models.NodeStatus]):
+    """Read-only mapping of node id -> NodeStatus, built from the arrays on access."""
+
+    def __init__(self, sim: "NodeSimulator") -> None:
+        self._sim = sim
+
+    def __getitem__(self, node_id: str) -> models.NodeStatus:
+        return self._sim.node(self._sim.index[node_id])
+
+    def __contains__(self, node_id: object) -> bool:
+        return node_id in self._sim.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sim.ids)
+
+    def __len__(self) -> int:
+        return len(self._sim.ids)
 
 
 class NodeSimulator:
-    def __init__(self, node_count: int = 5) -> None:
+    """
+    Fleet simulator backed by NumPy arrays.
+
+    Metrics live in one [len(METRIC_FIELDS), node_count] array and statuses
+    in an int8 array, so a tick (including attack ramps) is a few vectorized
+    operations for the whole fleet. Pydantic objects are only created when
+    a node is read through `nodes`.
+
+    All randomness comes from `rng` and all timestamps from `clock`, so a
+    seeded simulator driven by a virtual clock replays exactly.
+    """
+
+    def __init__(
+        self,
+        node_count: int = 5,
+        seed: Optional[Any] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
         self.node_count = node_count
-        self.nodes: Dict[str, models.NodeStatus] = {}
+        self.rng = np.random.default_rng(seed)
+        self.clock = clock
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.metrics = np.zeros((len(METRIC_FIELDS), 0))
+        self.status = np.zeros(0, dtype=np.int8)
+        self.last_update = np.zeros(0)
+        # Attack ramps per node; NaN start means no ramp
+        self.attack = np.zeros(0, dtype=np.int8)
+        self.ramp_start = np.zeros(0)
+        self.ramp_duration = np.zeros(0)
+        self.ramp_factor = np.zeros(0)
+        self.quarantined = np.zeros(0, dtype=bool)
         self._events: List[models.SecurityEvent] = []
-        self._ddos_ramp: Dict[str, Dict[str, float]] = {}
+        self.nodes = NodeView(self)
 
     def init_nodes(self) -> None:
-        now = time.time()
-        for i in range(1, self.node_count + 1):
-            node_id = f"node-{i}"
-            ip = f"10.0.0.{i}"
-            self.nodes[node_id] = models.NodeStatus(
-                id=node_id,
-                name=f"Node {i}",
-                ip=ip,
-                status="healthy",
-                metrics=self._random_metrics(),
-                last_update=now,
-            )
+        now = self.clock()
+        n = self.node_count
+        self.ids = [f"node-{i}" for i in range(1, n + 1)]
+        self.index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.metrics = self._random_metrics(n)
+        self.status = np.full(n, HEALTHY, dtype=np.int8)
+        self.last_update = np.full(n, now)
+        self.attack = np.full(n, NO_ATTACK, dtype=np.int8)
+        self.ramp_start = np.full(n, np.nan)
+        self.ramp_duration = np.ones(n)
+        self.ramp_factor = np.ones(n)
+        self.quarantined = np.zeros(n, dtype=bool)
+
+    @staticmethod
+    def _ip(i: int) -> str:
+        return f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+
+    def _random_metrics(self, n: int) -> np.ndarray:
+        out = np.empty((len(METRIC_FIELDS), n))
+        for row, field in enumerate(METRIC_FIELDS):
+            low, high, decimals = _METRIC_RANGES[field]
+            out[row] = np.round(self.rng.uniform(low, high, n), decimals)
+        return out
 
-    def _random_metrics(self) -> models.NodeMetrics:
-        return models.NodeMetrics(
-            cpu=round(random.uniform(5, 95), 2),
-            memory=round(random.uniform(10, 90), 2),
-            network_in=round(random.uniform(0.1, 20.0), 2),
-            network_out=round(random.uniform(0.1, 20.0), 2),
-            latency_ms=round(random.uniform(5, 200), 1),
+    def node(self, i: int) -> models.NodeStatus:
+        return models.NodeStatus(
+            id=self.ids[i],
+            name=f"Node {i + 1}",
+            ip=self._ip(i + 1),
+            status=STATUS_NAMES[self.status[i]],  # type: ignore[arg-type]
+            metrics=models.NodeMetrics(**{f: float(self.metrics[row, i]) for row, f in enumerate(METRIC_FIELDS)}),
+            last_update=float(self.last_update[i]),
         )
 
-    def tick(self) -> None:
-        now = time.time()
-        for node in self.nodes.values():
-            node.metrics = self._random_metrics()
-            node.last_update = time.time()
-            # degrade status probabilistically
-            roll = random.random()
-            if roll < 0.02:
-                node.status = "warning"
-            elif roll < 0.01:
-                node.status = "critical"
-            elif roll > 0.98:
-                node.status = "healthy"
-            # apply DDoS ramp if active
-            ramp = self._ddos_ramp.get(node.id)
-            if ramp:
-                t = max(0.0, min(1.0, (now - ramp["start"]) / ramp["duration"]))
-                factor = 1.0 + (ramp["factor"] - 1.0) * t
-                node.metrics.network_in *= factor
-                node.metrics.network_out *= factor
-                node.metrics.cpu = min(99.0, node.metrics.cpu * (1.0 + 0.5 * t))
-                node.status = "warning"
+    def node_dicts(self) -> List[Dict[str, Any]]:
+        """Every node as NodeStatus.model_dump() would render it, without building models."""
+        columns = [self.metrics[row].tolist() for row in range(len(METRIC_FIELDS))]
+        statuses = [STATUS_NAMES[s] for s in self.status.tolist()]
+        updated = self.last_update.tolist()
+        return [
+            {
+                "id": node_id,
+                "name": f"Node {i + 1}",
+                "ip": self._ip(i + 1),
+                "status": statuses[i],
+                "metrics": {f: columns[row][i] for row, f in enumerate(METRIC_FIELDS)},
+                "last_update": updated[i],
+            }
+            for i, node_id in enumerate(self.ids)
+        ]
+
+    def tick(self, now: Optional[float] = None) -> None:
+        now = self.clock() if now is None else now
+        n = len(self.ids)
+        self.metrics = self._random_metrics(n)
+        self.last_update[:] = now
+        # degrade status probabilistically
+        roll = self.rng.random(n)
+        self.status[roll < 0.02] = WARNING
+        self.status[roll > 0.98] = HEALTHY
+        # apply attack ramps that are active
+        ramping = np.flatnonzero(~np.isnan(self.ramp_start))
+        if ramping.size:
+            t = np.clip((now - self.ramp_start[ramping]) / self.ramp_duration[ramping], 0.0, 1.0)
+            factor = 1.0 + (self.ramp_factor[ramping] - 1.0) * t
+            kind = self.attack[ramping]
+            ddos, exfil, degraded = kind == DDOS, kind == EXFILTRATION, kind == DEGRADATION
+            rows = ramping[ddos]
+            self.metrics[NETWORK_IN, rows] *= factor[ddos]
+            self.metrics[NETWORK_OUT, rows] *= factor[ddos]
+            self.metrics[CPU, rows] = np.minimum(99.0, self.metrics[CPU, rows] * (1.0 + 0.5 * t[ddos]))
+            rows = ramping[exfil]
+            self.metrics[NETWORK_OUT, rows] *= factor[exfil]
+            self.metrics[CPU, rows] = np.minimum(99.0, self.metrics[CPU, rows] * (1.0 + 0.3 * t[exfil]))
+            # degradation: memory climbs steadily (the random draw is only jitter) and latency grows
+            rows = ramping[degraded]
+            self.metrics[MEMORY, rows] = np.minimum(99.0, 40.0 + 55.0 * t[degraded] + 0.02 * self.metrics[MEMORY, rows])
+            self.metrics[LATENCY, rows] *= factor[degraded]
+            self.metrics[CPU, rows] = np.minimum(99.0, self.metrics[CPU, rows] * (1.0 + 0.3 * t[degraded]))
+            self.status[ramping] = WARNING
+        # quarantined nodes are isolated: idle and unreachable
+        isolated = np.flatnonzero(self.quarantined)
+        if isolated.size:
+            self.metrics[CPU, isolated] = 1.0
+            self.metrics[NETWORK_IN, isolated] = 0.0
+            self.metrics[NETWORK_OUT, isolated] = 0.0
+            self.status[isolated] = OFFLINE
+
+    def start_attack(self, rows: np.ndarray, kind: str, ramp_sec: float = 45.0, factor: Optional[float] = None) -> None:
+        """Ramp an attack up on the nodes at `rows` over `ramp_sec` (factor drawn from 3-6x if not given)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        self.attack[rows] = ATTACK_NAMES.index(kind)
+        self.ramp_start[rows] = self.clock()
+        self.ramp_duration[rows] = ramp_sec
+        self.ramp_factor[rows] = self.rng.uniform(3.0, 6.0, rows.size) if factor is None else factor
+
+    def stop_attack(self, rows: np.ndarray) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        self.attack[rows] = NO_ATTACK
+        self.ramp_start[rows] = np.nan
+        self.status[rows[~self.quarantined[rows]]] = HEALTHY
+
+    def quarantine(self, rows: np.ndarray) -> None:
+        """Isolate nodes; a quarantined node's attack is contained and ends."""
+        rows = np.asarray(rows, dtype=np.int64)
+        self.stop_attack(rows)
+        self.quarantined[rows] = True
+        self.status[rows] = OFFLINE
+        self.last_update[rows] = self.clock()
+
+    def release(self, rows: np.ndarray) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        self.quarantined[rows] = False
+        self.status[rows] = HEALTHY
+        self.last_update[rows] = self.clock()
 
     def redistribute_load(self, from_node_id: str) -> None:
         """Simulate load balancing by reducing load on the attacked node and slightly increasing others."""
-        if from_node_id not in self.nodes:
+        i = self.index.get(from_node_id)
+        if i is None:
             return
-        compromised = self.nodes[from_node_id]
+        others = np.ones(len(self.ids), dtype=bool)
+        others[i] = False
         # reduce its network and cpu
-        compromised.metrics.cpu = max(5.0, compromised.metrics.cpu * 0.6)
-        compromised.metrics.network_in *= 0.5
-        compromised.metrics.network_out *= 0.5
-        compromised.status = "warning"
+        self.metrics[CPU, i] = max(5.0, self.metrics[CPU, i] * 0.6)
+        self.metrics[NETWORK_IN, i] *= 0.5
+        self.metrics[NETWORK_OUT, i] *= 0.5
+        self.status[i] = WARNING
         # spread to other nodes
-        for nid, node in self.nodes.items():
-            if nid == from_node_id:
-                continue
-            node.metrics.cpu = min(95.0, node.metrics.cpu * 1.05)
-            node.metrics.network_in *= 1.1
-            node.metrics.network_out *= 1.1
-            node.last_update = time.time()
+        self.metrics[CPU, others] = np.minimum(95.0, self.metrics[CPU, others] * 1.05)
+        self.metrics[NETWORK_IN, others] *= 1.1
+        self.metrics[NETWORK_OUT, others] *= 1.1
+        self.last_update[others] = self.clock()
 
     def simulate_ddos(self, node_id: str) -> None:
         """Gradual spike over ~45s to trigger detection <60s."""
-        if node_id not in self.nodes:
+        i = self.index.get(node_id)
+        if i is None:
             return
-        self._ddos_ramp[node_id] = {
-            "start": time.time(),
-            "duration": 45.0,
-            "factor": random.uniform(3.0, 6.0),
-        }
+        self.start_attack(np.array([i]), "ddos", ramp_sec=45.0)
 
     def simulate_threat(
         self, node_id: str, body: Optional[models.SimulateThreatBody]
     ) -> models.SecurityEvent:
-        if node_id == "random" or node_id not in self.nodes:
-            node_id = random.choice(list(self.nodes.keys()))
+        if node_id == "random" or node_id not in self.index:
+            node_id = self.ids[int(self.rng.integers(len(self.ids)))]
 
         b = body or models.SimulateThreatBody()
         sev = b.severity
         msg = b.message or f"Simulated {b.type} event"
 
+        now = self.clock()
         evt = models.SecurityEvent(
-            id=f"evt-{int(time.time()*1000)}",
+            id=f"evt-{int(now*1000)}",
             node_id=node_id,
             type=b.type,
             severity=sev,
             message=msg,
-            timestamp=time.time(),
+            timestamp=now,
         )
-        self._events.insert(0, evt)
-        self._events = self._events[:200]
+        self.record_event(evt)
 
         # reflect on node status
-        node = self.nodes[node_id]
+        i = self.index[node_id]
         if sev in ("high", "critical"):
-            node.status = "critical"
+            self.status[i] = CRITICAL
         elif sev == "medium":
-            node.status = "warning"
+            self.status[i] = WARNING
         else:
-            node.status = "healthy"
-        node.last_update = time.time()
+            self.status[i] = HEALTHY
+        self.last_update[i] = now
         return evt
 
+    def record_event(self, evt: models.SecurityEvent) -> None:
+        self._events.insert(0, evt)
+        self._events = self._events[:200]
+
     def recent_events(self, limit: int = 50) -> List[models.SecurityEvent]:
         return self._events[:limit]
 
     def analytics(self, uptime: float) -> models.AnalyticsSummary:
-        nodes = list(self.nodes.values())
-        if not nodes:
+        threats_active = sum(1 for e in self._events if e.severity in ("high", "critical"))
+        if not self.ids:
             return models.AnalyticsSummary(
                 node_count=0,
                 avg_cpu=0.0,
                 avg_memory=0.0,
                 threats_total=len(self._events),
-                threats_active=sum(1 for e in self._events if e.severity in ("high", "critical")),
+                threats_active=threats_active,
                 uptime=uptime,
                 status_breakdown={},
             )
-        avg_cpu = sum(n.metrics.cpu for n in nodes) / len(nodes)
-        avg_memory = sum(n.metrics.memory for n in nodes) / len(nodes)
-        breakdown: Dict[str, int] = {"healthy": 0, "warning": 0, "critical": 0, "offline": 0}
-        for n in nodes:
-            breakdown[n.status] = breakdown.get(n.status, 0) + 1
+        counts = np.bincount(self.status, minlength=len(STATUS_NAMES))
         return models.AnalyticsSummary(
-            node_count=len(nodes),
-            avg_cpu=round(avg_cpu, 2),
-            avg_memory=round(avg_memory, 2),
+            node_count=len(self.ids),
+            avg_cpu=round(float(self.metrics[CPU].mean()), 2),
+            avg_memory=round(float(self.metrics[MEMORY].mean()), 2),
             threats_total=len(self._events),
-            threats_active=sum(1 for e in self._events if e.severity in ("high", "critical")),
+            threats_active=threats_active,
             uptime=uptime,
-            status_breakdown=breakdown,
+            status_breakdown={name: int(c) for name, c in zip(STATUS_NAMES, counts)},
         )
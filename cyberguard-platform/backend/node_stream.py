@@ -0,0 +1,94 @@
+"""
+Versioned snapshot + delta stream of the simulated fleet for WebSocket clients.
+
+Every tick produces one `delta` frame with a sequence number, holding only
+the nodes whose status changed or whose metrics moved beyond the tolerance
+since they were last sent. A `snapshot` frame carries the whole fleet at
+the current sequence number; clients get one on connect and whenever they
+fall behind (a gap in sequence numbers, or frames dropped by the fan-out).
+
+Rows are positional arrays described by the frame's `fields`, so a frame
+does not repeat key names per node:
+
+    {"type": "delta", "seq": 18, "ts": 1700000000.0,
+     "fields": ["id", "status", "cpu", ...], "rows": [["node-3", "warning", 91.2, ...]]}
+
+A client subscribed to some nodes gets the same frames with only their rows
+(`narrow`); the sequence numbers stay those of the full stream.
+"""
+from typing import AbstractSet, Any, Dict, List
+
+import numpy as np
+
+from node_history import METRIC_FIELDS
+from node_simulator import STATUS_NAMES, NodeSimulator
+
+
+SNAPSHOT_FIELDS = ["id", "name", "ip", "status", *METRIC_FIELDS, "last_update"]
+DELTA_FIELDS = ["id", "status", *METRIC_FIELDS]
+
+
+def narrow(frame: Dict[str, Any], nodes: AbstractSet[str]) -> Dict[str, Any]:
+    """The frame with only the rows of the given node ids (id is always the first field)."""
+    return {**frame, "rows": [row for row in frame["rows"] if row[0] in nodes]}
+
+
+class NodeStream:
+    def __init__(self, simulator: NodeSimulator, rel_tolerance: float = 0.01, abs_tolerance: float = 0.01) -> None:
+        self.simulator = simulator
+        self.rel_tolerance = rel_tolerance
+        # Metrics are rounded to 2 decimals; smaller moves are not changes
+        self.abs_tolerance = abs_tolerance
+        self.seq = 0
+        # State as last sent; NaN forces every node into the first delta
+        self._sent_metrics = np.full((len(METRIC_FIELDS), 0), np.nan)
+        self._sent_status = np.zeros(0, dtype=np.int8)
+
+    def _grow(self) -> None:
+        n = len(self.simulator.ids)
+        if self._sent_status.size != n:
+            self._sent_metrics = np.full((len(METRIC_FIELDS), n), np.nan)
+            self._sent_status = np.full(n, -1, dtype=np.int8)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Whole fleet at the current sequence number (does not advance it)."""
+        sim = self.simulator
+        return {
+            "type": "snapshot",
+            "event": "snapshot",
+            "seq": self.seq,
+            "fields": SNAPSHOT_FIELDS,
+            "rows": [
+                [node["id"], node["name"], node["ip"], node["status"], *node["metrics"].values(), node["last_update"]]
+                for node in sim.node_dicts()
+            ],
+        }
+
+    def delta(self, ts: float) -> Dict[str, Any]:
+        """Advance the sequence number and return the nodes that changed since they were last sent."""
+        self._grow()
+        sim = self.simulator
+        metrics, status = sim.metrics, sim.status
+        sent = self._sent_metrics
+        with np.errstate(invalid="ignore"):
+            moved = np.abs(metrics - sent) > np.maximum(self.abs_tolerance, self.rel_tolerance * np.abs(sent))
+        changed = np.flatnonzero((status != self._sent_status) | moved.any(axis=0) | np.isnan(sent).any(axis=0))
+        self._sent_metrics[:, changed] = metrics[:, changed]
+        self._sent_status[changed] = status[changed]
+        self.seq += 1
+
+        columns = metrics[:, changed].T.tolist()
+        ids, names = sim.ids, STATUS_NAMES
+        codes = status[changed].tolist()
+        rows: List[List[Any]] = [
+            [ids[i], names[code], *values]
+            for i, code, values in zip(changed.tolist(), codes, columns)
+        ]
+        return {
+            "type": "delta",
+            "event": "delta",
+            "seq": self.seq,
+            "ts": ts,
+            "fields": DELTA_FIELDS,
+            "rows": rows,
+        }
@@ -0,0 +1,288 @@
+"""
+Asynchronous LLM reasoning for AI decisions.
+
+Analyses are returned straight away with heuristic reasoning; the LLM call
+happens afterwards through `ReasoningService`. The service bounds the number
+of concurrent calls, times each one out, shares a single call between
+identical in-flight requests, and keeps answers in a TTL/LRU cache keyed by
+(flags, severity, matched pattern). Decisions whose key is already cached
+get the LLM text immediately.
+
+When several nodes trip detectors at once, `MicroBatcher` gathers the calls
+made within a short window into one prompt that asks for a JSON answer per
+item. Items missing from a malformed or partial reply are retried on their
+own.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("cyberguard")
+
+ReasoningKey = Tuple[Tuple[str, ...], str, Optional[str]]
+
+BATCH_HEADER = (
+    "Answer each numbered request below independently, in one sentence each. "
+    "Reply with only a JSON object mapping each request number (as a string) to its answer."
+)
+_BATCH_ITEM = re.compile(r"^\[(\d+)\] (.*)$", re.MULTILINE)
+
+
+def batch_prompt(prompts: List[str]) -> str:
+    items = "\n".join(f"[{i}] {' '.join(p.split())}" for i, p in enumerate(prompts, 1))
+    return f"{BATCH_HEADER}\n\n{items}"
+
+
+def parse_batch_reply(text: Optional[str], size: int) -> Dict[int, str]:
+    """Per-item answers from a batch reply; unusable items are simply absent."""
+    if not text:
+        return {}
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    answers: Dict[int, str] = {}
+    for key, value in data.items():
+        try:
+            index = int(key)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= index <= size and isinstance(value, str) and value.strip():
+            answers[index] = value.strip()
+    return answers
+
+
+class GeminiReasoningModel:
+    """
+    Runs the blocking google-generativeai client on its own bounded thread
+    pool. The client gets a request timeout as well, so a call abandoned by
+    `ReasoningService`'s timeout ends soon after instead of holding a thread,
+    and hung calls can never occupy more than `max_workers` threads (nor the
+    event loop's default executor).
+    """
+
+    def __init__(self, model: Any, max_workers: int = 2, timeout_sec: float = 10.0) -> None:
+        self.model = model
+        self.timeout_sec = timeout_sec
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="gemini")
+
+    def _generate(self, prompt: str) -> Any:
+        return self.model.generate_content(prompt, request_options={"timeout": self.timeout_sec})
+
+    async def generate(self, prompt: str) -> Optional[str]:
+        res = await asyncio.get_running_loop().run_in_executor(self._pool, self._generate, prompt)
+        text = getattr(res, "text", None) or (getattr(res, "candidates", [None])[0].content.parts[0].text if getattr(res, "candidates", None) else None)  # type: ignore[index]
+        return text.strip() if isinstance(text, str) else None
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class FakeReasoningModel:
+    """Deterministic local model for tests and offline demos."""
+
+    def __init__(
+        self,
+        delay: float = 0.0,
+        reply: Optional[str] = None,
+        fail: bool = False,
+        batch_reply: Optional[str] = None,
+    ) -> None:
+        self.delay = delay
+        self.reply = reply
+        self.fail = fail
+        # Raw text for batch prompts (e.g. something malformed); None answers every item
+        self.batch_reply = batch_reply
+        self.calls: List[str] = []
+
+    def _answer(self, prompt: str) -> str:
+        return self.reply if self.reply is not None else f"Likely cause inferred from: {prompt[:120]}"
+
+    async def generate(self, prompt: str) -> Optional[str]:
+        self.calls.append(prompt)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("fake model failure")
+        if prompt.startswith(BATCH_HEADER):
+            if self.batch_reply is not None:
+                return self.batch_reply
+            return json.dumps({i: self._answer(p) for i, p in _BATCH_ITEM.findall(prompt)})
+        return self._answer(prompt)
+
+    def shutdown(self) -> None:
+        pass
+
+
+class TTLCache:
+    """LRU mapping whose entries also expire `ttl_sec` after being stored."""
+
+    def __init__(self, max_entries: int = 512, ttl_sec: float = 600.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Any, now: Optional[float] = None) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if (time.monotonic() if now is None else now) >= expires:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Any, value: Any, now: Optional[float] = None) -> None:
+        self._data[key] = ((time.monotonic() if now is None else now) + self.ttl_sec, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+class MicroBatcher:
+    """
+    Collects prompts submitted within `window_sec` (or until `max_batch` are
+    waiting) and sends them as one batch prompt through `call`.
+    """
+
+    def __init__(
+        self,
+        call: Callable[[str], Awaitable[Optional[str]]],
+        max_batch: int = 8,
+        window_sec: float = 0.05,
+    ) -> None:
+        self.call = call
+        self.max_batch = max(1, max_batch)
+        self.window_sec = window_sec
+        self._pending: List[Tuple[str, "asyncio.Future[Optional[str]]"]] = []
+        self._timer: Optional["asyncio.Task[None]"] = None
+        self._running: Set["asyncio.Task[None]"] = set()
+        self.stats = {"batches": 0, "items": 0, "fallbacks": 0}
+
+    async def submit(self, prompt: str) -> Optional[str]:
+        future: "asyncio.Future[Optional[str]]" = asyncio.get_running_loop().create_future()
+        self._pending.append((prompt, future))
+        if len(self._pending) >= self.max_batch:
+            self._start(self._take())
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    def _take(self) -> List[Tuple[str, "asyncio.Future[Optional[str]]"]]:
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        return batch
+
+    def _start(self, batch: List[Tuple[str, "asyncio.Future[Optional[str]]"]]) -> None:
+        task = asyncio.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window_sec)
+        self._timer = None
+        while self._pending:
+            self._start(self._take())
+
+    async def _run(self, batch: List[Tuple[str, "asyncio.Future[Optional[str]]"]]) -> None:
+        prompts = [p for p, _ in batch]
+        answers: Dict[int, Optional[str]] = {}
+        try:
+            if len(batch) == 1:
+                answers[1] = await self.call(prompts[0])
+            else:
+                self.stats["batches"] += 1
+                self.stats["items"] += len(batch)
+                answers.update(parse_batch_reply(await self.call(batch_prompt(prompts)), len(batch)))
+                # Anything the batch reply did not cover is asked again on its own
+                missing = [i for i in range(1, len(batch) + 1) if i not in answers]
+                if missing:
+                    self.stats["fallbacks"] += len(missing)
+                    singles = await asyncio.gather(*(self.call(prompts[i - 1]) for i in missing))
+                    answers.update(zip(missing, singles))
+        finally:
+            for i, (_, future) in enumerate(batch, 1):
+                if not future.done():
+                    future.set_result(answers.get(i))
+
+
+class ReasoningService:
+    def __init__(
+        self,
+        model: Any,
+        max_concurrency: int = 2,
+        timeout_sec: float = 10.0,
+        ttl_sec: float = 600.0,
+        max_entries: int = 512,
+        max_batch: int = 1,
+        batch_window_sec: float = 0.05,
+    ) -> None:
+        self.model = model
+        self.timeout_sec = timeout_sec
+        self.cache = TTLCache(max_entries=max_entries, ttl_sec=ttl_sec)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Dict[ReasoningKey, "asyncio.Future[Optional[str]]"] = {}
+        self.stats = {"calls": 0, "cache_hits": 0, "shared": 0, "timeouts": 0, "failures": 0}
+        self.batcher: Optional[MicroBatcher] = None
+        if max_batch > 1:
+            self.batcher = MicroBatcher(self._call, max_batch=max_batch, window_sec=batch_window_sec)
+
+    @staticmethod
+    def key(flags: Iterable[str], severity: str, matched: Optional[str]) -> ReasoningKey:
+        return (tuple(sorted(flags)), severity, matched)
+
+    def cached(self, key: ReasoningKey) -> Optional[str]:
+        return self.cache.get(key)
+
+    async def reason(self, key: ReasoningKey, prompt: str) -> Optional[str]:
+        """LLM text for `key`, from cache, a shared in-flight call, or a new bounded call."""
+        text = self.cache.get(key)
+        if text is not None:
+            self.stats["cache_hits"] += 1
+            return text
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats["shared"] += 1
+            return await asyncio.shield(pending)
+
+        future: "asyncio.Future[Optional[str]]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        text = None
+        try:
+            text = await (self.batcher.submit(prompt) if self.batcher is not None else self._call(prompt))
+        finally:
+            self._inflight.pop(key, None)
+            if text:
+                self.cache.put(key, text)
+            future.set_result(text or None)
+        return text or None
+
+    async def _call(self, prompt: str) -> Optional[str]:
+        """One model round-trip, bounded by the semaphore and the timeout."""
+        try:
+            async with self._semaphore:
+                self.stats["calls"] += 1
+                return await asyncio.wait_for(self.model.generate(prompt), timeout=self.timeout_sec)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.debug(f"Reasoning call timed out after {self.timeout_sec}s")
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.debug(f"Reasoning call failed: {e}")
+        return None
+
+    def shutdown(self) -> None:
+        self.model.shutdown()
@@ -0,0 +1,316 @@
+"""
+Deterministic incident scenarios for the node simulator.
+
+A scenario is a seed, a fleet size and a declarative timeline of attacks
+(ddos, exfiltration, degradation) and responses (stop, quarantine, release)
+against groups of nodes. `ScenarioRunner` drives a `NodeSimulator` with a
+virtual clock: every random draw comes from the scenario seed and every
+timestamp from the clock, so the same scenario produces the same metrics,
+the same detector findings and therefore the same digest on every run, at
+any playback speed. Two builds can then be compared on the same heavy
+incident: equal digests mean identical behaviour, and the report gives
+throughput and per-attack detection latency.
+
+    {
+      "name": "heavy-incident", "seed": 7, "nodes": 10000,
+      "duration_sec": 600, "tick_sec": 2,
+      "events": [
+        {"at": 60, "action": "ddos", "nodes": {"fraction": 0.02}, "ramp_sec": 45},
+        {"at": 120, "action": "exfiltration", "nodes": ["node-5", "node-9"], "duration_sec": 180},
+        {"at": 240, "action": "quarantine", "nodes": {"event": 0}}
+      ]
+    }
+
+Node selectors are a list of ids, "all", {"count": n} or {"fraction": f}
+(a seeded random pick), {"range": [first, last]} (1-based, inclusive) or
+{"event": i} (the nodes of an earlier event). Background-trained models
+are not used: their training finishes at wall-clock dependent times.
+
+Usage: python scenario.py scenarios/heavy_incident.json [--speed 1] [--no-engine]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import models
+from node_simulator import NodeSimulator
+
+
+ATTACKS = ("ddos", "exfiltration", "degradation")
+ACTIONS = ATTACKS + ("stop", "quarantine", "release")
+
+# Detector flags that count as detecting each attack; other findings on an
+# attacked node are background noise
+EXPECTED_FLAGS: Dict[str, Tuple[str, ...]] = {
+    "ddos": ("net_anomaly", "cpu_spike"),
+    "exfiltration": ("net_anomaly",),
+    "degradation": ("memory_leak",),
+}
+
+DEFAULT_EPOCH = 1_700_000_000.0
+
+
+class ScenarioEvent(NamedTuple):
+    at: float
+    action: str
+    nodes: Any
+    ramp_sec: float = 45.0
+    factor: Optional[float] = None
+    # Attacks only: stop the attack this long after it starts
+    duration_sec: Optional[float] = None
+
+
+class Scenario(NamedTuple):
+    name: str
+    seed: int
+    nodes: int
+    duration_sec: float
+    tick_sec: float
+    events: List[ScenarioEvent]
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Scenario":
+        events: List[ScenarioEvent] = []
+        for i, raw in enumerate(data.get("events", [])):
+            action = str(raw.get("action", "")).lower()
+            if action not in ACTIONS:
+                raise ValueError(f"event {i}: unknown action '{action}' (expected one of {', '.join(ACTIONS)})")
+            nodes = raw.get("nodes", "all")
+            if isinstance(nodes, dict) and "event" in nodes and not 0 <= int(nodes["event"]) < i:
+                raise ValueError(f"event {i}: can only refer to an earlier event")
+            duration = raw.get("duration_sec")
+            events.append(ScenarioEvent(
+                at=float(raw.get("at", 0.0)),
+                action=action,
+                nodes=nodes,
+                ramp_sec=float(raw.get("ramp_sec", 45.0)),
+                factor=None if raw.get("factor") is None else float(raw["factor"]),
+                duration_sec=None if duration is None else float(duration),
+            ))
+        tick_sec = float(data.get("tick_sec", 2.0))
+        if tick_sec <= 0:
+            raise ValueError("tick_sec must be positive")
+        return cls(
+            name=str(data.get("name", "scenario")),
+            seed=int(data.get("seed", 0)),
+            nodes=int(data.get("nodes", 5)),
+            duration_sec=float(data.get("duration_sec", 300.0)),
+            tick_sec=tick_sec,
+            events=events,
+        )
+
+
+def load_scenario(path: str) -> Scenario:
+    with open(path, "r", encoding="utf-8") as f:
+        return Scenario.from_dict(json.load(f))
+
+
+class VirtualClock:
+    """Callable clock that only moves when advanced."""
+
+    def __init__(self, start: float = DEFAULT_EPOCH) -> None:
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, sec: float) -> None:
+        self.now += sec
+
+
+def _select(selector: Any, sim: NodeSimulator, rng: np.random.Generator, earlier: List[np.ndarray]) -> np.ndarray:
+    n = len(sim.ids)
+    if selector == "all":
+        return np.arange(n)
+    if isinstance(selector, list):
+        missing = [node_id for node_id in selector if node_id not in sim.index]
+        if missing:
+            raise ValueError(f"unknown nodes: {', '.join(map(str, missing[:5]))}")
+        return np.array(sorted({sim.index[node_id] for node_id in selector}), dtype=np.int64)
+    if isinstance(selector, dict):
+        if "event" in selector:
+            return earlier[int(selector["event"])]
+        if "range" in selector:
+            first, last = (int(v) for v in selector["range"])
+            return np.arange(max(1, first) - 1, min(n, last))
+        if "count" in selector or "fraction" in selector:
+            count = int(selector["count"]) if "count" in selector else int(round(float(selector["fraction"]) * n))
+            return np.sort(rng.choice(n, size=min(n, max(0, count)), replace=False))
+    raise ValueError(f"unsupported node selector: {selector!r}")
+
+
+class ScenarioRunner:
+    def __init__(self, scenario: Scenario, engine: Optional[Any] = None, start: float = DEFAULT_EPOCH) -> None:
+        self.scenario = scenario
+        self.engine = engine
+        self.start = start
+        self.clock = VirtualClock(start)
+        # Independent streams: node picks don't shift the simulator's draws
+        sim_seed, pick_seed = np.random.SeedSequence(scenario.seed).spawn(2)
+        self.simulator = NodeSimulator(scenario.nodes, seed=sim_seed, clock=self.clock)
+        self.simulator.init_nodes()
+
+        rng = np.random.default_rng(pick_seed)
+        self.targets: List[np.ndarray] = []
+        for event in scenario.events:
+            self.targets.append(_select(event.nodes, self.simulator, rng, self.targets))
+        # (time, order, event index, action); attack durations become stop entries
+        timeline: List[Tuple[float, int, int, str]] = []
+        for i, event in enumerate(scenario.events):
+            timeline.append((event.at, len(timeline), i, event.action))
+            if event.action in ATTACKS and event.duration_sec is not None:
+                timeline.append((event.at + event.duration_sec, len(timeline), i, "end"))
+        self._timeline = sorted(timeline)
+        self._next = 0
+
+        # Which attack event each node is currently under, and its position in that event's targets
+        self._attack_of = np.full(scenario.nodes, -1, dtype=np.int64)
+        self._attack_pos = np.zeros(scenario.nodes, dtype=np.int64)
+        self._started = [np.nan] * len(scenario.events)
+        self._latency = [np.full(rows.size, np.nan) for rows in self.targets]
+
+        self._digest = hashlib.sha256()
+        self.ticks = 0
+        self.findings = 0
+        self.false_positives = 0
+        self.busy_sec = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return self.clock() - self.start
+
+    @property
+    def done(self) -> bool:
+        return self.elapsed >= self.scenario.duration_sec
+
+    def _apply_due(self) -> None:
+        sim = self.simulator
+        while self._next < len(self._timeline) and self._timeline[self._next][0] <= self.elapsed:
+            _, _, i, action = self._timeline[self._next]
+            self._next += 1
+            event, rows = self.scenario.events[i], self.targets[i]
+            if action in ATTACKS:
+                sim.start_attack(rows, action, ramp_sec=event.ramp_sec, factor=event.factor)
+                self._attack_of[rows] = i
+                self._attack_pos[rows] = np.arange(rows.size)
+                self._started[i] = self.clock()
+                continue
+            if action == "end":
+                # only the nodes this event still owns; a later attack may have taken some over
+                rows = rows[self._attack_of[rows] == i]
+            if action in ("end", "stop"):
+                sim.stop_attack(rows)
+            elif action == "quarantine":
+                sim.quarantine(rows)
+            elif action == "release":
+                sim.release(rows)
+                continue
+            self._attack_of[rows] = -1
+
+    def _observe(self, results: List[models.AIAnalysisResult]) -> None:
+        now = self.clock()
+        for res in results:
+            i = self.simulator.index[res.node_id]
+            event = int(self._attack_of[i])
+            self._digest.update(f"{res.node_id}|{res.severity}|{','.join(res.anomalies)}\n".encode())
+            if event < 0:
+                self.false_positives += 1
+                continue
+            expected = EXPECTED_FLAGS[self.scenario.events[event].action]
+            latency = self._latency[event]
+            pos = self._attack_pos[i]
+            if np.isnan(latency[pos]) and any(flag in expected for flag in res.anomalies):
+                latency[pos] = now - self._started[event]
+        self.findings += len(results)
+
+    def step(self) -> List[models.AIAnalysisResult]:
+        """Advance the scenario by one tick and return the engine's findings for it."""
+        sim = self.simulator
+        now = self.clock()
+        started = time.perf_counter()
+        self._apply_due()
+        sim.tick(now)
+        results: List[models.AIAnalysisResult] = []
+        if self.engine is not None:
+            self.engine.record_fleet(sim.ids, sim.metrics, ts=now)
+            results = self.engine.analyze_fleet(now)
+        self.busy_sec += time.perf_counter() - started
+
+        self._digest.update(sim.metrics.tobytes())
+        self._digest.update(sim.status.tobytes())
+        self._observe(results)
+        self.ticks += 1
+        self.clock.advance(self.scenario.tick_sec)
+        return results
+
+    def run(self) -> Dict[str, Any]:
+        """Play the whole scenario as fast as possible."""
+        while not self.done:
+            self.step()
+        return self.report()
+
+    async def play(
+        self,
+        speed: float = 1.0,
+        on_tick: Optional[Callable[["ScenarioRunner", List[models.AIAnalysisResult]], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Play in (scaled) real time: one tick every tick_sec / speed seconds,
+        or back to back when speed <= 0. The results do not depend on speed.
+        """
+        while not self.done:
+            started = time.perf_counter()
+            results = self.step()
+            if on_tick is not None:
+                await on_tick(self, results)
+            delay = self.scenario.tick_sec / speed - (time.perf_counter() - started) if speed > 0 else 0.0
+            await asyncio.sleep(max(0.0, delay))
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        sc = self.scenario
+        busy = max(self.busy_sec, 1e-9)
+        events = []
+        for i, (event, rows) in enumerate(zip(sc.events, self.targets)):
+            entry: Dict[str, Any] = {"at": event.at, "action": event.action, "nodes": int(rows.size)}
+            if event.action in ATTACKS:
+                latency = self._latency[i]
+                hit = latency[~np.isnan(latency)]
+                entry["detected"] = int(hit.size)
+                entry["latency_p50_sec"] = float(np.median(hit)) if hit.size else None
+                entry["latency_max_sec"] = float(hit.max()) if hit.size else None
+            events.append(entry)
+        return {
+            "name": sc.name,
+            "seed": sc.seed,
+            "nodes": sc.nodes,
+            "ticks": self.ticks,
+            "simulated_sec": round(self.elapsed, 6),
+            "busy_sec": round(self.busy_sec, 3),
+            "ticks_per_sec": round(self.ticks / busy, 2),
+            "samples_per_sec": round(self.ticks * sc.nodes / busy, 1),
+            "findings": self.findings,
+            "false_positives": self.false_positives,
+            "events": events,
+            "digest": self._digest.hexdigest(),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a deterministic incident scenario")
+    parser.add_argument("scenario", help="scenario JSON file")
+    parser.add_argument("--speed", type=float, default=0.0, help="playback speed (1 = real time, 0 = as fast as possible)")
+    parser.add_argument("--no-engine", action="store_true", help="only run the simulator")
+    args = parser.parse_args()
+
+    engine = None
+    if not args.no_engine:
+        from ai_engine import AIEngine
+        engine = AIEngine()
+    runner = ScenarioRunner(load_scenario(args.scenario), engine=engine)
+    print(json.dumps(asyncio.run(runner.play(args.speed)), indent=2))
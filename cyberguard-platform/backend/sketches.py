@@ -0,0 +1,349 @@
+"""
+Mergeable streaming summaries used by the dataset pipeline.
+
+Every summary here can be updated chunk by chunk and merged with another
+instance built over a different chunk, so results do not depend on how the
+data was split.
+"""
+import base64
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class RunningMoments:
+    """Count, mean, variance (Chan et al. parallel update), min and max."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values: Iterable[float]) -> None:
+        arr = np.asarray(values, dtype=np.float64)
+        arr = arr[~np.isnan(arr)]
+        if arr.size == 0:
+            return
+        other = RunningMoments()
+        other.count = int(arr.size)
+        other.mean = float(arr.mean())
+        other.m2 = float(((arr - other.mean) ** 2).sum())
+        other.min = float(arr.min())
+        other.max = float(arr.max())
+        self.merge(other)
+
+    def merge(self, other: "RunningMoments") -> "RunningMoments":
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / n
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def std(self) -> float:
+        # Sample standard deviation (ddof=1), matching pandas
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float("nan")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunningMoments":
+        m = cls()
+        m.count = int(data["count"])
+        m.mean, m.m2 = float(data["mean"]), float(data["m2"])
+        m.min, m.max = float(data["min"]), float(data["max"])
+        return m
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch.
+
+    Keeps a stack of compactors whose capacities shrink geometrically with
+    height; a full compactor sorts its items and promotes every other one to
+    the next level with double weight. Rank error is roughly 1.7 / k, and
+    memory stays O(k) no matter how many values are added.
+    """
+
+    def __init__(self, k: int = 200, seed: int = 0) -> None:
+        self.k = k
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def update(self, values: Iterable[float]) -> None:
+        arr = np.asarray(values, dtype=np.float64).ravel()
+        arr = arr[~np.isnan(arr)]
+        if arr.size == 0:
+            return
+        self.count += int(arr.size)
+        self.min = min(self.min, float(arr.min()))
+        self.max = max(self.max, float(arr.max()))
+        self.levels[0] = np.concatenate([self.levels[0], arr])
+        self._compress()
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if items.size <= self._capacity(level):
+                level += 1
+                continue
+            grew = level + 1 == len(self.levels)
+            if grew:
+                self.levels.append(np.empty(0, dtype=np.float64))
+            items = np.sort(items)
+            # Keep one item back when the count is odd so weights stay exact
+            keep = items[:1] if items.size % 2 else items[:0]
+            paired = items[keep.size:]
+            offset = int(self._rng.integers(0, 2))
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], paired[offset::2]])
+            # A taller stack shrinks every lower capacity, so start over
+            level = 0 if grew else level + 1
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.count == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        if q <= 0.0:
+            return self.min
+        if q >= 1.0:
+            return self.max
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(lv.size, 1 << h, dtype=np.float64) for h, lv in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cum = np.cumsum(weights[order])
+        idx = int(np.searchsorted(cum, q * cum[-1], side="left"))
+        return float(items[order][min(idx, items.size - 1)])
+
+    def median(self) -> Optional[float]:
+        return self.quantile(0.5)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "levels": [lv.tolist() for lv in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], seed: int = 0) -> "QuantileSketch":
+        sketch = cls(k=int(data["k"]), seed=seed)
+        sketch.count = int(data["count"])
+        if sketch.count:
+            sketch.min, sketch.max = float(data["min"]), float(data["max"])
+        sketch.levels = [np.asarray(lv, dtype=np.float64) for lv in data["levels"]] or [np.empty(0, dtype=np.float64)]
+        return sketch
+
+
+def hash_values(values: Iterable[Any]) -> np.ndarray:
+    """Stable 64-bit hashes (pandas' siphash) for strings or numbers."""
+    arr = np.asarray(values, dtype=object)
+    return pd.util.hash_array(arr, categorize=False).astype(np.uint64)
+
+
+class HeavyHitters:
+    """
+    Space-Saving / Misra-Gries top-k summary.
+
+    Holds at most `capacity` counters. Values are folded in as (value, weight)
+    pairs, which is how they come out of a per-chunk value count. When two
+    summaries are merged the counters are added and, if more than `capacity`
+    remain, the (capacity + 1)-th largest count is subtracted from all of them
+    and the non-positive ones dropped (Agarwal et al., mergeable summaries).
+    Every reported count is therefore a lower bound, short of the true
+    frequency by at most `error`, which never exceeds total / (capacity + 1).
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.capacity = capacity
+        self.total = 0
+        self.error = 0
+        self.counts: Dict[Any, int] = {}
+
+    def update(self, values: Iterable[Any], weights: Optional[Iterable[int]] = None) -> None:
+        values = list(values)
+        if weights is None:
+            weights = [1] * len(values)
+        other = HeavyHitters(self.capacity)
+        for value, weight in zip(values, weights):
+            other.counts[value] = other.counts.get(value, 0) + int(weight)
+            other.total += int(weight)
+        other._prune()
+        self.merge(other)
+
+    def merge(self, other: "HeavyHitters") -> "HeavyHitters":
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.total += other.total
+        self.error += other.error
+        self._prune()
+        return self
+
+    def _prune(self) -> None:
+        if len(self.counts) <= self.capacity:
+            return
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        floor = ranked[self.capacity][1]
+        self.counts = {v: c - floor for v, c in ranked[:self.capacity] if c > floor}
+        self.error += floor
+
+    def top(self, k: int = 10) -> List[Dict[str, Any]]:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [{"value": v, "count": c, "error": self.error} for v, c in ranked]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "error": self.error,
+            "items": [[v, c] for v, c in self.counts.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HeavyHitters":
+        hh = cls(capacity=int(data["capacity"]))
+        hh.total = int(data["total"])
+        hh.error = int(data["error"])
+        hh.counts = {value: int(count) for value, count in data["items"]}
+        return hh
+
+
+# Odd multipliers that turn one 64-bit hash into independent-enough row hashes
+_ROW_SEEDS = np.array(
+    [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+     0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9],
+    dtype=np.uint64,
+)
+
+
+class CountMinSketch:
+    """Count-Min sketch: frequency upper bounds for any value in depth x width counters."""
+
+    def __init__(self, width: int = 4096, depth: int = 4) -> None:
+        if depth > len(_ROW_SEEDS):
+            raise ValueError(f"depth must be at most {len(_ROW_SEEDS)}")
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        with np.errstate(over="ignore"):
+            mixed = hashes[None, :] * _ROW_SEEDS[:self.depth, None]
+        return ((mixed >> np.uint64(32)) % np.uint64(self.width)).astype(np.intp)
+
+    def update(self, values: Iterable[Any], weights: Optional[Iterable[int]] = None) -> None:
+        hashes = hash_values(values)
+        if hashes.size == 0:
+            return
+        w = np.ones(hashes.size, dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        cols = self._columns(hashes)
+        for row in range(self.depth):
+            np.add.at(self.table[row], cols[row], w)
+        self.total += int(w.sum())
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Count-Min sketches must have the same shape to merge")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def estimate(self, value: Any) -> int:
+        cols = self._columns(hash_values([value]))[:, 0]
+        return int(self.table[np.arange(self.depth), cols].min())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "width": self.width,
+            "depth": self.depth,
+            "total": self.total,
+            "table": base64.b64encode(self.table.astype("<i8").tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CountMinSketch":
+        cms = cls(width=int(data["width"]), depth=int(data["depth"]))
+        cms.total = int(data["total"])
+        raw = np.frombuffer(base64.b64decode(data["table"]), dtype="<i8")
+        cms.table = raw.reshape(cms.depth, cms.width).astype(np.int64)
+        return cms
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2**p one-byte registers (~1.04 / sqrt(2**p) error)."""
+
+    def __init__(self, p: int = 14) -> None:
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values: Iterable[Any]) -> None:
+        hashes = hash_values(values)
+        if hashes.size == 0:
+            return
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        # Only the low 50 bits feed the rank so the float64 exponent below is exact
+        rest = (hashes & np.uint64((1 << 50) - 1)).astype(np.float64)
+        _, bit_length = np.frexp(rest)
+        rank = (51 - bit_length).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("HyperLogLog sketches must have the same precision to merge")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def cardinality(self) -> int:
+        m = float(self.registers.size)
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is far more accurate while many registers are empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"p": self.p, "registers": base64.b64encode(self.registers.tobytes()).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        hll = cls(p=int(data["p"]))
+        hll.registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return hll
@@ -0,0 +1,40 @@
+import os
+import random
+import sys
+
+import pytest
+
+# Backend modules use flat imports (run from the backend directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEADER = "timestamp,source_ip,dest_ip,protocol,action,threat_label,log_type,bytes_transferred,user_agent,request_path"
+LABELS = ("benign", "suspicious", "malicious")
+
+
+@pytest.fixture
+def dataset_csv(tmp_path):
+    """A small threat log in the Kaggle layout: 3,000 rows, one every 9 seconds."""
+    rng = random.Random(7)
+    path = tmp_path / "logs.csv"
+    lines = [HEADER]
+    for i in range(3000):
+        minute, second = divmod(i * 9, 60)
+        hour, minute = divmod(minute, 60)
+        lines.append(
+            f"2024-01-01 {hour:02d}:{minute:02d}:{second:02d},192.168.{rng.randint(0, 3)}.{rng.randint(1, 254)},"
+            f"10.0.0.{rng.randint(1, 40)},{rng.choice(['TCP', 'UDP', 'HTTPS'])},{rng.choice(['allowed', 'blocked', 'dropped'])},"
+            f"{LABELS[i % 3]},{rng.choice(['firewall', 'ids', 'application'])},{rng.randint(100, 50000)},"
+            f"UA-{rng.randint(1, 50)},/p/{rng.randint(1, 200)}"
+        )
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def store(dataset_csv, tmp_path):
+    """Compressed columnar cache split into many small file batches."""
+    from dataset_store import DatasetStore
+
+    s = DatasetStore(dataset_csv, cache_dir=str(tmp_path / "cache"), compression="zstd", block_size=16 << 10)
+    s.ensure()
+    return s
@@ -0,0 +1,52 @@
+import io
+
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.ipc as ipc
+import pytest
+
+from dataset_export import iter_export, iter_row_batches
+from dataset_index import DatasetIndex
+
+
+@pytest.fixture
+def index(store):
+    return DatasetIndex.load_or_build(store)
+
+
+def _expected(index, label):
+    rows = [i for i, r in enumerate(index.store.take(range(index.num_rows))) if r["threat_label"] == label]
+    return index.store.take(rows)
+
+
+def test_row_batches_span_file_batches_in_order(index):
+    assert len(index.store.batch_starts()) > 3
+    result = index.query({"threat_label": ["suspicious"]})
+    tables = list(iter_row_batches(result, batch_rows=333))
+    assert [t.num_rows for t in tables[:-1]] == [333] * (len(tables) - 1)
+    assert pa.concat_tables(tables).to_pylist() == _expected(index, "suspicious")
+    assert index.store._table is None
+
+
+def test_row_batches_stop_at_max_rows(index):
+    result = index.query({"threat_label": ["benign"]})
+    assert sum(t.num_rows for t in iter_row_batches(result, batch_rows=64, max_rows=150)) == 150
+
+
+def test_ndjson_and_csv_exports(index):
+    result = index.query({"threat_label": ["malicious"]})
+    expected = _expected(index, "malicious")
+    lines = b"".join(iter_export(result, "ndjson", batch_rows=256)).splitlines()
+    assert [orjson.loads(line) for line in lines] == orjson.loads(orjson.dumps(expected))
+    table = pacsv.read_csv(io.BytesIO(b"".join(iter_export(result, "csv", batch_rows=256))))
+    assert table.num_rows == len(expected)
+    assert table.column("source_ip").to_pylist() == [r["source_ip"] for r in expected]
+
+
+def test_arrow_export_of_no_rows_carries_the_schema(index):
+    result = index.query({"threat_label": ["unknown"]})
+    table = ipc.open_stream(b"".join(iter_export(result, "arrow"))).read_all()
+    assert table.num_rows == 0
+    assert table.column_names == index.store.columns
+    assert not any(pa.types.is_dictionary(f.type) for f in table.schema)
@@ -0,0 +1,69 @@
+import pytest
+
+from dataset_index import DatasetIndex, encode_cursor
+
+
+@pytest.fixture
+def index(store):
+    return DatasetIndex.load_or_build(store)
+
+
+def test_page_walks_one_value_with_cursors(index):
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = index.page("threat_label", "malicious", cursor=cursor, limit=150)
+        seen.extend(rows.tolist())
+        if cursor is None:
+            break
+    assert len(seen) == index.column("threat_label").count("malicious") == 1000
+    labels = {r["threat_label"] for r in index.store.take(seen)}
+    assert labels == {"malicious"}
+
+
+@pytest.mark.parametrize("position", [-3, "5", 1.5, True, None])
+def test_page_rejects_forged_positions(index, position):
+    cursor = encode_cursor({"c": "threat_label", "v": "malicious", "p": position}, index.store.fingerprint)
+    with pytest.raises(ValueError):
+        index.page("threat_label", "malicious", cursor=cursor)
+
+
+def test_page_rejects_cursor_of_another_value(index):
+    _, cursor = index.page("threat_label", "benign", limit=10)
+    with pytest.raises(ValueError):
+        index.page("threat_label", "malicious", cursor=cursor)
+
+
+def test_rows_never_leave_their_value(index):
+    column = index.column("threat_label")
+    rows = column.rows("malicious", -3, 5)
+    assert {r["threat_label"] for r in index.store.take(rows)} <= {"malicious"}
+
+
+def test_query_pages_through_all_matches(index):
+    result = index.query({"threat_label": ["malicious", "benign"], "protocol": ["TCP"]})
+    expected = [
+        i for i, r in enumerate(index.store.take(range(index.num_rows)))
+        if r["threat_label"] in ("malicious", "benign") and r["protocol"] == "TCP"
+    ]
+    seen, cursor = [], None
+    while True:
+        rows, cursor = result.page(cursor=cursor, limit=97)
+        seen.extend(rows.tolist())
+        if cursor is None:
+            break
+    assert seen == expected == sorted(expected)
+    assert result.count() == len(expected)
+
+
+def test_query_time_range_is_end_exclusive(index):
+    result = index.query({}, start="2024-01-01 00:00:00", end="2024-01-01 00:01:30")
+    assert result.count() == 10
+
+
+@pytest.mark.parametrize("position", [-8, "16", 2.5, False])
+def test_query_page_rejects_forged_positions(index, position):
+    result = index.query({"action": ["blocked"]})
+    cursor = encode_cursor({"q": result.key, "r": position}, index.store.fingerprint)
+    with pytest.raises(ValueError):
+        result.page(cursor=cursor)
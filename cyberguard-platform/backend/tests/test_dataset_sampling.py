@@ -0,0 +1,42 @@
+from collections import Counter
+
+import pytest
+
+from dataset_index import DatasetIndex
+from dataset_sampling import DatasetSampler
+
+
+@pytest.fixture
+def sampler(store):
+    return DatasetSampler(DatasetIndex.load_or_build(store), seed=1)
+
+
+def test_unseeded_samples_do_not_repeat_until_the_pool_wraps(sampler):
+    seen = set()
+    for _ in range(10):
+        rows = sampler.sample(300)
+        assert len(rows) == 300
+        seen.update(rows.tolist())
+    assert len(seen) == 3000
+
+
+def test_seeded_samples_are_reproducible(sampler):
+    assert sampler.sample(50, seed=9).tolist() == sampler.sample(50, seed=9).tolist()
+
+
+def test_stratified_sample_is_balanced(sampler):
+    rows = sampler.sample(90, stratify="threat_label")
+    labels = Counter(r["threat_label"] for r in sampler.index.store.take(rows))
+    assert labels == {"benign": 30, "suspicious": 30, "malicious": 30}
+
+
+def test_stratify_rejects_high_cardinality_columns(sampler):
+    assert len(sampler.index.column("source_ip").values) > 64
+    with pytest.raises(ValueError):
+        sampler.sample(10, stratify="source_ip")
+    assert not sampler._pools
+
+
+def test_stratify_rejects_unindexed_columns(sampler):
+    with pytest.raises(KeyError):
+        sampler.sample(10, stratify="user_agent")
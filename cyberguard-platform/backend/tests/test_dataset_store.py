@@ -0,0 +1,39 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+
+def _full(store):
+    return ipc.open_file(pa.memory_map(store.cache_path, "r")).read_all()
+
+
+def test_cache_has_several_batches(store):
+    starts = store.batch_starts()
+    assert len(starts) > 3
+    assert starts[-1] == store.num_rows == 3000
+
+
+def test_take_matches_full_table_in_requested_order(store):
+    ids = np.random.default_rng(0).integers(0, store.num_rows, 500)
+    expected = _full(store).take(pa.array(ids))
+    assert store.take_table(ids).equals(expected)
+    assert store.take(ids[:20]) == expected.slice(0, 20).to_pylist()
+
+
+def test_take_selects_columns_and_handles_empty(store):
+    table = store.take_table([5, 1, 2999], columns=["threat_label"])
+    assert table.column_names == ["threat_label"]
+    assert table.column(0).to_pylist() == [_full(store).column("threat_label")[i].as_py() for i in (5, 1, 2999)]
+    assert store.take([]) == []
+    assert store.take_table([], columns=["action"]).num_rows == 0
+
+
+def test_take_does_not_materialize_the_table(store):
+    store.take([1, 2])
+    assert store._table is None
+
+
+def test_batch_starts_without_recorded_batch_sizes(store):
+    store._manifest.pop("batch_rows")
+    store._batch_starts = None
+    assert store.batch_starts()[-1] == 3000
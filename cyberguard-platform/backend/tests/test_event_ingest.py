@@ -0,0 +1,178 @@
+import pytest
+from pymongo.errors import BulkWriteError
+
+from event_ingest import DUPLICATE_KEY, EventIngest
+
+
+class Collection:
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.inserted = []
+        self.updates = []
+
+    def insert_many(self, docs, ordered=True):
+        assert ordered is False
+        if self.errors:
+            failed = self.errors.pop(0)
+            self.inserted.extend(d for i, d in enumerate(docs) if i not in failed)
+            raise BulkWriteError({"writeErrors": [{"index": i, "code": code} for i, code in failed.items()]})
+        self.inserted.extend(docs)
+
+    def bulk_write(self, ops, ordered=True):
+        self.updates.extend(ops)
+
+
+def _events(n):
+    return [{"event_id": i} for i in range(n)]
+
+
+def _ingest(collection, **kwargs):
+    return EventIngest(lambda: collection, backoff_sec=0.0, **kwargs)
+
+
+def _queued(ingest):
+    return [item.doc["event_id"] for item in ingest._queue]
+
+
+def test_drop_oldest_keeps_the_latest_events():
+    ingest = _ingest(Collection(), max_queue=3)
+    assert all(ingest.submit(e) for e in _events(5))
+    assert _queued(ingest) == [2, 3, 4]
+    assert ingest.stats()["dropped"] == 2 and ingest.accepting
+
+
+def test_drop_newest_refuses_the_incoming_event():
+    ingest = _ingest(Collection(), max_queue=3, policy="drop_newest")
+    assert [ingest.submit(e) for e in _events(5)] == [True, True, True, False, False]
+    assert _queued(ingest) == [0, 1, 2]
+    assert ingest.stats()["dropped"] == 2
+
+
+def test_reject_stops_accepting_until_the_queue_drains():
+    collection = Collection()
+    ingest = _ingest(collection, max_queue=2, policy="reject")
+    assert [ingest.submit(e) for e in _events(3)] == [True, True, False]
+    assert not ingest.accepting and ingest.stats()["rejected"] == 1
+    ingest._write(ingest._take(), retries=0)
+    assert ingest.accepting and len(collection.inserted) == 2
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        EventIngest(lambda: None, policy="block")
+
+
+def test_batches_insert_then_update():
+    collection = Collection()
+    ingest = _ingest(collection, max_batch=4)
+    for e in _events(3):
+        ingest.submit(e)
+    ingest.submit_update({"event_id": 1}, {"$set": {"reasoning": "scan"}})
+    ingest._write(ingest._take(), retries=0)
+    assert [d["event_id"] for d in collection.inserted] == [0, 1, 2]
+    assert len(collection.updates) == 1
+    stats = ingest.stats()
+    assert (stats["inserted"], stats["updated"], stats["batches"]) == (3, 1, 1)
+
+
+def test_retries_only_what_failed_and_counts_duplicates_as_written():
+    # first attempt: event 1 hits a transient error, event 2 already exists
+    collection = Collection(errors=[{1: 91, 2: DUPLICATE_KEY}])
+    ingest = _ingest(collection)
+    for e in _events(4):
+        ingest.submit(e)
+    ingest._write(ingest._take(), retries=3)
+    assert sorted(d["event_id"] for d in collection.inserted) == [0, 1, 3]
+    stats = ingest.stats()
+    assert (stats["inserted"], stats["duplicates"], stats["retries"], stats["failed"]) == (3, 1, 1, 0)
+
+
+class FlakyCollection(Collection):
+    """Writes the first `partial` documents of the first batch, then loses the connection."""
+
+    def __init__(self, partial):
+        super().__init__()
+        self.partial = partial
+
+    def insert_many(self, docs, ordered=True):
+        if self.partial is None:
+            stored = {d["event_id"] for d in self.inserted}
+            fresh = [i for i, d in enumerate(docs) if d["event_id"] not in stored]
+            self.inserted.extend(docs[i] for i in fresh)
+            if len(fresh) < len(docs):
+                duplicates = [{"index": i, "code": DUPLICATE_KEY} for i in range(len(docs)) if i not in fresh]
+                raise BulkWriteError({"writeErrors": duplicates})
+            return
+        self.inserted.extend(docs[: self.partial])
+        self.partial = None
+        raise ConnectionError("connection reset")
+
+
+def test_documents_written_before_a_failed_attempt_count_as_inserted():
+    collection = FlakyCollection(partial=2)
+    ingest = _ingest(collection)
+    for e in _events(5):
+        ingest.submit(e)
+    ingest._write(ingest._take(), retries=3)
+    assert sorted(d["event_id"] for d in collection.inserted) == [0, 1, 2, 3, 4]
+    stats = ingest.stats()
+    assert (stats["inserted"], stats["duplicates"], stats["retries"], stats["failed"]) == (5, 0, 1, 0)
+
+
+def test_gives_up_after_max_retries():
+    collection = Collection(errors=[{0: 91}] * 3)
+    ingest = _ingest(collection)
+    ingest.submit({"event_id": 0})
+    ingest._write(ingest._take(), retries=2)
+    stats = ingest.stats()
+    assert (stats["retries"], stats["failed"], stats["inserted"]) == (2, 1, 0)
+
+
+def test_events_without_a_database_are_counted_unavailable():
+    ingest = _ingest(None)
+    ingest.submit({"event_id": 0})
+    ingest._write(ingest._take(), retries=5)
+    assert ingest.stats()["unavailable"] == 1
+
+
+def test_stop_writes_what_is_queued():
+    collection = Collection()
+    ingest = _ingest(collection, interval_sec=60.0)
+    ingest.start()
+    for e in _events(5):
+        ingest.submit(e)
+    ingest.stop(timeout=5.0)
+    assert len(collection.inserted) == 5 and not ingest.stats()["running"]
+
+
+def test_saturated_ingestion_only_blocks_endpoints_that_create_events(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    main.simulator.init_nodes()
+    full = EventIngest(lambda: None, max_queue=1, policy="reject")
+    full.submit({"event_id": 0})
+    monkeypatch.setattr(main, "event_ingest", full)
+    client = TestClient(main.app)
+    node_id = next(iter(main.simulator.nodes))
+
+    response = client.post(f"/api/attack/{node_id}/exfiltration")
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+    assert client.post(f"/api/attack/{node_id}/ddos").json()["status"] == "started"
+
+
+def test_saturated_ingestion_still_reports_unknown_nodes(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    main.simulator.init_nodes()
+    full = EventIngest(lambda: None, max_queue=1, policy="reject")
+    full.submit({"event_id": 0})
+    monkeypatch.setattr(main, "event_ingest", full)
+    client = TestClient(main.app)
+    node_id = next(iter(main.simulator.nodes))
+
+    assert client.post("/ai-analyze/no-such-node").status_code == 404
+    assert client.post(f"/ai-analyze/{node_id}").status_code == 503
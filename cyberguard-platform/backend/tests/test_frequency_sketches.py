@@ -0,0 +1,63 @@
+from collections import Counter
+
+import numpy as np
+
+from sketches import CountMinSketch, HeavyHitters, HyperLogLog
+
+
+def _zipf_paths(n, seed=0):
+    ranks = np.random.default_rng(seed).zipf(1.3, n)
+    return [f"/path/{r}" for r in ranks]
+
+
+def test_heavy_hitters_bounds_hold_across_merges():
+    values = _zipf_paths(50_000)
+    truth = Counter(values)
+    merged = HeavyHitters(capacity=64)
+    for start in range(0, len(values), 5_000):
+        part = HeavyHitters(capacity=64)
+        part.update(*zip(*Counter(values[start:start + 5_000]).items()))
+        merged.merge(part)
+    assert merged.total == len(values)
+    assert len(merged.counts) <= 64
+    assert merged.error <= merged.total / 65
+    for entry in merged.top(10):
+        assert truth[entry["value"]] - merged.error <= entry["count"] <= truth[entry["value"]]
+    assert [e["value"] for e in merged.top(3)] == [v for v, _ in truth.most_common(3)]
+
+
+def test_heavy_hitters_round_trip():
+    hh = HeavyHitters(capacity=8)
+    hh.update(["a", "b", "a", "c"])
+    restored = HeavyHitters.from_dict(hh.to_dict())
+    assert restored.top() == hh.top() == [
+        {"value": "a", "count": 2, "error": 0},
+        {"value": "b", "count": 1, "error": 0},
+        {"value": "c", "count": 1, "error": 0},
+    ]
+
+
+def test_count_min_never_underestimates():
+    values = _zipf_paths(20_000, seed=1)
+    truth = Counter(values)
+    cms = CountMinSketch(width=1024, depth=4)
+    half = len(values) // 2
+    cms.update(values[:half])
+    cms.merge(CountMinSketch(1024, 4)).update(values[half:])
+    slack = 2 * cms.total / cms.width
+    for value, count in truth.most_common(50):
+        assert count <= cms.estimate(value) <= count + slack
+    assert cms.estimate("/never/seen") <= slack
+    assert CountMinSketch.from_dict(cms.to_dict()).estimate("/path/1") == cms.estimate("/path/1")
+
+
+def test_hyperloglog_estimates_distinct_counts():
+    a, b = HyperLogLog(p=12), HyperLogLog(p=12)
+    a.update([f"10.0.{i // 256}.{i % 256}" for i in range(30_000)])
+    b.update([f"10.0.{i // 256}.{i % 256}" for i in range(20_000, 50_000)])
+    assert abs(a.cardinality() - 30_000) / 30_000 < 0.05
+    merged = HyperLogLog.from_dict(a.to_dict()).merge(b)
+    assert abs(merged.cardinality() - 50_000) / 50_000 < 0.05
+    small = HyperLogLog()
+    small.update(["x", "y", "x"])
+    assert small.cardinality() == 2
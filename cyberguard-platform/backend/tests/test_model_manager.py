@@ -0,0 +1,118 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import model_manager
+from model_manager import ModelManager
+from node_history import METRIC_FIELDS, NETWORK_IN, FleetHistory
+
+pytestmark = pytest.mark.skipif(model_manager.IsolationForest is None, reason="scikit-learn is not installed")
+
+NODES = 8
+
+
+class FakeForest:
+    def decision_function(self, xs):
+        return -np.abs(xs[:, 0])
+
+
+def _manager(fits, fail=False, **kwargs):
+    history = FleetHistory(capacity=64, initial_nodes=NODES)
+    baseline = history.track(1000.0, cpu_threshold=90.0)
+
+    def fit(xs, n_estimators, contamination, seed):
+        fits.append(xs)
+        if fail:
+            raise RuntimeError("fit failed")
+        return FakeForest()
+
+    manager = ModelManager(history, baseline, train_samples=20, min_samples=10, **kwargs)
+    manager._pool = ThreadPoolExecutor(1)
+    return manager, fit
+
+
+def _record(manager, ticks, level, rng, start=0.0):
+    rows = np.array([manager.history.slot(f"n{i}") for i in range(NODES)])
+    for t in range(ticks):
+        values = np.full((len(METRIC_FIELDS), NODES), 10.0, dtype=np.float32)
+        values[NETWORK_IN] = level * rng.uniform(0.9, 1.1, NODES)
+        manager.history.record_rows(rows, start + t, values)
+    return start + ticks
+
+
+async def _settle(manager):
+    while manager._training:
+        await asyncio.gather(*manager._training.values())
+
+
+def test_training_and_scoring_share_one_feature(monkeypatch):
+    fits = []
+    manager, fit = _manager(fits)
+    monkeypatch.setattr(model_manager, "_fit_forest", fit)
+    _record(manager, 20, 1000.0, np.random.default_rng(0))
+    rows = np.arange(NODES)
+    trained = manager.training_set(rows).reshape(NODES, -1)
+    # With the baseline window covering exactly the training depth, a node's
+    # newest training sample is what scoring sees for it now
+    np.testing.assert_allclose(trained[:, -1], manager.current_features(rows))
+    assert abs(trained.mean()) < 0.05
+
+
+def test_drift_retrains_once_and_not_before_min_interval(monkeypatch):
+    fits = []
+    manager, fit = _manager(fits, min_retrain_sec=30.0)
+    monkeypatch.setattr(model_manager, "_fit_forest", fit)
+    rng = np.random.default_rng(1)
+
+    async def run():
+        t = _record(manager, 20, 1000.0, rng)
+        manager.maybe_refresh()
+        await _settle(manager)
+        trained_at = manager.models["fleet"].trained_at
+        # Attack: every node at 20x its baseline
+        _record(manager, 1, 20000.0, rng, start=t)
+        assert manager._needs_refresh("fleet", np.arange(NODES), trained_at + 5) is False
+        for dt in range(5, 30):
+            manager.maybe_refresh(now=trained_at + dt)
+        assert len(fits) == 1
+        manager.maybe_refresh(now=trained_at + 31)
+        await _settle(manager)
+        assert len(fits) == 2
+        live = float(manager.current_features(np.arange(NODES)).mean())
+        assert manager.models["fleet"].mean == pytest.approx(live)
+        # The reference moved with the attack, so the same traffic is no longer drift
+        later = manager.models["fleet"].trained_at + 60
+        for dt in range(10):
+            manager.maybe_refresh(now=later + dt)
+        assert len(fits) == 2
+
+    asyncio.run(run())
+    manager.shutdown()
+
+
+def test_failed_fits_back_off(monkeypatch):
+    fits = []
+    manager, fit = _manager(fits, fail=True, retry_sec=10.0, max_retry_sec=25.0)
+    monkeypatch.setattr(model_manager, "_fit_forest", fit)
+    _record(manager, 20, 1000.0, np.random.default_rng(2))
+
+    async def run():
+        delays = []
+        for _ in range(3):
+            now = time.time()
+            manager.maybe_refresh(now=now)
+            await _settle(manager)
+            failures, retry_at = manager._failures["fleet"]
+            delays.append(round(retry_at - now))
+            manager.maybe_refresh(now=retry_at - 1)
+            assert not manager._training
+            manager._failures["fleet"] = (failures, 0.0)
+        assert delays == [10, 20, 25]
+        assert len(fits) == 3
+        assert "fleet" not in manager.models
+
+    asyncio.run(run())
+    manager.shutdown()
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from node_history import METRIC_FIELDS, FleetHistory
+
+
+def _brute(history, node_id, sec, now, cpu_threshold):
+    w = history.window(node_id, sec, now=now)
+    return (
+        len(w),
+        int(np.sum(w.cpu >= cpu_threshold)) if cpu_threshold is not None else 0,
+        int(np.sum(np.diff(w.memory) > 0)),
+        float(np.sum(w.network_in.astype(np.float64) + w.network_out)),
+    )
+
+
+def _drive(history, window, rng, ticks, nodes, start=0.0):
+    now = start
+    for _ in range(ticks):
+        now += rng.uniform(0.5, 4.0)
+        picked = sorted(rng.choice(nodes, size=rng.integers(1, nodes + 1), replace=False))
+        rows = np.array([history.slot(f"n{i}") for i in picked])
+        values = rng.uniform(0, 100, (len(METRIC_FIELDS), len(rows))).round(2).astype(np.float32)
+        history.record_rows(rows, now, values)
+        window.evict(now)
+        for i in range(nodes):
+            node_id = f"n{i}"
+            if node_id not in history:
+                continue
+            row = history.slots[node_id]
+            got = (
+                int(window.count[row]),
+                int(window.cpu_over[row]),
+                int(window.mem_increases[row]),
+                float(window.traffic_sum[row]),
+            )
+            want = _brute(history, node_id, window.sec, now, window.cpu_threshold)
+            assert got[:3] == want[:3]
+            assert got[3] == pytest.approx(want[3], rel=1e-9, abs=1e-6)
+    return now
+
+
+@pytest.mark.parametrize("sec", [5.0, 30.0, 1000.0])
+def test_rolling_window_matches_a_rescan(sec):
+    # capacity 16 makes long windows wrap the ring buffer
+    history = FleetHistory(capacity=16, initial_nodes=2)
+    window = history.track(sec, cpu_threshold=70.0)
+    _drive(history, window, np.random.default_rng(int(sec)), ticks=200, nodes=9)
+
+
+def test_windows_without_a_threshold_skip_cpu_counts():
+    history = FleetHistory(capacity=16, initial_nodes=2)
+    window = history.track(30.0)
+    _drive(history, window, np.random.default_rng(4), ticks=60, nodes=3)
+    assert not window.cpu_over.any()
+    counting = history.track(30.0, cpu_threshold=80.0)
+    assert counting is not window and history.track(30.0) is window
+
+    shared = FleetHistory(capacity=16)
+    counting = shared.track(30.0, cpu_threshold=80.0)
+    # a window that counts cpu also serves the same span without a threshold
+    assert shared.track(30.0) is counting
+    assert shared.track(30.0, cpu_threshold=90.0) is not counting
+
+
+def test_window_tracked_late_replays_the_buffer():
+    history = FleetHistory(capacity=16, initial_nodes=4)
+    rng = np.random.default_rng(11)
+    early = history.track(20.0, cpu_threshold=50.0)
+    now = _drive(history, early, rng, ticks=40, nodes=5)
+    late = history.track(12.0, cpu_threshold=60.0)
+    late.evict(now)
+    _drive(history, late, rng, ticks=40, nodes=7, start=now)
+    assert history.track(12.0, cpu_threshold=60.0) is late
+
+
+def test_window_views_are_read_only_and_in_time_order():
+    history = FleetHistory(capacity=4)
+    for t in range(10):
+        history.record_values("a", float(t), [t, 0, 0, 0, 0])
+    series = history.series("a")
+    assert series.ts.tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert history.latest("a").cpu == 9.0
+    assert not series.cpu.flags.writeable
+    assert history.window("a", 2.5, now=9.0).ts.tolist() == [7.0, 8.0, 9.0]
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from node_history import METRIC_FIELDS, NETWORK_IN
+from node_simulator import _METRIC_RANGES, HEALTHY, OFFLINE, WARNING, NodeSimulator
+
+
+class Clock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def sim(clock):
+    s = NodeSimulator(50, seed=7, clock=clock)
+    s.init_nodes()
+    return s
+
+
+def test_node_dicts_match_the_models(sim):
+    sim.tick()
+    sim.quarantine(np.array([3]))
+    assert sim.node_dicts() == [n.model_dump() for n in sim.nodes.values()]
+    assert list(sim.nodes) == [f"node-{i}" for i in range(1, 51)]
+    assert "node-50" in sim.nodes and "node-51" not in sim.nodes
+
+
+def test_tick_keeps_metrics_in_range(sim, clock):
+    for _ in range(20):
+        clock.now += 2.0
+        sim.tick()
+        for row, field in enumerate(METRIC_FIELDS):
+            low, high, decimals = _METRIC_RANGES[field]
+            values = sim.metrics[row]
+            assert values.min() >= low and values.max() <= high
+            np.testing.assert_array_equal(values, np.round(values, decimals))
+    assert (sim.last_update == clock.now).all()
+
+
+def test_ddos_ramp_raises_inbound_traffic(sim, clock):
+    sim.simulate_ddos("node-5")
+    attacked, fleet = [], []
+    for _ in range(30):
+        clock.now += 2.0
+        sim.tick()
+        attacked.append(sim.metrics[NETWORK_IN, 4])
+        fleet.append(np.delete(sim.metrics[NETWORK_IN], 4).mean())
+    assert sim.status[4] == WARNING
+    # fully ramped (45 s) traffic is 3-6x the normal draw
+    assert np.mean(attacked[-8:]) > 2.5 * np.mean(fleet[-8:])
+    assert np.mean(attacked[:2]) < np.mean(attacked[-8:])
+
+
+def test_quarantine_release_and_stop_attack(sim, clock):
+    rows = np.array([0, 1])
+    sim.start_attack(rows, "exfiltration", factor=4.0)
+    clock.now += 5.0
+    sim.tick()
+    assert (sim.status[rows] == WARNING).all()
+
+    sim.quarantine(rows[:1])
+    sim.stop_attack(rows)
+    assert sim.nodes["node-1"].status == "offline" and sim.nodes["node-2"].status == "healthy"
+    assert np.isnan(sim.ramp_start[rows]).all()
+    clock.now += 2.0
+    sim.tick()
+    assert sim.status[0] == OFFLINE and sim.metrics[NETWORK_IN, 0] == 0.0
+
+    clock.now += 1.0
+    sim.release(rows[:1])
+    assert sim.status[0] == HEALTHY and sim.last_update[0] == clock.now
+    assert not sim.quarantined.any()
+
+
+def test_redistribute_load_ignores_unknown_nodes(sim):
+    metrics, status = sim.metrics.copy(), sim.status.copy()
+    sim.redistribute_load("node-999")
+    np.testing.assert_array_equal(sim.metrics, metrics)
+    np.testing.assert_array_equal(sim.status, status)
+    sim.redistribute_load("node-2")
+    assert sim.status[1] == WARNING and sim.metrics[NETWORK_IN, 1] == metrics[NETWORK_IN, 1] * 0.5
+
+
+def test_same_seed_same_fleet():
+    runs = []
+    for _ in range(2):
+        clock = Clock()
+        s = NodeSimulator(200, seed=42, clock=clock)
+        s.init_nodes()
+        s.start_attack(np.arange(10), "ddos")
+        for _ in range(10):
+            clock.now += 2.0
+            s.tick()
+        runs.append((s.metrics, s.status, s.ramp_factor))
+    for a, b in zip(*runs):
+        np.testing.assert_array_equal(a, b)
+    other = NodeSimulator(200, seed=43, clock=Clock())
+    other.init_nodes()
+    assert not np.array_equal(other.metrics, runs[0][0])
@@ -0,0 +1,97 @@
+import pytest
+
+from node_history import CPU, MEMORY, METRIC_FIELDS
+from node_simulator import CRITICAL, NodeSimulator
+from node_stream import DELTA_FIELDS, SNAPSHOT_FIELDS, NodeStream, narrow
+
+
+@pytest.fixture
+def sim():
+    s = NodeSimulator(20, seed=5, clock=lambda: 1_000.0)
+    s.init_nodes()
+    return s
+
+
+def _ids(frame):
+    return [row[0] for row in frame["rows"]]
+
+
+def test_first_delta_carries_every_node(sim):
+    stream = NodeStream(sim)
+    frame = stream.delta(1.0)
+    assert frame["seq"] == 1 and frame["fields"] == DELTA_FIELDS
+    assert _ids(frame) == sim.ids
+    assert frame["rows"][3] == [sim.ids[3], "healthy", *sim.metrics[:, 3].tolist()]
+    assert stream.delta(2.0)["rows"] == []
+
+
+def test_moves_within_tolerance_are_left_out(sim):
+    stream = NodeStream(sim, rel_tolerance=0.01, abs_tolerance=0.01)
+    stream.delta(1.0)
+    sim.metrics[CPU, 0] *= 1.005  # relative move under 1%
+    sim.metrics[MEMORY, 1] += 0.01  # at the absolute floor
+    sim.metrics[CPU, 2] *= 1.05
+    sim.metrics[MEMORY, 4] = sim.metrics[MEMORY, 4] * 0.9
+    assert _ids(stream.delta(2.0)) == [sim.ids[2], sim.ids[4]]
+
+
+def test_small_moves_accumulate_against_the_last_sent_value(sim):
+    stream = NodeStream(sim)
+    stream.delta(1.0)
+    sent = sim.metrics[CPU, 0]
+    for _ in range(3):
+        sim.metrics[CPU, 0] *= 1.004
+        frame = stream.delta(2.0)
+    # 1.004 ** 3 > 1.01: the third step crosses the tolerance from what was sent
+    assert _ids(frame) == [sim.ids[0]]
+    assert frame["rows"][0][DELTA_FIELDS.index("cpu")] == pytest.approx(sent * 1.004 ** 3)
+
+
+def test_status_change_alone_is_included(sim):
+    stream = NodeStream(sim)
+    stream.delta(1.0)
+    sim.status[7] = CRITICAL
+    frame = stream.delta(2.0)
+    assert frame["rows"] == [[sim.ids[7], "critical", *sim.metrics[:, 7].tolist()]]
+
+
+def test_seq_advances_per_delta_not_per_snapshot(sim):
+    stream = NodeStream(sim)
+    assert stream.snapshot()["seq"] == 0
+    for expected in (1, 2, 3):
+        assert stream.delta(float(expected))["seq"] == expected
+    snapshot = stream.snapshot()
+    assert snapshot["seq"] == 3 and stream.seq == 3
+    assert snapshot["fields"] == SNAPSHOT_FIELDS and len(snapshot["rows"]) == 20
+    node = sim.node_dicts()[0]
+    assert snapshot["rows"][0] == [node["id"], node["name"], node["ip"], node["status"], *node["metrics"].values(), node["last_update"]]
+
+
+def test_a_resized_fleet_starts_over_with_every_node(sim):
+    stream = NodeStream(sim)
+    stream.delta(1.0)
+    sim.node_count = 30
+    sim.init_nodes()
+    frame = stream.delta(2.0)
+    assert len(frame["rows"]) == 30 and frame["seq"] == 2
+
+
+def test_ticks_send_only_what_moved():
+    sim = NodeSimulator(500, seed=9, clock=lambda: 0.0)
+    sim.init_nodes()
+    stream = NodeStream(sim, rel_tolerance=10.0, abs_tolerance=1000.0)
+    stream.delta(0.0)
+    sim.tick(2.0)
+    # only random status flips can get through such wide tolerances
+    frame = stream.delta(2.0)
+    assert 0 < len(frame["rows"]) < 50
+    assert all(row[1] in ("healthy", "warning") for row in frame["rows"])
+
+
+def test_narrow_keeps_only_the_subscribed_rows(sim):
+    frame = NodeStream(sim).delta(1.0)
+    wanted = frozenset({"node-2", "node-9", "node-99"})
+    narrowed = narrow(frame, wanted)
+    assert _ids(narrowed) == ["node-2", "node-9"]
+    assert narrowed["seq"] == frame["seq"] and len(frame["rows"]) == 20
+    assert len(METRIC_FIELDS) + 2 == len(narrowed["fields"])
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from sketches import QuantileSketch
+
+
+def _rank_error(values, q, estimate):
+    return abs(np.searchsorted(np.sort(values), estimate, side="right") / len(values) - q)
+
+
+@pytest.mark.parametrize("q", [0.01, 0.25, 0.5, 0.9, 0.99])
+def test_quantiles_within_rank_error(q):
+    values = np.random.default_rng(3).lognormal(8, 2, 200_000)
+    sketch = QuantileSketch(k=200)
+    for chunk in np.array_split(values, 50):
+        sketch.update(chunk)
+    assert sketch.count == len(values)
+    assert _rank_error(values, q, sketch.quantile(q)) < 0.02
+    assert sum(lv.size for lv in sketch.levels) < 2_000
+
+
+def test_extremes_are_exact_and_nans_ignored():
+    sketch = QuantileSketch()
+    sketch.update([5.0, np.nan, -2.0, 40.0])
+    assert (sketch.quantile(0.0), sketch.quantile(1.0), sketch.count) == (-2.0, 40.0, 3)
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_merge_matches_one_pass():
+    values = np.random.default_rng(5).normal(0, 1, 60_000)
+    parts = [QuantileSketch(seed=i) for i in range(6)]
+    for part, chunk in zip(parts, np.array_split(values, 6)):
+        part.update(chunk)
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    assert merged.count == len(values)
+    for q in (0.1, 0.5, 0.95):
+        assert _rank_error(values, q, merged.quantile(q)) < 0.02
+
+
+def test_round_trips_through_dict():
+    sketch = QuantileSketch(k=50)
+    sketch.update(np.arange(10_000, dtype=float))
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert [restored.quantile(q) for q in (0, 0.3, 0.7, 1)] == [sketch.quantile(q) for q in (0, 0.3, 0.7, 1)]
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+
+from reasoning import (
+    BATCH_HEADER,
+    FakeReasoningModel,
+    GeminiReasoningModel,
+    MicroBatcher,
+    ReasoningService,
+    parse_batch_reply,
+)
+
+KEY = ReasoningService.key(["cpu_spike"], "high", None)
+
+
+def test_calls_time_out():
+    async def run():
+        service = ReasoningService(FakeReasoningModel(delay=1.0), timeout_sec=0.05)
+        started = time.monotonic()
+        assert await service.reason(KEY, "why?") is None
+        assert time.monotonic() - started < 0.5
+        assert service.stats["timeouts"] == 1
+        assert service.cached(KEY) is None
+
+    asyncio.run(run())
+
+
+def test_answers_are_cached_per_key():
+    async def run():
+        model = FakeReasoningModel(reply="Port scan from a known host")
+        service = ReasoningService(model)
+        assert await service.reason(KEY, "first") == "Port scan from a known host"
+        assert await service.reason(KEY, "second") == "Port scan from a known host"
+        assert service.cached(KEY) == "Port scan from a known host"
+        assert len(model.calls) == 1 and service.stats["cache_hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_failures_are_not_cached():
+    async def run():
+        model = FakeReasoningModel(fail=True)
+        service = ReasoningService(model)
+        assert await service.reason(KEY, "why?") is None
+        assert await service.reason(KEY, "why?") is None
+        assert len(model.calls) == 2 and service.stats["failures"] == 2
+
+    asyncio.run(run())
+
+
+def test_identical_inflight_requests_share_one_call():
+    async def run():
+        model = FakeReasoningModel(delay=0.05, reply="shared")
+        service = ReasoningService(model)
+        answers = await asyncio.gather(*(service.reason(KEY, "why?") for _ in range(5)))
+        assert answers == ["shared"] * 5
+        assert len(model.calls) == 1 and service.stats["shared"] == 4
+
+    asyncio.run(run())
+
+
+def test_concurrent_keys_are_batched_into_one_prompt():
+    async def run():
+        model = FakeReasoningModel()
+        service = ReasoningService(model, max_batch=4, batch_window_sec=0.02)
+        keys = [ReasoningService.key([f"flag{i}"], "medium", None) for i in range(6)]
+        answers = await asyncio.gather(*(service.reason(k, f"node {i} tripped") for i, k in enumerate(keys)))
+        assert all(a and f"node {i} tripped" in a for i, a in enumerate(answers))
+        # one full batch of 4, then the 2 left over when the window closes
+        assert [c.startswith(BATCH_HEADER) for c in model.calls] == [True, True]
+        assert service.batcher.stats == {"batches": 2, "items": 6, "fallbacks": 0}
+
+    asyncio.run(run())
+
+
+def test_batch_falls_back_to_single_calls_for_missing_items():
+    async def run():
+        model = FakeReasoningModel(batch_reply='Sure! {"1": "only the first"}')
+        batcher = MicroBatcher(model.generate, max_batch=3, window_sec=0.01)
+        answers = await asyncio.gather(*(batcher.submit(f"prompt {i}") for i in range(3)))
+        assert answers[0] == "only the first"
+        assert answers[1:] == ["Likely cause inferred from: prompt 1", "Likely cause inferred from: prompt 2"]
+        assert batcher.stats["fallbacks"] == 2
+        assert model.calls[1:] == ["prompt 1", "prompt 2"]
+
+    asyncio.run(run())
+
+
+def test_malformed_batch_replies_yield_nothing():
+    assert parse_batch_reply("not json", 2) == {}
+    assert parse_batch_reply('{"1": "a", "3": "out of range", "x": "b", "2": ""}', 2) == {1: "a"}
+
+
+class _SlowClient:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.timeouts = []
+        self.threads = set()
+
+    def generate_content(self, prompt, request_options=None):
+        self.timeouts.append(request_options["timeout"])
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.seconds)
+        return type("Reply", (), {"text": f" {prompt} "})()
+
+
+def test_gemini_calls_run_on_a_bounded_pool_with_a_request_timeout():
+    async def run():
+        client = _SlowClient(0.05)
+        model = GeminiReasoningModel(client, max_workers=2, timeout_sec=3.0)
+        service = ReasoningService(model, max_concurrency=8, timeout_sec=0.02)
+        keys = [ReasoningService.key([f"f{i}"], "low", None) for i in range(6)]
+        assert await asyncio.gather(*(service.reason(k, "p") for k in keys)) == [None] * 6
+        assert service.stats["timeouts"] == 6
+        # abandoned calls stayed on the model's two threads
+        assert len(client.threads) <= 2 and all(t.startswith("gemini") for t in client.threads)
+        client.seconds = 0.0
+        assert await model.generate("hello") == "hello"
+        assert set(client.timeouts) == {3.0}
+        service.shutdown()
+
+    asyncio.run(run())
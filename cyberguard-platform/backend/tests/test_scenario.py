@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from scenario import Scenario, ScenarioRunner
+
+INCIDENT = {
+    "name": "small-incident",
+    "seed": 3,
+    "nodes": 200,
+    "duration_sec": 150,
+    "tick_sec": 2,
+    "events": [
+        {"at": 10, "action": "ddos", "nodes": {"count": 5}, "ramp_sec": 30},
+        {"at": 20, "action": "degradation", "nodes": {"range": [20, 24]}, "duration_sec": 80},
+        {"at": 40, "action": "exfiltration", "nodes": ["node-50", "node-51"], "factor": 5},
+        {"at": 100, "action": "quarantine", "nodes": {"event": 0}},
+    ],
+}
+
+
+def _runner(**overrides):
+    from ai_engine import AIEngine
+
+    return ScenarioRunner(Scenario.from_dict({**INCIDENT, **overrides}), engine=AIEngine())
+
+
+@pytest.fixture(scope="module")
+def report():
+    return _runner().run()
+
+
+def test_same_seed_replays_byte_for_byte(report):
+    again = _runner().run()
+    assert again["digest"] == report["digest"]
+    assert (again["ticks"], again["findings"], again["events"]) == (report["ticks"], report["findings"], report["events"])
+    assert report["ticks"] == 75 and report["findings"] > 0
+
+
+def test_playback_speed_does_not_change_the_result(report):
+    played = asyncio.run(_runner().play(speed=0))
+    assert played["digest"] == report["digest"]
+
+
+def test_a_different_seed_changes_the_digest(report):
+    assert _runner(seed=4).run()["digest"] != report["digest"]
+
+
+def test_simulator_only_runs_are_deterministic():
+    scenario = Scenario.from_dict(INCIDENT)
+    assert ScenarioRunner(scenario).run()["digest"] == ScenarioRunner(scenario).run()["digest"]
+
+
+@pytest.mark.parametrize(
+    "data, message",
+    [
+        ({"events": [{"at": 0, "action": "meltdown"}]}, "unknown action 'meltdown'"),
+        ({"events": [{"at": 0, "action": "quarantine", "nodes": {"event": 0}}]}, "earlier event"),
+        ({"events": [{"at": 0, "action": "ddos"}, {"at": 5, "action": "stop", "nodes": {"event": 2}}]}, "earlier event"),
+        ({"tick_sec": 0}, "tick_sec must be positive"),
+        ({"tick_sec": -2}, "tick_sec must be positive"),
+    ],
+)
+def test_invalid_scenarios_are_rejected(data, message):
+    with pytest.raises(ValueError, match=message):
+        Scenario.from_dict(data)
@@ -0,0 +1,82 @@
+import pytest
+from pymongo import UpdateOne
+
+from write_behind import WriteBehind
+
+
+class Collection:
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.batches = []
+        self.docs = {}
+
+    def bulk_write(self, ops, ordered=True):
+        assert ordered is False
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("mongo down")
+        self.batches.append(ops)
+        for op in ops:
+            (key,) = op._filter.values()
+            self.docs[key] = op._doc["$set"]
+
+
+def _node(i, version):
+    return {"id": f"n{i}", "cpu": float(version)}
+
+
+def test_repeated_writes_coalesce_to_the_latest_state():
+    collection = Collection()
+    writer = WriteBehind(lambda: collection)
+    for version in range(5):
+        writer.put_many(_node(i, version) for i in range(3))
+    assert writer.flush()
+    assert collection.batches == [[UpdateOne({"id": f"n{i}"}, {"$set": _node(i, 4)}, upsert=True) for i in range(3)]]
+    stats = writer.stats()
+    assert (stats["queued"], stats["coalesced"], stats["written"], stats["pending"]) == (15, 12, 3, 0)
+
+
+def test_flushes_are_split_into_bulk_batches():
+    collection = Collection()
+    writer = WriteBehind(lambda: collection, max_batch=4)
+    writer.put_many(_node(i, 0) for i in range(10))
+    assert writer.flush()
+    assert [len(ops) for ops in collection.batches] == [4, 4, 2]
+    assert writer.stats()["flush_size"]["last"] == 2
+
+
+def test_failed_batches_are_requeued_behind_newer_state():
+    collection = Collection(fail=1)
+    writer = WriteBehind(lambda: collection)
+    writer.put_many([_node(1, 0), _node(2, 0)])
+    assert not writer.flush()
+    writer.put(_node(1, 1))
+    assert writer.stats()["pending"] == 2
+    assert writer.flush()
+    assert collection.docs == {"n1": _node(1, 1), "n2": _node(2, 0)}
+    assert writer.stats()["errors"] == 1
+
+
+def test_pending_documents_are_dropped_without_a_database():
+    writer = WriteBehind(lambda: None)
+    writer.put(_node(1, 0))
+    assert writer.flush()
+    assert writer.stats()["dropped"] == 1
+
+
+def test_stop_flushes_what_is_pending():
+    collection = Collection()
+    writer = WriteBehind(lambda: collection, interval_sec=60.0)
+    writer.start()
+    writer.put_many(_node(i, 0) for i in range(3))
+    writer.stop(timeout=5.0)
+    assert len(collection.docs) == 3 and not writer.stats()["running"]
+
+
+@pytest.mark.parametrize("key", ["id", "node_id"])
+def test_documents_are_keyed_by_the_configured_field(key):
+    collection = Collection()
+    writer = WriteBehind(lambda: collection, key=key)
+    writer.put({key: "x", "cpu": 1.0})
+    assert writer.flush()
+    assert collection.batches[0][0]._filter == {key: "x"}
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from ws_encoding import ENCODERS, encode_json, encode_packed
+from ws_fanout import FanoutHub
+
+FRAME = {
+    "type": "nodes_delta",
+    "seq": 7,
+    "fields": ["id", "status", "cpu", "memory", "network_in", "network_out", "latency_ms"],
+    "rows": [["n1", "healthy", 12.5, 40.25, 100.0, 80.75, 3.5], ["n2", "degraded", 97.0, 88.1, 0.0, 1.0, 250.0]],
+}
+
+
+def _unpack(payload):
+    (size,) = struct.unpack_from("<I", payload)
+    header = json.loads(payload[4:4 + size])
+    start = 4 + size + (-(4 + size) % 4)
+    values = np.frombuffer(payload[start:], dtype="<f4").reshape(header["count"], len(header["packed"]))
+    return header, values
+
+
+@pytest.mark.parametrize("encoding", sorted(ENCODERS))
+def test_plain_strings_stay_text(encoding):
+    assert ENCODERS[encoding]("pong") == "pong"
+
+
+def test_json_round_trip():
+    assert json.loads(encode_json(FRAME)) == FRAME
+
+
+def test_packed_round_trip():
+    header, values = _unpack(encode_packed(FRAME))
+    assert header["count"] == 2 and header["seq"] == 7
+    assert header["columns"] == {"id": ["n1", "n2"], "status": ["healthy", "degraded"]}
+    rows = [
+        [header["columns"]["id"][i], header["columns"]["status"][i], *np.round(values[i].astype(float), 2).tolist()]
+        for i in range(header["count"])
+    ]
+    assert header["packed"] == FRAME["fields"][2:]
+    assert rows == FRAME["rows"]
+    assert encode_packed({"type": "security_event"}) == encode_json({"type": "security_event"})
+
+
+def test_empty_packed_frame():
+    header, values = _unpack(encode_packed({**FRAME, "rows": []}))
+    assert header["count"] == 0 and values.size == 0
+
+
+@pytest.mark.skipif("msgpack" not in ENCODERS, reason="msgpack is not installed")
+def test_msgpack_round_trip():
+    import msgpack
+
+    assert msgpack.unpackb(ENCODERS["msgpack"](FRAME)) == FRAME
+
+
+class Socket:
+    def __init__(self):
+        self.text, self.binary, self.client = [], [], None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.text.append(text)
+
+    async def send_bytes(self, data):
+        self.binary.append(data)
+
+
+def test_hub_sends_each_client_its_encoding():
+    async def run():
+        hub = FanoutHub()
+        sockets = {name: Socket() for name in ENCODERS}
+        for name, ws in sockets.items():
+            await hub.connect(ws, encoding=name)
+        hub.publish(FRAME)
+        for ws in sockets.values():
+            hub.send(ws, "pong")
+        await asyncio.sleep(0.01)
+        assert json.loads(sockets["json"].text[0]) == FRAME
+        assert _unpack(sockets["packed"].binary[0])[0]["count"] == 2
+        assert all(ws.text[-1] == "pong" for ws in sockets.values())
+        with pytest.raises(ValueError):
+            await hub.connect(Socket(), encoding="xml")
+
+    asyncio.run(run())
@@ -0,0 +1,304 @@
+import asyncio
+import json
+
+import pytest
+
+from ws_fanout import FanoutHub
+
+
+class GatedSocket:
+    """A client socket whose sends wait until the test opens the gate."""
+
+    def __init__(self, open_gate=True):
+        self.gate = asyncio.Event()
+        if open_gate:
+            self.gate.set()
+        self.got = []
+        self.closed = None
+        self.client = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await self.gate.wait()
+        self.got.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def _run(policy, body, **kwargs):
+    async def run():
+        hub = FanoutHub(max_queue=4, policy=policy, **kwargs)
+        await body(hub)
+
+    asyncio.run(run())
+
+
+def test_drop_oldest_keeps_the_newest_frames():
+    async def body(hub):
+        slow, fast = GatedSocket(open_gate=False), GatedSocket()
+        await hub.connect(slow)
+        await hub.connect(fast)
+        await _settle()
+        for i in range(10):
+            hub.publish({"i": i})
+            await _settle()
+        assert [m["i"] for m in fast.got] == list(range(10))
+        slow.gate.set()
+        await _settle()
+        # frame 0 was already on the wire when the queue filled behind it
+        assert [m["i"] for m in slow.got] == [0, 6, 7, 8, 9]
+        assert hub.clients[slow].dropped == 5
+
+    _run("drop_oldest", body)
+
+
+def test_coalesce_replaces_queued_state_in_place():
+    async def body(hub):
+        slow = GatedSocket(open_gate=False)
+        await hub.connect(slow)
+        hub.publish({"n": "first"})
+        await _settle()
+        for i in range(20):
+            hub.publish({"n": "a", "i": i}, key="a")
+            hub.publish({"n": "b", "i": i}, key="b")
+        hub.publish({"n": "event"})
+        slow.gate.set()
+        await _settle()
+        assert slow.got == [{"n": "first"}, {"n": "a", "i": 19}, {"n": "b", "i": 19}, {"n": "event"}]
+        assert hub.clients[slow].coalesced == 38 and hub.clients[slow].dropped == 0
+
+    _run("coalesce", body)
+
+
+def test_disconnect_policy_closes_a_full_client():
+    async def body(hub):
+        slow, fast = GatedSocket(open_gate=False), GatedSocket()
+        await hub.connect(slow)
+        await hub.connect(fast)
+        await _settle()
+        for i in range(6):
+            hub.publish({"i": i})
+            await _settle()
+        assert slow not in hub.clients and fast in hub.clients
+        assert slow.closed == 1013 and hub.disconnects == 1
+        assert len(fast.got) == 6
+
+    _run("disconnect", body)
+
+
+def test_stalled_clients_are_disconnected_under_any_policy():
+    async def body(hub):
+        slow = GatedSocket(open_gate=False)
+        await hub.connect(slow)
+        hub.publish({"i": 0})
+        hub.publish({"i": 1})
+        await asyncio.sleep(0.06)
+        hub.publish({"i": 2})
+        await _settle()
+        assert slow not in hub.clients and slow.closed == 1013
+
+    _run("coalesce", body, send_timeout_sec=0.05)
+
+
+def test_a_client_behind_on_a_sequenced_stream_gets_one_resync():
+    async def body(hub):
+        slow = GatedSocket(open_gate=False)
+        await hub.connect(slow)
+        snapshots = []
+
+        def snapshot():
+            snapshots.append(1)
+            return {"snapshot": len(snapshots)}
+
+        hub.publish({"delta": 0}, key="nodes", resync=snapshot)
+        await _settle()
+        hub.publish({"delta": 1}, key="nodes", resync=snapshot)
+        hub.publish({"delta": 2}, key="nodes", resync=snapshot)
+        slow.gate.set()
+        await _settle()
+        assert slow.got == [{"delta": 0}, {"snapshot": 1}]
+        assert hub.clients[slow].resyncs == 1
+
+    _run("coalesce", body)
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        FanoutHub(policy="block")
+
+
+# ------- subscriptions -------
+
+from ws_fanout import Subscription  # noqa: E402
+
+
+def _sub(**fields):
+    return Subscription.from_dict(fields, known_topics=("nodes", "security_event", "ai_decision"))
+
+
+def _rows(frame, nodes):
+    return {**frame, "rows": [row for row in frame["rows"] if row[0] in nodes]}
+
+
+FLEET = {"type": "delta", "seq": 1, "rows": [["node-1", 1.0], ["node-2", 2.0], ["node-3", 3.0]]}
+
+
+def test_frames_reach_only_matching_subscribers():
+    async def body(hub):
+        sockets = {name: GatedSocket() for name in ("nodes", "high_events", "node1", "everything")}
+        for ws in sockets.values():
+            await hub.connect(ws)
+        hub.subscribe(sockets["nodes"], _sub(topics=["nodes"]))
+        hub.subscribe(sockets["high_events"], _sub(topics=["security_event"], min_severity="high"))
+        hub.subscribe(sockets["node1"], _sub(nodes=["node-1"]))
+
+        hub.publish({"n": 1}, topic="security_event", node_id="node-2", severity="medium")
+        hub.publish({"n": 2}, topic="security_event", node_id="node-1", severity="critical")
+        hub.publish(FLEET, topic="nodes", narrow=_rows)
+        hub.publish({"n": 3})  # no topic: everyone
+        await _settle()
+
+        got = {name: ws.got for name, ws in sockets.items()}
+        assert got["everything"] == [{"n": 1}, {"n": 2}, FLEET, {"n": 3}]
+        assert got["high_events"] == [{"n": 2}, {"n": 3}]
+        assert got["nodes"] == [FLEET, {"n": 3}]
+        assert got["node1"] == [{"n": 2}, {**FLEET, "rows": [["node-1", 1.0]]}, {"n": 3}]
+
+    _run("coalesce", body)
+
+
+def test_each_node_set_is_narrowed_and_encoded_once():
+    async def body(hub):
+        sockets = [GatedSocket() for _ in range(6)]
+        for ws in sockets:
+            await hub.connect(ws)
+        for ws in sockets[:3]:
+            hub.subscribe(ws, _sub(nodes=["node-1", "node-3"]))
+        hub.subscribe(sockets[3], _sub(nodes=["node-2"]))
+        narrowed, encoded = [], []
+
+        def narrow(frame, nodes):
+            narrowed.append(nodes)
+            return _rows(frame, nodes)
+
+        for client in hub.clients.values():
+            encode = client.encode
+            client.encode = lambda message, encode=encode: encoded.append(message) or encode(message)
+
+        hub.publish(FLEET, topic="nodes", narrow=narrow)
+        await _settle()
+        assert sorted(map(sorted, narrowed)) == [["node-1", "node-3"], ["node-2"]]
+        # two narrowed views plus the full frame for the unfiltered clients
+        assert len(encoded) == 3
+        assert [m["rows"] for m in sockets[0].got] == [[["node-1", 1.0], ["node-3", 3.0]]]
+        assert [m["rows"] for m in sockets[3].got] == [[["node-2", 2.0]]]
+        assert sockets[5].got == [FLEET]
+
+    _run("coalesce", body)
+
+
+def test_index_is_emptied_on_unsubscribe_and_disconnect():
+    async def body(hub):
+        a, b = GatedSocket(), GatedSocket()
+        await hub.connect(a)
+        await hub.connect(b)
+        hub.subscribe(a, _sub(topics=["nodes", "ai_decision"], nodes=["node-1"]))
+        hub.subscribe(b, _sub(topics=["nodes"], nodes=["node-1", "node-2"]))
+        assert set(hub._by_topic) == {"nodes", "ai_decision"} and set(hub._by_node) == {"node-1", "node-2"}
+        assert not hub._any_topic and not hub._any_node
+
+        hub.subscribe(a, Subscription())
+        assert set(hub._by_topic) == {"nodes"} and hub._any_topic == {hub.clients[a]}
+        hub.disconnect(b)
+        assert hub._by_topic == {} and hub._by_node == {}
+        hub.disconnect(a)
+        assert not hub._any_topic and not hub._any_node
+        assert hub.stats()["topic_subscribers"] == {}
+
+    _run("coalesce", body)
+
+
+@pytest.mark.parametrize(
+    "fields, message",
+    [
+        ({"min_severity": ["high"]}, "min_severity"),
+        ({"min_severity": "severe"}, "min_severity"),
+        ({"topics": "nodes"}, "must be a list"),
+        ({"topics": ["nodes", "gossip"]}, "unknown topics: gossip"),
+    ],
+)
+def test_invalid_subscriptions_are_value_errors(fields, message):
+    with pytest.raises(ValueError, match=message):
+        _sub(**fields)
+
+
+def test_subscription_round_trips():
+    sub = _sub(topics=["security_event"], nodes=["node-2", "node-1"], min_severity="medium")
+    assert sub.to_dict() == {"topics": ["security_event"], "nodes": ["node-1", "node-2"], "min_severity": "medium"}
+    assert sub.wants("security_event") and not sub.wants("nodes") and sub.min_rank == 1
+    assert Subscription().to_dict() == {"topics": None, "nodes": None, "min_severity": None}
+
+
+# ------- the /ws endpoint -------
+
+
+@pytest.fixture
+def ws_client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    main.simulator.init_nodes()
+    return TestClient(main.app)
+
+
+def test_message_routing_helpers():
+    import main
+
+    assert main.message_topic({"type": "delta"}) == "nodes"
+    assert main.message_topic({"type": "ai_decision_update"}) == "ai_decision"
+    assert main.message_topic({"type": "security_event"}) == "security_event"
+    assert main.message_topic({}) is None
+    assert main.coalesce_key({"type": "node_update", "data": {"id": "node-4"}}) == "node_update:node-4"
+    assert main.coalesce_key({"type": "security_event", "data": {"id": "e1"}}) is None
+    update = {"type": "metrics_update", "data": [{"id": "node-1"}, {"id": "node-2"}]}
+    assert main.narrow_to_nodes(update, {"node-2"})["data"] == [{"id": "node-2"}]
+    assert main.narrow_to_nodes(FLEET, {"node-3"})["rows"] == [["node-3", 3.0]]
+    assert main.narrow_to_nodes({"type": "ai_decision", "data": {"node_id": "x"}}, {"node-1"})["data"] == {"node_id": "x"}
+
+
+def test_subscribe_command_acks_and_sends_a_narrowed_snapshot(ws_client):
+    with ws_client.websocket_connect("/ws") as ws:
+        assert ws.receive_json()["type"] == "snapshot"
+        ws.send_text(json.dumps({"op": "subscribe", "topics": ["nodes"], "nodes": ["node-2"]}))
+        ack = ws.receive_json()
+        assert ack["type"] == "subscribed" and ack["subscription"]["nodes"] == ["node-2"]
+        snapshot = ws.receive_json()
+        assert snapshot["type"] == "snapshot" and [row[0] for row in snapshot["rows"]] == ["node-2"]
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        {"op": "subscribe", "min_severity": ["high"]},
+        {"op": "subscribe", "min_severity": {"level": 1}},
+        {"op": "subscribe", "topics": ["gossip"]},
+        {"op": "launch"},
+    ],
+)
+def test_invalid_commands_get_an_error_and_keep_the_connection(ws_client, command):
+    with ws_client.websocket_connect("/ws") as ws:
+        ws.receive_json()
+        ws.send_text(json.dumps(command))
+        error = ws.receive_json()
+        assert error["type"] == "error" and error["message"]
+        ws.send_text("ping")
+        assert ws.receive_text() == "pong"
@@ -0,0 +1,72 @@
+"""
+Keyword index over the threat patterns loaded from the dataset.
+
+Detector flags map to attack-type keywords ('net_anomaly' -> 'ddos', 'scan',
+...). At load time every attack type is matched against every keyword once,
+giving an inverted index keyword -> attack types and a weight per (flag,
+attack type). With only a handful of flags, the best attack type for every
+flag combination is precomputed too, so a lookup is one dict access however
+many patterns the dataset yields.
+"""
+from itertools import combinations
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set
+
+
+FLAG_KEYWORDS: Dict[str, List[str]] = {
+    'cpu_spike': ['ddos', 'dos', 'stress', 'overload'],
+    'memory_leak': ['memory', 'leak', 'exhaustion', 'buffer'],
+    'net_anomaly': ['ddos', 'exfiltration', 'scan', 'probe', 'flood'],
+    'behavioral_anomaly': ['malware', 'trojan', 'anomaly'],
+}
+
+
+class ThreatPatternIndex:
+    def __init__(
+        self,
+        patterns: Iterable[Mapping[str, Any]],
+        signatures: Optional[Mapping[str, Any]] = None,
+        flag_keywords: Mapping[str, List[str]] = FLAG_KEYWORDS,
+    ) -> None:
+        self.flags = sorted(flag_keywords)
+        # attack type (lower-cased) -> pattern occurrences and dataset prevalence
+        occurrences: Dict[str, int] = {}
+        prevalence: Dict[str, int] = {}
+        for pattern in patterns:
+            attack_type = str(pattern.get('attack_type', '')).lower()
+            occurrences[attack_type] = occurrences.get(attack_type, 0) + 1
+            prevalence[attack_type] = prevalence.get(attack_type, 0) + int(pattern.get('count', 0) or 0)
+        for attack_type in (signatures or {}):
+            attack_type = str(attack_type).lower()
+            occurrences.setdefault(attack_type, 1)
+            prevalence.setdefault(attack_type, 0)
+
+        self.keywords: Dict[str, Set[str]] = {}
+        for keywords in flag_keywords.values():
+            for kw in keywords:
+                self.keywords.setdefault(kw, {t for t in occurrences if kw in t})
+
+        # flag -> {attack type: number of patterns of that type the flag matches}
+        self.weights: Dict[str, Dict[str, int]] = {}
+        for flag, keywords in flag_keywords.items():
+            matched = set().union(*(self.keywords[kw] for kw in keywords)) if keywords else set()
+            self.weights[flag] = {t: occurrences[t] for t in matched}
+
+        # Best attack type per flag combination; ties go to the more prevalent type
+        self._best: Dict[frozenset, Optional[str]] = {}
+        for size in range(1, len(self.flags) + 1):
+            for combo in combinations(self.flags, size):
+                totals: Dict[str, int] = {}
+                for flag in combo:
+                    for attack_type, weight in self.weights[flag].items():
+                        totals[attack_type] = totals.get(attack_type, 0) + weight
+                self._best[frozenset(combo)] = (
+                    max(totals, key=lambda t: (totals[t], prevalence[t], t)) if totals else None
+                )
+
+    def __len__(self) -> int:
+        return len(self._best)
+
+    def match(self, flags: Iterable[str]) -> Optional[str]:
+        """Most likely attack type for a set of detector flags (unknown flags are ignored)."""
+        key = frozenset(f for f in flags if f in self.weights)
+        return self._best.get(key) if key else None
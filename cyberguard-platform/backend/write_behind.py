@@ -0,0 +1,179 @@
+"""
+Write-behind persistence of node state to MongoDB.
+
+The event loop hands documents to `put_many`, which costs one dict insert
+per document under a lock. A worker thread flushes them as unordered
+`bulk_write` batches of upserts. While a document waits, a newer one for
+the same key replaces it, so a slow database means fewer, larger writes
+rather than a blocked loop, and the collection still ends up with every
+node's latest state. A failed batch is queued again (behind any newer
+state for the same key) and retried with a capped backoff.
+
+`stats()` reports flush sizes and write lag (first queued to written).
+
+backend/app/db/write_behind.py (`NodeWriteBehind`) is a copy of this design
+for the other app. The two apps build from separate Docker contexts with
+different import roots, so they cannot share the module; changes to the
+flush, coalescing or requeue logic belong in both.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from sketches import QuantileSketch
+
+try:
+    from pymongo import UpdateOne
+except ImportError:  # pragma: no cover
+    UpdateOne = None  # type: ignore
+
+
+logger = logging.getLogger("cyberguard")
+
+MAX_BACKOFF_SEC = 30.0
+
+
+class WriteBehind:
+    def __init__(
+        self,
+        collection: Callable[[], Optional[Any]],
+        key: str = "id",
+        interval_sec: float = 1.0,
+        max_batch: int = 1000,
+    ) -> None:
+        # Called on every flush: the database may come and go
+        self._collection = collection
+        self.key = key
+        self.interval_sec = interval_sec
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        # key -> (latest document, monotonic time its key was first queued)
+        self._pending: Dict[Any, Tuple[Dict[str, Any], float]] = {}
+        self.queued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_size = 0
+        self.last_flush_at: Optional[float] = None
+        self.flush_sizes = QuantileSketch()
+        self.lag = QuantileSketch()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="mongo-write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush what is pending and stop the worker (blocking)."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def put_many(self, docs: Iterable[Dict[str, Any]]) -> None:
+        now = time.monotonic()
+        key = self.key
+        with self._lock:
+            pending = self._pending
+            for doc in docs:
+                queued = pending.get(doc[key])
+                if queued is None:
+                    pending[doc[key]] = (doc, now)
+                else:
+                    pending[doc[key]] = (doc, queued[1])
+                    self.coalesced += 1
+                self.queued += 1
+            full = len(pending) >= self.max_batch
+        if full:
+            self._wake.set()
+
+    def put(self, doc: Dict[str, Any]) -> None:
+        self.put_many((doc,))
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            self._wake.wait(self.interval_sec + backoff)
+            self._wake.clear()
+            stopping = self._stopping
+            ok = self.flush()
+            backoff = 0.0 if ok else min(MAX_BACKOFF_SEC, max(self.interval_sec, backoff * 2))
+            if stopping:
+                return
+
+    def flush(self) -> bool:
+        """Write everything pending; False if a batch failed (it is queued again)."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return True
+        collection = self._collection()
+        if collection is None or UpdateOne is None:
+            with self._lock:
+                self.dropped += len(batch)
+            return True
+        items = list(batch.items())
+        for start in range(0, len(items), self.max_batch):
+            chunk = items[start:start + self.max_batch]
+            ops = [UpdateOne({self.key: key}, {"$set": doc}, upsert=True) for key, (doc, _) in chunk]
+            try:
+                collection.bulk_write(ops, ordered=False)
+            except Exception as e:
+                logger.debug(f"Mongo bulk write of {len(ops)} docs failed: {e}")
+                self._requeue(items[start:])
+                with self._lock:
+                    self.errors += 1
+                return False
+            done = time.monotonic()
+            with self._lock:
+                self.flushes += 1
+                self.written += len(chunk)
+                self.last_flush_size = len(chunk)
+                self.last_flush_at = time.time()
+                self.flush_sizes.update([len(chunk)])
+                self.lag.update([done - queued_at for _, (_, queued_at) in chunk])
+        return True
+
+    def _requeue(self, items: Iterable[Tuple[Any, Tuple[Dict[str, Any], float]]]) -> None:
+        with self._lock:
+            pending = self._pending
+            for key, (doc, queued_at) in items:
+                newer = pending.get(key)
+                # a newer document wins, but the lag counts from the older one
+                pending[key] = (doc, queued_at) if newer is None else (newer[0], queued_at)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            oldest = min((queued_at for _, queued_at in self._pending.values()), default=None)
+            return {
+                "running": self._thread is not None,
+                "pending": len(self._pending),
+                "oldest_pending_sec": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                "queued": self.queued,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "errors": self.errors,
+                "flush_size": {
+                    "last": self.last_flush_size,
+                    "p50": self.flush_sizes.quantile(0.5),
+                    "max": self.flush_sizes.quantile(1.0),
+                },
+                "lag_sec": {
+                    "p50": self.lag.quantile(0.5),
+                    "p95": self.lag.quantile(0.95),
+                    "max": self.lag.quantile(1.0),
+                },
+                "last_flush_at": self.last_flush_at,
+            }
@@ -0,0 +1,141 @@
+"""
+Wire encodings for WebSocket clients, negotiated per connection with
+`/ws?encoding=...`:
+
+- "json" (default): text frames.
+- "msgpack": the same messages as MessagePack binary frames.
+- "packed": node frames (snapshot/delta rows) as binary frames whose metric
+  columns are one little-endian float32 array; other messages stay JSON
+  text. Decoding needs no library:
+
+      uint32 LE header length | header (UTF-8 JSON) | pad to 4 bytes | float32 LE values
+
+  The header is the frame without `rows`, plus `count` (number of rows),
+  `packed` (metric fields, in value order) and `columns` (every other field
+  as a list). Values are row-major: row i's metrics are values[i*k:(i+1)*k]
+  for k packed fields. Metrics are rounded to 2 decimals upstream, so
+  rounding the float32 values back to 2 decimals restores them.
+
+The fan-out hub encodes each message once per distinct encoding in use.
+permessage-deflate is negotiated by the server (uvicorn's default) on top of
+any of these, per connection.
+
+Benchmark (bytes and encode CPU for one frame of N nodes):
+
+    python ws_encoding.py --nodes 1000
+"""
+import argparse
+import json
+import struct
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Union
+
+import numpy as np
+
+from node_history import METRIC_FIELDS
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # pragma: no cover
+    msgpack = None  # type: ignore
+
+
+Payload = Union[str, bytes]
+
+PACKED_FIELDS = frozenset(METRIC_FIELDS)
+
+
+def encode_json(message: Any) -> str:
+    """One text frame for a message (orjson when available); strings are sent as they are."""
+    if isinstance(message, str):
+        return message
+    if orjson is not None:
+        return orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(message, separators=(",", ":"), default=str)
+
+
+def encode_msgpack(message: Any) -> Payload:
+    if isinstance(message, str):
+        return message
+    return msgpack.packb(message, default=str)
+
+
+def encode_packed(message: Any) -> Payload:
+    """Node frames as header + float32 metric block; anything else as JSON text."""
+    if not (isinstance(message, dict) and "rows" in message and "fields" in message):
+        return message if isinstance(message, str) else encode_json(message)
+    fields: List[str] = message["fields"]
+    rows = message["rows"]
+    packed = [i for i, name in enumerate(fields) if name in PACKED_FIELDS]
+    other = [i for i, name in enumerate(fields) if name not in PACKED_FIELDS]
+    header = {k: v for k, v in message.items() if k != "rows"}
+    header["count"] = len(rows)
+    header["packed"] = [fields[i] for i in packed]
+    columns = list(zip(*rows)) or [()] * len(fields)
+    header["columns"] = {fields[i]: list(columns[i]) for i in other}
+    values = np.array([columns[i] for i in packed], dtype="<f4").T.tobytes()
+    head = encode_json(header).encode()
+    pad = b"\0" * (-(4 + len(head)) % 4)
+    return struct.pack("<I", len(head)) + head + pad + values
+
+
+ENCODERS: Dict[str, Callable[[Any], Payload]] = {"json": encode_json, "packed": encode_packed}
+if msgpack is not None:
+    ENCODERS["msgpack"] = encode_msgpack
+
+
+def _payload_size(payload: Payload) -> int:
+    return len(payload.encode() if isinstance(payload, str) else payload)
+
+
+def _deflated_size(payload: Payload) -> int:
+    # permessage-deflate is raw deflate with the 4-byte sync tail stripped
+    data = payload.encode() if isinstance(payload, str) else payload
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def benchmark(nodes: int = 1000, repeat: int = 50, seed: int = 0) -> Dict[str, Any]:
+    """Bytes on the wire and encode time of a full snapshot and a 10% delta, per encoding."""
+    from node_simulator import NodeSimulator
+    from node_stream import NodeStream
+
+    sim = NodeSimulator(nodes, seed=seed)
+    sim.init_nodes()
+    stream = NodeStream(sim)
+    stream.delta(time.time())
+    snapshot = stream.snapshot()
+    # move a tenth of the fleet past the delta tolerance
+    sim.metrics[:, : max(1, nodes // 10)] *= 1.5
+    delta = stream.delta(time.time())
+
+    report: Dict[str, Any] = {"nodes": nodes, "encodings": {}}
+    for name, encode in ENCODERS.items():
+        entry: Dict[str, Any] = {}
+        for label, frame in (("snapshot", snapshot), ("delta_10pct", delta)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                payload = encode(frame)
+            elapsed = (time.perf_counter() - started) / repeat
+            entry[label] = {
+                "bytes": _payload_size(payload),
+                "deflated_bytes": _deflated_size(payload),
+                "encode_ms": round(elapsed * 1000, 3),
+                "encode_us_per_1k_nodes": round(elapsed * 1e6 * 1000 / max(1, len(frame["rows"])), 1),
+            }
+        report["encodings"][name] = entry
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare WebSocket encodings for node frames")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.nodes, args.repeat), indent=2))
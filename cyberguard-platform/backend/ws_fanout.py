@@ -0,0 +1,414 @@
+"""
+WebSocket fan-out with one bounded send queue per client.
+
+A broadcast serializes the message once per wire encoding in use (see
+ws_encoding) and appends the encoded frame to every client's queue
+without awaiting anything, so its cost is a loop of deque appends however
+slow the clients are. Each client has its own drain task that sends frames
+in order. When a queue is full the hub's slow-consumer policy applies:
+
+- "drop_oldest": discard the oldest queued frame.
+- "coalesce": frames with a coalescing key (e.g. one node's latest state)
+  replace the queued frame with the same key instead of queueing behind
+  it; a full queue still drops its oldest frame.
+- "disconnect": close the connection; the client reconnects and starts
+  from a fresh snapshot.
+
+A client whose oldest queued frame is older than `send_timeout_sec` is
+treated as stalled and disconnected under any policy.
+
+Streams where every frame builds on the previous one (sequenced deltas)
+pass a `resync` callback to `publish`: a client that still has the
+previous frame of that key queued, or lost one to the policy, gets the
+callback's result (a full snapshot, encoded at most once per publish) in
+place of the delta.
+
+Clients subscribe to topics (message types), node ids and a severity floor;
+`publish` looks the message's topic and node up in an index of
+subscriptions, so a frame is only encoded and queued for the connections
+that want it. Messages covering many nodes at once take a `narrow`
+callback that cuts them down to one subscriber's nodes, applied and
+encoded once per distinct node set.
+
+Per-client counters (queued, sent, dropped, coalesced, bytes) and send lag
+(enqueue to send completion) are exposed through `stats()`.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from ws_encoding import ENCODERS, Payload
+
+
+logger = logging.getLogger("cyberguard")
+
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+
+class Subscription(NamedTuple):
+    """What one client wants; None means everything."""
+
+    topics: Optional[FrozenSet[str]] = None
+    nodes: Optional[FrozenSet[str]] = None
+    min_severity: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any], known_topics: Optional[Iterable[str]] = None) -> "Subscription":
+        def names(field: str) -> Optional[FrozenSet[str]]:
+            value = data.get(field)
+            if value is None:
+                return None
+            if isinstance(value, str) or not isinstance(value, list):
+                raise ValueError(f"'{field}' must be a list")
+            return frozenset(str(v) for v in value)
+
+        topics, nodes = names("topics"), names("nodes")
+        if topics is not None and known_topics is not None:
+            unknown = topics - set(known_topics)
+            if unknown:
+                raise ValueError(f"unknown topics: {', '.join(sorted(unknown))}")
+        severity = data.get("min_severity")
+        if severity is not None and (not isinstance(severity, str) or severity not in SEVERITY_RANK):
+            raise ValueError(f"min_severity must be one of {', '.join(SEVERITY_RANK)}")
+        return cls(topics=topics, nodes=nodes, min_severity=severity)
+
+    @property
+    def min_rank(self) -> int:
+        return SEVERITY_RANK[self.min_severity] if self.min_severity else 0
+
+    def wants(self, topic: str) -> bool:
+        return self.topics is None or topic in self.topics
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "topics": sorted(self.topics) if self.topics is not None else None,
+            "nodes": sorted(self.nodes) if self.nodes is not None else None,
+            "min_severity": self.min_severity,
+        }
+
+
+class _Frame:
+    __slots__ = ("key", "payload", "enqueued_at")
+
+    def __init__(self, key: Optional[str], payload: Payload, enqueued_at: float) -> None:
+        self.key = key
+        self.payload = payload
+        self.enqueued_at = enqueued_at
+
+
+class FanoutClient:
+    def __init__(self, ws: WebSocket, max_queue: int, encoding: str = "json") -> None:
+        self.ws = ws
+        self.max_queue = max_queue
+        self.encoding = encoding
+        self.encode = ENCODERS[encoding]
+        self.queue: Deque[_Frame] = deque()
+        # coalescing key -> the queued frame carrying it
+        self.keyed: Dict[str, _Frame] = {}
+        # keys of resync streams that lost a frame to the queue policy
+        self.lost: Set[str] = set()
+        self.subscription = Subscription()
+        self.ready = asyncio.Event()
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.connected_at = time.time()
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.resyncs = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+
+    def pop(self) -> _Frame:
+        frame = self.queue.popleft()
+        if frame.key is not None and self.keyed.get(frame.key) is frame:
+            del self.keyed[frame.key]
+        return frame
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = self.queue[0].enqueued_at if self.queue else None
+        return {
+            "client": f"{self.ws.client.host}:{self.ws.client.port}" if self.ws.client else None,
+            "connected_sec": round(time.time() - self.connected_at, 1),
+            "encoding": self.encoding,
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "resyncs": self.resyncs,
+            "subscription": self.subscription.to_dict(),
+            "lag_sec": {
+                "last": round(self.last_lag, 4),
+                "avg": round(self.avg_lag, 4),
+                "max": round(self.max_lag, 4),
+                # age of the oldest frame still waiting
+                "pending": round(time.monotonic() - oldest, 4) if oldest is not None else 0.0,
+            },
+        }
+
+
+class FanoutHub:
+    def __init__(self, max_queue: int = 256, policy: str = "coalesce", send_timeout_sec: float = 10.0) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.send_timeout_sec = send_timeout_sec
+        self.clients: Dict[WebSocket, FanoutClient] = {}
+        self.broadcasts = 0
+        self.disconnects = 0
+        self._closing: Set["asyncio.Task[None]"] = set()
+        # Subscription index: topic / node id -> clients that named it, plus
+        # the clients that take every topic / every node
+        self._by_topic: Dict[str, Set[FanoutClient]] = {}
+        self._by_node: Dict[str, Set[FanoutClient]] = {}
+        self._any_topic: Set[FanoutClient] = set()
+        self._any_node: Set[FanoutClient] = set()
+
+    @property
+    def active(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, ws: WebSocket, encoding: str = "json") -> FanoutClient:
+        if encoding not in ENCODERS:
+            raise ValueError(f"encoding must be one of {', '.join(ENCODERS)}")
+        await ws.accept()
+        client = FanoutClient(ws, self.max_queue, encoding)
+        self.clients[ws] = client
+        self._index(client, add=True)
+        client.task = asyncio.create_task(self._drain(client))
+        return client
+
+    def disconnect(self, ws: WebSocket) -> None:
+        client = self.clients.pop(ws, None)
+        if client is not None:
+            self._index(client, add=False)
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def subscribe(self, ws: WebSocket, subscription: Subscription) -> None:
+        """Replace a client's subscription (the default takes everything)."""
+        client = self.clients.get(ws)
+        if client is None:
+            return
+        self._index(client, add=False)
+        client.subscription = subscription
+        self._index(client, add=True)
+
+    def _index(self, client: FanoutClient, add: bool) -> None:
+        sub = client.subscription
+        for names, index, wildcard in ((sub.topics, self._by_topic, self._any_topic), (sub.nodes, self._by_node, self._any_node)):
+            if names is None:
+                if add:
+                    wildcard.add(client)
+                else:
+                    wildcard.discard(client)
+                continue
+            for name in names:
+                if add:
+                    index.setdefault(name, set()).add(client)
+                else:
+                    members = index.get(name)
+                    if members is not None:
+                        members.discard(client)
+                        if not members:
+                            del index[name]
+
+    def _route(self, topic: Optional[str], node_id: Optional[str], severity: Optional[str]) -> Set[FanoutClient]:
+        """Clients subscribed to a message's topic, node and severity."""
+        if topic is None:
+            clients = set(self.clients.values())
+        else:
+            clients = self._any_topic.union(self._by_topic.get(topic, ()))
+        if node_id is not None:
+            clients &= self._any_node.union(self._by_node.get(node_id, ()))
+        if severity is not None:
+            rank = SEVERITY_RANK.get(severity, 0)
+            clients = {c for c in clients if c.subscription.min_rank <= rank}
+        return clients
+
+    def _enqueue(
+        self,
+        client: FanoutClient,
+        payload: Payload,
+        key: Optional[str],
+        now: float,
+        resync: Optional[Callable[[], Payload]] = None,
+    ) -> None:
+        if key is not None and resync is not None:
+            queued = client.keyed.get(key)
+            if queued is not None or key in client.lost:
+                # Behind on a sequenced stream: a snapshot replaces the deltas it missed
+                client.lost.discard(key)
+                client.resyncs += 1
+                payload = resync()
+                if queued is not None:
+                    queued.payload = payload
+                    return
+        elif key is not None and self.policy == "coalesce":
+            queued = client.keyed.get(key)
+            if queued is not None:
+                # Newer state supersedes the queued one; keep its place and age
+                queued.payload = payload
+                client.coalesced += 1
+                return
+        # A client whose oldest frame has waited past the send timeout is stalled, whatever the policy
+        stalled = bool(client.queue) and now - client.queue[0].enqueued_at > self.send_timeout_sec
+        if stalled or (len(client.queue) >= client.max_queue and self.policy == "disconnect"):
+            logger.info(f"Disconnecting slow WebSocket client ({len(client.queue)} frames behind)")
+            self.disconnect(client.ws)
+            self.disconnects += 1
+            task = asyncio.create_task(_close(client.ws))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            return
+        if len(client.queue) >= client.max_queue:
+            dropped = client.pop()
+            client.dropped += 1
+            if dropped.key is not None:
+                client.lost.add(dropped.key)
+        frame = _Frame(key, payload, now)
+        client.queue.append(frame)
+        if key is not None:
+            client.keyed[key] = frame
+        client.ready.set()
+
+    def publish(
+        self,
+        message: Any,
+        key: Optional[str] = None,
+        resync: Optional[Callable[[], Any]] = None,
+        topic: Optional[str] = None,
+        node_id: Optional[str] = None,
+        severity: Optional[str] = None,
+        narrow: Optional[Callable[[Any, FrozenSet[str]], Any]] = None,
+    ) -> None:
+        """
+        Encode once and queue for every subscribed client; never waits on a
+        socket. A message without a topic goes to everyone. `narrow` cuts a
+        fleet-wide message (and its resync) down to a client's node set.
+        """
+        if not self.clients:
+            return
+        clients = self._route(topic, node_id, severity)
+        if not clients:
+            return
+        now = time.monotonic()
+        self.broadcasts += 1
+        resync_message: List[Any] = []
+
+        def full_resync() -> Any:
+            if not resync_message:
+                resync_message.append(resync())
+            return resync_message[0]
+
+        # Message (and its resync) per node set, None = unnarrowed; each is
+        # encoded once per encoding, the resync only when a client needs it
+        narrowed: Dict[Optional[FrozenSet[str]], Tuple[Any, Optional[Callable[[], Any]]]] = {}
+        variants: Dict[Tuple[Optional[FrozenSet[str]], str], Tuple[Payload, Optional[Callable[[], Payload]]]] = {}
+        for client in clients:
+            nodes = client.subscription.nodes if narrow is not None and node_id is None else None
+            variant = variants.get((nodes, client.encoding))
+            if variant is None:
+                view = narrowed.get(nodes)
+                if view is None:
+                    view = narrowed[nodes] = _narrowed(message, nodes, narrow, full_resync if resync is not None else None)
+                variant = variants[nodes, client.encoding] = (client.encode(view[0]), _lazy(client.encode, view[1]))
+            self._enqueue(client, variant[0], key, now, variant[1])
+
+    def send(
+        self,
+        ws: WebSocket,
+        message: Any,
+        key: Optional[str] = None,
+        narrow: Optional[Callable[[Any, FrozenSet[str]], Any]] = None,
+    ) -> None:
+        """Queue a message for one client, in order with its broadcasts."""
+        client = self.clients.get(ws)
+        if client is None:
+            return
+        nodes = client.subscription.nodes
+        if narrow is not None and nodes is not None:
+            message = narrow(message, nodes)
+        self._enqueue(client, client.encode(message), key, time.monotonic())
+
+    async def _drain(self, client: FanoutClient) -> None:
+        ws = client.ws
+        try:
+            while True:
+                if not client.queue:
+                    client.ready.clear()
+                    await client.ready.wait()
+                    continue
+                frame = client.pop()
+                if isinstance(frame.payload, str):
+                    await ws.send_text(frame.payload)
+                else:
+                    await ws.send_bytes(frame.payload)
+                lag = time.monotonic() - frame.enqueued_at
+                client.sent += 1
+                client.bytes_sent += len(frame.payload)
+                client.last_lag = lag
+                client.max_lag = max(client.max_lag, lag)
+                client.avg_lag += 0.1 * (lag - client.avg_lag)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.debug(f"WebSocket send failed, dropping client: {e}")
+        finally:
+            self.disconnect(ws)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "connections": len(self.clients),
+            "broadcasts": self.broadcasts,
+            "encodings": {name: sum(c.encoding == name for c in self.clients.values()) for name in ENCODERS},
+            "topic_subscribers": {topic: len(clients) for topic, clients in sorted(self._by_topic.items())},
+            "all_topic_subscribers": len(self._any_topic),
+            "slow_disconnects": self.disconnects,
+            "clients": [c.stats() for c in self.clients.values()],
+        }
+
+
+def _narrowed(
+    message: Any,
+    nodes: Optional[FrozenSet[str]],
+    narrow: Optional[Callable[[Any, FrozenSet[str]], Any]],
+    resync: Optional[Callable[[], Any]],
+) -> Tuple[Any, Optional[Callable[[], Any]]]:
+    if nodes is None or narrow is None:
+        return message, resync
+    narrowed_resync = _lazy(lambda msg: narrow(msg, nodes), resync)
+    return narrow(message, nodes), narrowed_resync
+
+
+def _lazy(transform: Callable[[Any], Any], source: Optional[Callable[[], Any]]) -> Optional[Callable[[], Any]]:
+    """transform(source()), computed on first call and then cached."""
+    if source is None:
+        return None
+    cache: List[Any] = []
+
+    def get() -> Any:
+        if not cache:
+            cache.append(transform(source()))
+        return cache[0]
+
+    return get
+
+
+async def _close(ws: WebSocket) -> None:
+    try:
+        # 1013: try again later
+        await ws.close(code=1013)
+    except Exception:
+        pass
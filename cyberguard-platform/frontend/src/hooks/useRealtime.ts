@@ -1,8 +1,36 @@
 "use client";
 
 import { useCallback, useEffect, useMemo, useRef, useState } from 'react';
-import { BACKEND_HTTP_URL, BACKEND_WS_URL } from '@/lib/config';
-import type { NodeStatus, SecurityEvent, WSMessage } from '@/types';
+import { BACKEND_HTTP_URL, BACKEND_WS_ENCODING, BACKEND_WS_URL } from '@/lib/config';
+import { decodePacked } from '@/lib/packed';
+import type { NodeDelta, NodeMetrics, NodeSnapshot, NodeStatus, SecurityEvent, WSMessage, WSSubscription } from '@/types';
+
+const METRIC_KEYS: Array<keyof NodeMetrics> = ['cpu', 'memory', 'network_in', 'network_out', 'latency_ms'];
+
+/** Merge positional rows (described by `fields`) into the node map. */
+function applyRows(nodes: Map<string, NodeStatus>, msg: NodeSnapshot | NodeDelta): void {
+  const col = (name: string) => msg.fields.indexOf(name);
+  const id = col('id');
+  const name = col('name');
+  const ip = col('ip');
+  const status = col('status');
+  const lastUpdate = col('last_update');
+  const metricCols = METRIC_KEYS.map((k) => [k, col(k)] as const);
+  for (const row of msg.rows) {
+    const nodeId = row[id] as string;
+    const prev = nodes.get(nodeId);
+    const metrics = { ...(prev?.metrics ?? { cpu: 0, memory: 0, network_in: 0, network_out: 0, latency_ms: 0 }) };
+    for (const [key, i] of metricCols) if (i >= 0) metrics[key] = row[i] as number;
+    nodes.set(nodeId, {
+      id: nodeId,
+      name: name >= 0 ? (row[name] as string) : prev?.name ?? nodeId,
+      ip: ip >= 0 ? (row[ip] as string) : prev?.ip,
+      status: (row[status] as NodeStatus['status']) ?? prev?.status ?? 'healthy',
+      metrics,
+      last_update: lastUpdate >= 0 ? (row[lastUpdate] as number) : msg.type === 'delta' ? msg.ts : prev?.last_update ?? 0,
+    });
+  }
+}
 
 interface UseRealtime {
   connected: boolean;
@@ -22,7 +50,8 @@ interface UseRealtime {
   redistribute: (nodeId: string) => Promise<void>;
 }
 
-export function useRealtime(): UseRealtime {
+/** `subscription` limits what the server sends (e.g. one node, or alerts only); default is everything. */
+export function useRealtime(subscription?: WSSubscription): UseRealtime {
   const [connected, setConnected] = useState(false);
   const [nodes, setNodes] = useState<NodeStatus[]>([]);
   const [events, setEvents] = useState<SecurityEvent[]>([]);
@@ -30,18 +59,31 @@ export function useRealtime(): UseRealtime {
   const [redistributed, setRedistributed] = useState<string | null>(null);
   const [busy, setBusy] = useState(false);
   const wsRef = useRef<WebSocket | null>(null);
+  // Fleet state as of sequence number seqRef (null until the first snapshot)
+  const nodesRef = useRef<Map<string, NodeStatus>>(new Map());
+  const seqRef = useRef<number | null>(null);
   const reconnectTimer = useRef<NodeJS.Timeout | null>(null);
+  // Compared by value so an inline object literal doesn't reconnect every render
+  const subscriptionKey = subscription ? JSON.stringify(subscription) : null;
 
   const connect = useCallback(() => {
     if (wsRef.current) return;
     try {
-      const ws = new WebSocket(BACKEND_WS_URL);
+      const url = BACKEND_WS_ENCODING === 'json' ? BACKEND_WS_URL : `${BACKEND_WS_URL}?encoding=${BACKEND_WS_ENCODING}`;
+      const ws = new WebSocket(url);
+      ws.binaryType = 'arraybuffer';
       wsRef.current = ws;
 
-      ws.onopen = () => setConnected(true);
+      ws.onopen = () => {
+        setConnected(true);
+        if (subscriptionKey) ws.send(JSON.stringify({ op: 'subscribe', ...JSON.parse(subscriptionKey) }));
+      };
       ws.onclose = () => {
+        // Closed on purpose (unmount or a new subscription): don't retry
+        if (wsRef.current !== ws) return;
         setConnected(false);
         wsRef.current = null;
+        seqRef.current = null;
         // basic retry with backoff cap
         if (!reconnectTimer.current) {
           reconnectTimer.current = setTimeout(() => {
@@ -55,13 +97,34 @@ export function useRealtime(): UseRealtime {
       };
       ws.onmessage = (ev) => {
         try {
-          const msg = JSON.parse(ev.data) as WSMessage;
-          if (msg.type === 'init' || msg.type === 'metrics_update') {
-            setNodes(msg.data);
+          // Binary frames are packed fleet frames; everything else is JSON text
+          const msg = (typeof ev.data === 'string' ? JSON.parse(ev.data) : decodePacked(ev.data)) as WSMessage;
+          if (msg.type === 'snapshot') {
+            nodesRef.current = new Map();
+            applyRows(nodesRef.current, msg);
+            seqRef.current = msg.seq;
+            setNodes(Array.from(nodesRef.current.values()));
+          } else if (msg.type === 'delta') {
+            if (seqRef.current === null || msg.seq <= seqRef.current) return; // stale or before the snapshot
+            if (msg.seq !== seqRef.current + 1) {
+              // Missed a delta: ask for a fresh snapshot and ignore deltas until it arrives
+              seqRef.current = null;
+              ws.send('resync');
+              return;
+            }
+            applyRows(nodesRef.current, msg);
+            seqRef.current = msg.seq;
+            if (msg.rows.length) setNodes(Array.from(nodesRef.current.values()));
           } else if (msg.type === 'security_event') {
             setEvents((prev) => [msg.data, ...prev].slice(0, 50));
           } else if (msg.type === 'ai_decision') {
             setAiDecisions((prev) => [msg.data, ...prev].slice(0, 50));
+          } else if (msg.type === 'ai_decision_update') {
+            // LLM reasoning arrives after the decision; patch it in place
+            const upd = msg.data;
+            setAiDecisions((prev) =>
+              prev.map((d) => (d.node_id === upd.node_id && d.timestamp === upd.timestamp ? { ...d, ...upd } : d))
+            );
           } else if (msg.type === 'load_redistributed') {
             setRedistributed(msg.data.node_id);
             setTimeout(() => setRedistributed(null), 3000);
@@ -73,7 +136,7 @@ export function useRealtime(): UseRealtime {
     } catch {
       setConnected(false);
     }
-  }, []);
+  }, [subscriptionKey]);
 
   useEffect(() => {
     connect();
@@ -4,3 +4,7 @@ export const BACKEND_HTTP_URL =
 export const BACKEND_WS_URL =
   process.env.NEXT_PUBLIC_BACKEND_WS_URL ?? 'ws://localhost:8010/ws';
 
+
+/** `json` or `packed` (binary fleet frames, see backend/ws_encoding.py). */
+export const BACKEND_WS_ENCODING =
+  process.env.NEXT_PUBLIC_BACKEND_WS_ENCODING ?? 'json';
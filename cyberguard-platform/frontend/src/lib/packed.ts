@@ -0,0 +1,31 @@
+import type { NodeDelta, NodeSnapshot } from '@/types';
+
+/**
+ * Decode a `packed` fleet frame: uint32 LE header length, JSON header,
+ * padding to 4 bytes, then row-major float32 LE metric values.
+ */
+export function decodePacked(buf: ArrayBuffer): NodeSnapshot | NodeDelta {
+  const view = new DataView(buf);
+  const headerLen = view.getUint32(0, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 4, headerLen)));
+  const offset = 4 + headerLen + ((4 - ((4 + headerLen) % 4)) % 4);
+  const values = new Float32Array(buf.slice(offset));
+  const packed: string[] = header.packed;
+  const columns: Record<string, Array<string | number>> = header.columns;
+  const k = packed.length;
+  const rows: Array<Array<string | number>> = [];
+  for (let i = 0; i < header.count; i++) {
+    rows.push(
+      header.fields.map((field: string) => {
+        const j = packed.indexOf(field);
+        // metrics are 2-decimal values; rounding undoes the float32 error
+        return j >= 0 ? Math.round(values[i * k + j] * 100) / 100 : columns[field][i];
+      })
+    );
+  }
+  const frame = { ...header, rows };
+  delete frame.count;
+  delete frame.packed;
+  delete frame.columns;
+  return frame;
+}
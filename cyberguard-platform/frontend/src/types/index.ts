@@ -26,17 +26,44 @@ export interface SecurityEvent {
   timestamp: number;
 }
 
+export interface AIDecision {
+  node_id: string;
+  severity: 'low' | 'medium' | 'high' | 'critical';
+  anomalies: string[];
+  actions: string[];
+  reasoning: string;
+  timestamp: number;
+  confidence: number;
+}
+
+/** Whole fleet at `seq`; each row follows `fields` (id, name, ip, status, metrics..., last_update). */
+export interface NodeSnapshot {
+  type: 'snapshot';
+  seq: number;
+  fields: string[];
+  rows: Array<Array<string | number>>;
+}
+
+/** Nodes that changed since `seq - 1`; each row follows `fields` (id, status, metrics...). */
+export interface NodeDelta {
+  type: 'delta';
+  seq: number;
+  ts: number;
+  fields: string[];
+  rows: Array<Array<string | number>>;
+}
+
+/** Sent as `{ op: 'subscribe', ... }` on /ws; omitted fields mean everything. */
+export interface WSSubscription {
+  topics?: Array<'nodes' | 'node_update' | 'metrics_update' | 'security_event' | 'ai_decision' | 'load_redistributed'>;
+  nodes?: string[];
+  min_severity?: 'low' | 'medium' | 'high' | 'critical';
+}
+
 export type WSMessage =
-  | { type: 'init'; data: NodeStatus[] }
-  | { type: 'metrics_update'; data: NodeStatus[] }
+  | NodeSnapshot
+  | NodeDelta
   | { type: 'security_event'; data: SecurityEvent }
-  | { type: 'ai_decision'; data: {
-      node_id: string;
-      severity: 'low' | 'medium' | 'high' | 'critical';
-      anomalies: string[];
-      actions: string[];
-      reasoning: string;
-      timestamp: number;
-      confidence: number;
-    } }
+  | { type: 'ai_decision'; data: AIDecision }
+  | { type: 'ai_decision_update'; data: AIDecision }
   | { type: 'load_redistributed'; data: { node_id: string } };